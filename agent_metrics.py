@@ -0,0 +1,188 @@
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+
+from file_cache import atomic_write_text
+
+
+def _percentile(sorted_values: List[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(percentile / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class RowMetrics:
+    """
+    Measurements for one row of a batch run. The agent nodes find this object
+    in config["configurable"]["metrics"] and record into it as they go.
+    """
+
+    def __init__(self, row_key: Optional[str] = None):
+        self.row_key = row_key
+        self.wall_seconds = 0.0
+        self.node_seconds: Dict[str, float] = {}
+        self.node_calls: Dict[str, int] = {}
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_creation_tokens = 0
+        self.validation_calls = 0
+        self.remote_validation_calls = 0
+        self.validation_seconds = 0.0
+        self.attempts = 0  # generation attempts over all tiers tried (1 for a row valid on its first try)
+        self.cost_usd = 0.0
+        self.tier: Optional[str] = None
+        self.outcome: Optional[str] = None  # "valid", "failed", "skipped", "reused" or "error"
+
+    @contextmanager
+    def time_node(self, node_name: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.node_seconds[node_name] = self.node_seconds.get(node_name, 0.0) + elapsed
+            self.node_calls[node_name] = self.node_calls.get(node_name, 0) + 1
+
+    def record_llm_call(self, usage: Dict[str, int], seconds: float):
+        self.llm_calls += 1
+        self.llm_seconds += seconds
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+        self.cache_read_tokens += usage.get("cache_read_tokens", 0)
+        self.cache_creation_tokens += usage.get("cache_creation_tokens", 0)
+
+    def record_validation(self, seconds: float, remote: bool):
+        self.validation_calls += 1
+        self.remote_validation_calls += int(remote)
+        self.validation_seconds += seconds
+
+    def merge(self, other: "RowMetrics"):
+        """Adds the counters of `other` (e.g. one chunk of a chunked row) to this row; wall time and outcome are left alone."""
+        for node_name, seconds in other.node_seconds.items():
+            self.node_seconds[node_name] = self.node_seconds.get(node_name, 0.0) + seconds
+            self.node_calls[node_name] = self.node_calls.get(node_name, 0) + other.node_calls[node_name]
+        for counter in ("llm_calls", "llm_seconds", "input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens",
+                        "validation_calls", "remote_validation_calls", "validation_seconds", "attempts", "cost_usd"):
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
+        self.tier = other.tier or self.tier
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class RunMetrics:
+    """Aggregates RowMetrics for a batch run. Rows may be added from worker threads."""
+
+    def __init__(self, run_id: Optional[str] = None):
+        self.run_id = run_id
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.rows: List[RowMetrics] = []
+
+    def add_row(self, row_metrics: RowMetrics):
+        with self._lock:
+            self.rows.append(row_metrics)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = list(self.rows)
+
+        outcomes: Dict[str, int] = {}
+        node_seconds: Dict[str, float] = {}
+        node_calls: Dict[str, int] = {}
+        for row in rows:
+            outcomes[row.outcome or "unknown"] = outcomes.get(row.outcome or "unknown", 0) + 1
+            for node_name, seconds in row.node_seconds.items():
+                node_seconds[node_name] = node_seconds.get(node_name, 0.0) + seconds
+                node_calls[node_name] = node_calls.get(node_name, 0) + row.node_calls[node_name]
+
+        wall_times = sorted(row.wall_seconds for row in rows)
+        return {
+            "run_id": self.run_id,
+            "rows": len(rows),
+            "outcomes": outcomes,
+            "elapsed_seconds": time.time() - self.started_at,
+            "row_seconds": {
+                "total": sum(wall_times),
+                "p50": _percentile(wall_times, 50),
+                "p95": _percentile(wall_times, 95),
+                "p99": _percentile(wall_times, 99),
+                "max": wall_times[-1] if wall_times else 0.0,
+            },
+            "node_seconds": node_seconds,
+            "node_calls": node_calls,
+            "llm_calls": sum(row.llm_calls for row in rows),
+            "llm_seconds": sum(row.llm_seconds for row in rows),
+            "input_tokens": sum(row.input_tokens for row in rows),
+            "output_tokens": sum(row.output_tokens for row in rows),
+            "cache_read_tokens": sum(row.cache_read_tokens for row in rows),
+            "cache_creation_tokens": sum(row.cache_creation_tokens for row in rows),
+            "validation_calls": sum(row.validation_calls for row in rows),
+            "remote_validation_calls": sum(row.remote_validation_calls for row in rows),
+            "validation_seconds": sum(row.validation_seconds for row in rows),
+            "attempts": sum(row.attempts for row in rows),
+            "cost_usd": sum(row.cost_usd for row in rows),
+        }
+
+    def to_json(self, include_rows: bool = True) -> str:
+        payload = self.summary()
+        if include_rows:
+            with self._lock:
+                payload["row_details"] = [row.as_dict() for row in self.rows]
+        return json.dumps(payload, indent=2, default=str)
+
+    def to_prometheus(self) -> str:
+        """Renders the run summary in the Prometheus text exposition format."""
+        summary = self.summary()
+        run_label = f'run_id="{summary["run_id"] or ""}"'
+        lines: List[str] = []
+
+        def metric(name: str, metric_type: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = ",".join([run_label] + labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        metric("mermaid_agent_rows_total", "counter", "Rows processed by final outcome.",
+               [([f'outcome="{outcome}"'], count) for outcome, count in summary["outcomes"].items()])
+        metric("mermaid_agent_row_seconds", "summary", "Wall time per row.",
+               [(['quantile="0.5"'], summary["row_seconds"]["p50"]),
+                (['quantile="0.95"'], summary["row_seconds"]["p95"]),
+                (['quantile="0.99"'], summary["row_seconds"]["p99"])])
+        lines.append(f'mermaid_agent_row_seconds_sum{{{run_label}}} {summary["row_seconds"]["total"]}')
+        lines.append(f'mermaid_agent_row_seconds_count{{{run_label}}} {summary["rows"]}')
+        metric("mermaid_agent_node_seconds_total", "counter", "Time spent inside each graph node.",
+               [([f'node="{node}"'], seconds) for node, seconds in summary["node_seconds"].items()])
+        metric("mermaid_agent_node_calls_total", "counter", "Executions of each graph node.",
+               [([f'node="{node}"'], calls) for node, calls in summary["node_calls"].items()])
+        metric("mermaid_agent_llm_calls_total", "counter", "Chat model invocations.",
+               [([], summary["llm_calls"])])
+        metric("mermaid_agent_llm_seconds_total", "counter", "Time spent waiting on the chat model.",
+               [([], summary["llm_seconds"])])
+        metric("mermaid_agent_tokens_total", "counter", "Tokens by kind.",
+               [(['kind="input"'], summary["input_tokens"]),
+                (['kind="output"'], summary["output_tokens"]),
+                (['kind="cache_read"'], summary["cache_read_tokens"]),
+                (['kind="cache_creation"'], summary["cache_creation_tokens"])])
+        metric("mermaid_agent_validation_seconds_total", "counter", "Time spent validating generated graphs.",
+               [([], summary["validation_seconds"])])
+        metric("mermaid_agent_validation_calls_total", "counter", "Validations by the checks that ran.",
+               [(['checks="local_only"'], summary["validation_calls"] - summary["remote_validation_calls"]),
+                (['checks="local_and_remote"'], summary["remote_validation_calls"])])
+        metric("mermaid_agent_attempts_total", "counter", "Generation attempts used across all rows.",
+               [([], summary["attempts"])])
+        metric("mermaid_agent_cost_usd_total", "counter", "Estimated model spend in USD.",
+               [([], summary["cost_usd"])])
+        return "\n".join(lines) + "\n"
+
+    def export(self, json_path: str, prometheus_path: str):
+        # Scrapers may read these while a run writes them.
+        atomic_write_text(json_path, self.to_json())
+        atomic_write_text(prometheus_path, self.to_prometheus())
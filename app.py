@@ -1,38 +1,84 @@
 import streamlit as st
 import pandas as pd
 import os
-import base64
-import requests
-import tempfile
-from notion_client import Client as NotionClient
+import json
+import time
+import hashlib
+import statistics
 from dotenv import load_dotenv, find_dotenv
-from parse_spec_block import process_spec_blocks
-from b2m_agent import build_mermaid_agent, run_agent, run_agent
-from notion_utils import get_all_page_content
-from streamlit_mermaid import st_mermaid
-from langchain.chat_models import init_chat_model
-
-load_dotenv(find_dotenv(), override=True)
+from hedging import HEDGE_PERCENTILE, HEDGE_BUDGET_FRACTION
+from jobs import JobManager, JobConflict, pipeline_job, ACTIVE_STATUSES, JOB_DONE
+from config import MODEL_TIER_SPECS, TABLE_MAPPING, build_model_tiers
+from mermaid_ir import strip_mermaid_fences
+from mermaid_render import mermaid_to_svg_cached, export_zip_of_svgs, export_csv, graph_render_key
+from search_index import get_search_index
+from business_conversion import BusinessConverter, BUSINESS_FUNCTION_IDENTIFIER
+import tracing
+
+RERUN_START_TIME = time.perf_counter()
+# Reruns kept for the latency readout in the sidebar.
+RERUN_HISTORY_SIZE = 50
 
 import warnings
 # Ignore all warnings
 warnings.filterwarnings("ignore")
 
-# Configure logging
 import logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+
+# --- Process-wide resources ---
+# Streamlit re-executes this script on every widget interaction; everything
+# below is created once per server process and reused by all reruns and sessions.
+# The chat models, the Notion client and the generation pipeline are only built
+# (and their packages imported) when the agent is first run, so the first page
+# load stays fast; `python measure_startup.py` checks it against a budget.
+
+@st.cache_resource(show_spinner=False)
+def load_environment() -> str | None:
+    """Loads .env once. Returns the TRACE_FILE path when tracing is enabled."""
+    load_dotenv(find_dotenv(), override=True)
+    # Set TRACE_FILE (e.g. in .env) to write a Chrome trace of every agent run (<stem>_<job_id>.json per job).
+    return tracing.enable_from_env()
+
+@st.cache_resource(show_spinner=False)
+def configure_logging() -> None:
+    """Attaches the app.log and console handlers once, instead of opening a new app.log handle per rerun."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('app.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_model_tiers() -> list:
+    logging.getLogger(__name__).info(f"Initializing chat models: {[spec['name'] for spec in MODEL_TIER_SPECS]}")
+    return build_model_tiers()
+
+@st.cache_resource(show_spinner=False)
+def get_notion_client(token: str):
+    """One Notion client (and its pooled httpx connections) per token."""
+    from notion_client import Client as NotionClient
+    return NotionClient(auth=token)
+
+@st.cache_resource(show_spinner=False)
+def get_business_converter() -> BusinessConverter:
+    """One converter for all sessions, so its request rate and in-flight deduplication are shared."""
+    return BusinessConverter(get_model_tiers()[0]["llm"])
+
+@st.cache_resource(show_spinner=False)
+def get_job_manager(trace_file: str | None) -> JobManager:
+    """Background pipeline runs shared by all sessions, so a refreshed page can reattach to its job."""
+    return JobManager(trace_file=trace_file)
+
+TRACE_FILE = load_environment()
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
 # --- Streamlit App UI ---
-logger.info("Initializing Streamlit UI")
+logger.debug("Initializing Streamlit UI")
 st.set_page_config(layout="wide")
 st.title("📄 Business Flowchart Generator")
 
@@ -43,172 +89,34 @@ if 'download_filename' not in st.session_state:
     st.session_state.download_filename = "data.csv"
 if 'force_recreate' not in st.session_state:
     st.session_state.force_recreate = False
-
-logger.info("Starting application initialization")
-logger.info("Libraries imported successfully")
+if 'run_summary' not in st.session_state:
+    st.session_state.run_summary = None
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+if 'run_metrics' not in st.session_state:
+    st.session_state.run_metrics = None
+if 'graph_changes' not in st.session_state:
+    st.session_state.graph_changes = None
+if 'rerun_seconds' not in st.session_state:
+    st.session_state.rerun_seconds = []
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'collected_job_id' not in st.session_state:
+    st.session_state.collected_job_id = None
+if 'result_page_id' not in st.session_state:
+    st.session_state.result_page_id = None
 
 # --- LLM Setup ---
-MODEL_GEMINI_2_0_FLASH = "gemini-2.0-flash"
-GEMINI_MODEL = "gemini-2.5-flash-preview-05-20"
-ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
-logger.info(f"Initializing chat model with {ANTHROPIC_MODEL}")
-llm = init_chat_model(f"anthropic:{ANTHROPIC_MODEL}")
-EMPTY_FILES = False
-FORCE_RECREATE = False
-
-# Table mapping configuration
-TABLE_MAPPING = {
-    "MV_Resolvers": "1eb7432eb8438080b80bf2483e27b9b9",
-    "Doctors": "1ed7432eb843809f912fdbb4c370998e",
-    "MaidsAT": "1ed7432eb84380409717ffa3cbc506ef"
-}
-
+# Only needed to run the agent; viewing or reattaching to a job never calls Notion.
 NOTION_TOKEN = os.environ.get("NOTION_SECRET")
-if not NOTION_TOKEN:
-    logger.error("NOTION_SECRET environment variable not found")
-    raise ValueError("NOTION_SECRET environment variable is required")
-notion_client = NotionClient(auth=NOTION_TOKEN)
-logger.info("Environment configured successfully")
-
-def fetch_data_spec_content(block_identifier: str, page_id: str, table_id: str, notion: NotionClient) -> pd.DataFrame:
-    global EMPTY_FILES
-
-    logger.info(f"Fetching data spec content for block: {block_identifier}, page: {page_id}, table: {table_id}")
-    block_file_path = f"blocks/{page_id}_all_blocks.txt"
-
-    def load_from_notion():
-        logger.info("Loading blocks from Notion API")
-        all_blocks_data, _ = get_all_page_content(page_id, notion, _spec_block_name=block_identifier)
-        try:
-            with open(block_file_path, "w", encoding="utf-8") as f:
-                f.write(str(all_blocks_data))
-            logger.info(f"Successfully saved blocks to {block_file_path}")
-        except Exception as e:
-            logger.error(f"Error saving blocks to file: {str(e)}")
-            raise
-    
-    if not os.path.exists(block_file_path) or st.session_state.force_recreate:
-        load_from_notion()
-
-    parsed_blocks = process_spec_blocks(block_identifier, page_id, table_id, notion)
-    if isinstance(parsed_blocks, list) and len(parsed_blocks) == 0:
-        EMPTY_FILES = True
-        load_from_notion()
-        parsed_blocks = process_spec_blocks(block_identifier, page_id, table_id, notion)
-    
-    return parsed_blocks
+logger.debug("Environment configured successfully")
+job_manager = get_job_manager(TRACE_FILE)
 
-
-
-def process_dataframe_with_mermaid_agent(page_id: str, df: pd.DataFrame, logic_column: str = "original_logic", max_retries: int = 3) -> pd.DataFrame:
-    """
-    Takes a DataFrame and applies the agent to each row, using the value in `logic_column` as the business logic.
-    Returns the DataFrame with a new column 'mermaid_graph' containing the generated Mermaid code (or None if failed).
-    """
-    global EMPTY_FILES
-
-    logger.info(f"Processing dataframe with mermaid agent for page: {page_id}")
-    graph_file_path = f"graphs/{page_id}_graphs.csv"
-
-    if not os.path.exists(graph_file_path) or EMPTY_FILES or st.session_state.force_recreate:
-        logger.info("Building mermaid agent")
-        app = build_mermaid_agent()
-
-        def process_row(row):
-            logic = row[logic_column]
-            if pd.isna(logic) or not str(logic).strip():
-                logger.debug(f"Skipping empty logic for row: {row.name}")
-                return None
-            logger.debug(f"Processing logic for row: {row.name}")
-            return run_agent(app, llm, str(logic), max_retries=max_retries)
-
-        df = df.copy()
-        logger.info("Applying mermaid agent to dataframe rows")
-        df["mermaid_graph"] = df.apply(process_row, axis=1)
-        try:
-            df.to_csv(graph_file_path, index=False)
-            logger.info(f"Successfully saved graphs to {graph_file_path}")
-        except Exception as e:
-            logger.error(f"Error saving graphs to file: {str(e)}")
-            raise
-    else:
-        logger.info(f"Loading existing graphs from {graph_file_path}")
-        df = pd.read_csv(graph_file_path)
-
-    return df
-
-def mermaid_to_svg(mermaid_code: str, theme: str = "default") -> str | None:
-    """
-    Generates SVG content from Mermaid code using mermaid.ink API.
-    Returns the SVG string or None if an error occurs.
-    """
-    logger.info("Generating SVG from Mermaid code using mermaid.ink API")
-    try:
-        # Clean up the Mermaid code
-        mermaid_code = mermaid_code.strip()
-        if mermaid_code.startswith("```mermaid"):
-            mermaid_code = mermaid_code[len("```mermaid"):]
-        if mermaid_code.endswith("```"):
-            mermaid_code = mermaid_code[:-len("```")]
-        mermaid_code = mermaid_code.strip()
-
-        # Encode the Mermaid code
-        graphbytes = mermaid_code.encode("utf8")
-        base64_bytes = base64.urlsafe_b64encode(graphbytes)
-        base64_string = base64_bytes.decode("ascii")
-
-        # Construct the URL with theme
-        url = f'https://mermaid.ink/svg/{base64_string}?type={theme}'
-        
-        # Make the request
-        logger.debug(f"Requesting SVG from mermaid.ink API: {url}")
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            logger.info("Successfully generated SVG")
-            return response.content.decode('utf-8')
-        else:
-            logger.error(f"Failed to generate SVG. Status code: {response.status_code}")
-            logger.error(f"Response content: {response.text}")
-            return None
-
-    except Exception as e:
-        logger.error(f"Error generating SVG: {str(e)}")
-        st.error(f"An unexpected error occurred while generating SVG: {e}")
-        return None
-
-def create_zip_of_svgs(df: pd.DataFrame, theme: str = "default") -> tuple[bytes, str]:
-    """
-    Create a zip file containing all SVGs from the DataFrame
-    Returns a tuple of (zip_bytes, error_message)
-    """
-    logger.info("Creating zip file of SVGs")
-    import zipfile
-    from io import BytesIO
-    
-    memory_file = BytesIO()
-    error_messages = []
-    
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for _, row in df.iterrows():
-            try:
-                svg_content = mermaid_to_svg(
-                    row['mermaid_graph'],
-                    theme=theme
-                )
-                if svg_content:
-                    filename = f"{row['block_name'].replace('/', '_')}.svg"
-                    zipf.writestr(filename, svg_content)
-                else:
-                    error_messages.append(f"Failed to generate SVG for {row['block_name']}")
-            except Exception as e:
-                logger.error(f"Error processing SVG for {row['block_name']}: {str(e)}")
-                error_messages.append(f"Error processing {row['block_name']}: {str(e)}")
-                continue
-    
-    memory_file.seek(0)
-    error_message = "\n".join(error_messages) if error_messages else None
-    return memory_file.getvalue(), error_message
+# Reattach after a browser refresh: the job id is kept in the URL.
+if st.session_state.job_id is None and st.query_params.get("job") and job_manager.get(st.query_params["job"]):
+    st.session_state.job_id = st.query_params["job"]
+    st.session_state.result_page_id = job_manager.get(st.session_state.job_id).page_id
+    logger.info(f"Reattached to job {st.session_state.job_id}")
 
 # --- Sidebar for Agent Selection and Inputs ---
 st.sidebar.header("⚙️ Agent Configuration")
@@ -223,6 +131,18 @@ force_recreate = st.sidebar.toggle(
 )
 st.session_state.force_recreate = force_recreate
 
+hedge_llm_calls = st.sidebar.toggle(
+    "Hedge Slow LLM Calls",
+    value=False,
+    help=f"Send a duplicate request when a generation runs longer than the p{HEDGE_PERCENTILE} of recent calls and keep whichever valid answer arrives first. Extra requests are capped at {HEDGE_BUDGET_FRACTION:.0%} of calls per run."
+)
+
+convert_business_specs = st.sidebar.toggle(
+    "Convert Business Specs",
+    value=False,
+    help=f"Treat the block identifier as a business section title (e.g. '{BUSINESS_FUNCTION_IDENTIFIER}'), convert those sections to technical specs and generate the flowcharts from them. Converted sections are cached, so unchanged ones are not sent to the LLM again."
+)
+
 # Documentation section
 with st.sidebar.expander("📖 How to use this tool"):
     st.markdown("""
@@ -259,134 +179,338 @@ selected_table_name = st.sidebar.selectbox(
     help="Select the relevant agent from the list."
 )
 
+resume_run_id = st.sidebar.text_input(
+    "Resume run ID (optional):",
+    key="resume_run_id",
+    help="Continue a previous batch run; rows that already finished are not regenerated. Leave empty to resume the latest unfinished run for this page."
+)
+
 # Button to trigger agent execution
-if st.sidebar.button("🚀 Run Agent", key="run_agent_button"):
+run_agent_clicked = st.sidebar.button("🚀 Run Agent", key="run_agent_button")
+if run_agent_clicked:
     logger.info("Agent execution triggered")
     st.session_state.agent_result_df = None # Reset previous results
-
-    if page_id_input and selected_table_name:
+    st.session_state.pop("prepared_svg", None)
+    st.session_state.run_summary = None
+    st.session_state.run_id = None
+    st.session_state.run_metrics = None
+    st.session_state.graph_changes = None
+
+    if not NOTION_TOKEN:
+        logger.error("NOTION_SECRET environment variable not found")
+        st.sidebar.error("NOTION_SECRET environment variable is required to run the agent.")
+    elif page_id_input and selected_table_name:
+        table_id = TABLE_MAPPING[selected_table_name]
+        logger.info(f"Processing request for Block: {block_identifier}, Page: {page_id_input}, Table: {selected_table_name} (ID: {table_id})")
         try:
-            table_id = TABLE_MAPPING[selected_table_name]
-            logger.info(f"Processing request for Block: {block_identifier}, Page: {page_id_input}, Table: {selected_table_name} (ID: {table_id})")
-            with st.spinner(f"Processing for Identifier: {block_identifier}, Page ID: {page_id_input}, Table: {selected_table_name}..."):
-                df_result = fetch_data_spec_content(block_identifier, page_id_input, table_id, notion_client)
-            st.session_state.agent_result_df = df_result
-            st.session_state.download_filename = f"{block_identifier}_{page_id_input}_table_{selected_table_name}.csv"
-
-            with st.spinner("Generating Mermaid Graph..."):
-                logger.info("Starting mermaid graph generation")
-                df_result = process_dataframe_with_mermaid_agent(page_id_input, df_result, logic_column="block_content", max_retries=3)
-                st.session_state.agent_result_df = df_result
-                st.session_state.download_filename = f"mermaid_graph_{page_id_input}_table_{selected_table_name}.csv"
-                logger.info("Mermaid graph generation completed successfully")
-                st.sidebar.success("Mermaid Graph generated successfully!")
-            
-        except Exception as e:
-            logger.error(f"Error in Agent execution: {str(e)}", exc_info=True)
-            st.sidebar.error(f"Error in Agent: {str(e)}")
+            job = job_manager.submit(
+                page_id_input, selected_table_name, block_identifier,
+                pipeline_job(get_notion_client(NOTION_TOKEN), get_model_tiers(), table_id, force_recreate=st.session_state.force_recreate,
+                             resume_run_id=resume_run_id or None, hedge=hedge_llm_calls,
+                             business_converter=get_business_converter() if convert_business_specs else None)
+            )
+        except JobConflict as e:
+            logger.warning(str(e))
+            st.sidebar.error(str(e))
+        else:
+            st.session_state.job_id = job.job_id
+            st.session_state.collected_job_id = None
+            st.session_state.result_page_id = job.page_id
+            st.session_state.download_filename = f"mermaid_graph_{page_id_input}_table_{selected_table_name}.csv"
+            st.query_params["job"] = job.job_id
+
+active_jobs = job_manager.list_jobs(active_only=True)
+if active_jobs:
+    with st.sidebar.expander(f"🧵 Running Jobs ({len(active_jobs)})"):
+        for job in active_jobs:
+            snapshot = job.snapshot()
+            label = f"{snapshot['table_name']} · {snapshot['page_id'][:8]}… · {snapshot['status']}"
+            if st.button(label, key=f"attach_{job.job_id}", disabled=job.job_id == st.session_state.job_id,
+                         help="Follow this job's progress in this session"):
+                st.session_state.job_id = job.job_id
+                st.session_state.collected_job_id = None
+                st.session_state.result_page_id = job.page_id
+                st.query_params["job"] = job.job_id
+                st.rerun()
+
+def collect_job_results(job):
+    """Copies a finished job's results into this session (once per job)."""
+    st.session_state.collected_job_id = job.job_id
+    st.session_state.result_page_id = job.page_id
+    st.session_state.run_id = job.run_state.get("run_id")
+    st.session_state.run_summary = job.run_state.get("run_summary")
+    st.session_state.run_metrics = job.run_state.get("run_metrics")
+    st.session_state.graph_changes = job.run_state.get("graph_changes")
+    st.session_state.agent_result_df = job.result_df
+    st.session_state.download_filename = f"mermaid_graph_{job.page_id}_table_{job.table_name}.csv"
+
+@st.fragment(run_every=1.0)
+def job_progress(job_id: str):
+    """Polls the background job; only this fragment reruns while the job is going."""
+    job = job_manager.get(job_id)
+    if job is None:
+        st.warning(f"Job `{job_id}` is no longer available.")
+        return
+    snapshot = job.snapshot()
+    if snapshot["status"] in ACTIVE_STATUSES:
+        done, total = len(snapshot["completed_rows"]), snapshot["total_rows"]
+        if total:
+            st.progress(done / total, text=f"Generating graphs: {done}/{total} rows · {snapshot['elapsed_seconds']:.0f}s (job `{job_id}`)")
+        else:
+            st.progress(0.0, text=f"{snapshot['status'].capitalize()} page {snapshot['page_id']}… {snapshot['elapsed_seconds']:.0f}s (job `{job_id}`)")
+        if snapshot["completed_rows"] and job.spec_df is not None:
+            block_names = job.spec_df["block_name"]
+            st.dataframe(pd.DataFrame([
+                {"block_name": block_names.get(row_index, row_index), "graph": "✅ generated" if graph else "❌ failed"}
+                for row_index, graph in snapshot["completed_rows"].items()
+            ]), hide_index=True, height=200)
+        return
+
+    # The job finished: take over its results and redraw the whole page once.
+    collect_job_results(job)
+    st.rerun()
+
+if st.session_state.job_id and st.session_state.collected_job_id != st.session_state.job_id:
+    job_progress(st.session_state.job_id)
+
+attached_job = job_manager.get(st.session_state.job_id) if st.session_state.job_id else None
+if attached_job is not None and st.session_state.collected_job_id == attached_job.job_id:
+    attached_snapshot = attached_job.snapshot()
+    if attached_snapshot["status"] == JOB_DONE:
+        st.sidebar.success(f"Mermaid Graph generated successfully! ({attached_snapshot['elapsed_seconds']:.0f}s)")
+    else:
+        st.sidebar.error(f"Error in Agent: {attached_snapshot['error']}")
+        if attached_snapshot["run_id"]:
+            st.sidebar.info(f"Progress was checkpointed under run ID `{attached_snapshot['run_id']}`. Run again to resume.")
+
+if st.session_state.run_summary:
+    with st.sidebar.expander("📈 Model Cascade Summary"):
+        st.json(st.session_state.run_summary)
+
+if st.session_state.graph_changes:
+    graph_changes = st.session_state.graph_changes
+    with st.sidebar.expander(f"🔀 Graph Changes ({len(graph_changes['changed'])} changed)"):
+        st.caption(f"Compared with the previous graphs of this page: {len(graph_changes['unchanged'])} unchanged, "
+                   f"{len(graph_changes['added'])} new, {len(graph_changes['removed'])} removed block(s).")
+        for block_name, graph_diff in graph_changes["changed"].items():
+            st.markdown(f"**{block_name}**")
+            for decision in graph_diff["changed_decisions"]:
+                st.text(f"{decision['decision']}: {decision['before']} → {decision['after']}")
+            for decision in graph_diff["added_decisions"]:
+                st.text(f"+ {decision}")
+            for decision in graph_diff["removed_decisions"]:
+                st.text(f"- {decision}")
+        st.download_button(
+            label="Download Graph Changes (JSON)",
+            data=json.dumps(graph_changes, indent=2, ensure_ascii=False),
+            file_name=f"graph_changes_{st.session_state.run_id}.json",
+            mime="application/json",
+            key="download_graph_changes"
+        )
+
+if st.session_state.run_metrics is not None:
+    with st.sidebar.expander("⏱️ Run Metrics"):
+        st.json(st.session_state.run_metrics.summary())
+        st.download_button(
+            label="Download Metrics (JSON)",
+            data=st.session_state.run_metrics.to_json(),
+            file_name=f"run_metrics_{st.session_state.run_id}.json",
+            mime="application/json",
+            key="download_metrics_json"
+        )
+        st.download_button(
+            label="Download Metrics (Prometheus)",
+            data=st.session_state.run_metrics.to_prometheus(),
+            file_name=f"run_metrics_{st.session_state.run_id}.prom",
+            mime="text/plain",
+            key="download_metrics_prom"
+        )
 
 # --- Main Area for Displaying Results ---
+# SVG exports use the default mermaid.ink theme (the theme picker below is disabled).
+MERMAID_THEME = "default"
+
+def get_graph_index(result_df: pd.DataFrame) -> tuple[dict, list]:
+    """
+    Block name -> row position in `result_df` (duplicate names keep their first row),
+    and the fence-stripped Mermaid code of every row. Built once per result instead
+    of a boolean mask and a fence strip per selection.
+    """
+    cached = st.session_state.get("graph_index")
+    if cached is None or cached[0] is not result_df:
+        index = {}
+        for position, block_name in enumerate(result_df['block_name'].tolist()):
+            index.setdefault(block_name, position)
+        mermaid_codes = [strip_mermaid_fences(graph) if isinstance(graph, str) else "" for graph in result_df['mermaid_graph'].tolist()]
+        cached = (result_df, index, mermaid_codes)
+        st.session_state.graph_index = cached
+    return cached[1], cached[2]
+
+@st.fragment
+def single_svg_export(mermaid_code: str, selected_block: str):
+    """Reruns on its own, so preparing or downloading the SVG leaves the rest of the page untouched."""
+    if st.button("Prepare SVG for Download", key="prepare_svg"):
+        with st.spinner("Generating SVG..."):
+            svg_content = mermaid_to_svg_cached(
+                mermaid_code,
+                theme=MERMAID_THEME
+            )
+        st.session_state.prepared_svg = (selected_block, svg_content)
+        if not svg_content:
+            st.error("Could not generate SVG for download.")
+
+    prepared_block, svg_content = st.session_state.get("prepared_svg") or (None, None)
+    if svg_content and prepared_block == selected_block:
+        st.success("SVG generated successfully!")
+        st.download_button(
+            label="Download Graph (SVG)",
+            data=svg_content,
+            file_name=f"{selected_block.replace('/', '_')}.svg",
+            mime="image/svg+xml",
+            key="download_single_svg"
+        )
+
+def get_export_key(result_df: pd.DataFrame) -> str:
+    """Hash of every graph's render key, equal for results whose graphs are all structurally unchanged. Computed once per result."""
+    cached = st.session_state.get("export_key")
+    if cached is not None and cached[0] is result_df:
+        return cached[1]
+    graph_irs = result_df['graph_ir'] if 'graph_ir' in result_df else [None] * len(result_df)
+    keys = [
+        f"{block_name}:{graph_render_key(graph, graph_ir) if isinstance(graph, str) else ''}"
+        for block_name, graph, graph_ir in zip(result_df['block_name'], result_df['mermaid_graph'], graph_irs)
+    ]
+    result_key = hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
+    st.session_state.export_key = (result_df, result_key)
+    return result_key
+
+@st.fragment
+def zip_export(result_df: pd.DataFrame, page_id: str):
+    result_key = get_export_key(result_df)
+    if st.button("Prepare All Graphs (ZIP, SVG)", key="prepare_all_svgs"):
+        prepared = st.session_state.get("prepared_zip")
+        # Keep the previous ZIP when no graph changed since it was built (e.g. after re-running the agent).
+        if prepared is None or prepared[0] != result_key:
+            with st.spinner("Generating ZIP file with all SVGs..."):
+                zip_export_file = export_zip_of_svgs(
+                    result_df,
+                    theme=MERMAID_THEME
+                )
+            if prepared is not None:
+                prepared[1].close()
+            st.session_state.prepared_zip = (result_key, zip_export_file)
+
+    prepared_key, zip_export_file = st.session_state.get("prepared_zip") or (None, None)
+    if prepared_key != result_key:
+        # Built for graphs that have changed since.
+        return
+    if zip_export_file.size:
+        st.success("ZIP file generated successfully!")
+        if zip_export_file.error_message:
+            st.warning("Some SVGs could not be generated. See details below.")
+            with st.expander("Error Details"):
+                st.text(zip_export_file.error_message)
+
+        # The archive stays in its spooled file (on disk once large) until the button is clicked; Streamlit then
+        # holds the whole archive in memory to serve it. Only the job API's export endpoints stream it in chunks.
+        st.download_button(
+            label="Download All SVGs (ZIP)",
+            data=zip_export_file.read_bytes,
+            file_name=f"all_graphs_{page_id}.zip",
+            mime="application/zip",
+            key="download_all_svgs"
+        )
+    elif "prepared_zip" in st.session_state:
+        st.error("Could not generate ZIP file.")
+
+@st.fragment
+def graph_viewer(result_df: pd.DataFrame, page_id: str):
+    """Picking another graph reruns only this fragment, not the whole script."""
+    graph_index, mermaid_codes = get_graph_index(result_df)
+    block_options = list(graph_index)
+    search_query = st.text_input(
+        "Search blocks",
+        key="block_search",
+        placeholder="e.g. var:contractDetails.contractType label:CC",
+        help="Words in block names, content or graph labels. `var:` matches variables compared in conditions; terms are ANDed."
+    )
+    if search_query.strip():
+        search_start = time.perf_counter()
+        hits = get_search_index().search(search_query, page_id=page_id)
+        search_ms = (time.perf_counter() - search_start) * 1000
+        matching_names = {hit["block_name"] for hit in hits}
+        block_options = [block_name for block_name in block_options if block_name in matching_names]
+        st.caption(f"{len(block_options)} matching block(s) on this page ({search_ms:.2f} ms)")
+    selected_block = st.selectbox("Select a graph to view:", block_options, key="selected_graph")
+    logger.debug(f"Selected block: {selected_block}")
+    if selected_block is None:
+        return
+
+    mermaid_code = mermaid_codes[graph_index[selected_block]]
+    if not mermaid_code:
+        st.warning("No valid graph was generated for this block.")
+        return
+
+    # Display the graph
+    try:
+        logger.info(f"Rendering mermaid graph for block: {selected_block}")
+        from streamlit_mermaid import st_mermaid
+        st_mermaid(mermaid_code, height=600)
+    except Exception as e:
+        logger.error(f"Error rendering Mermaid graph: {str(e)}", exc_info=True)
+        st.error(f"Error rendering Mermaid graph: {str(e)}")
+        st.text("Raw Mermaid code:")
+        st.code(mermaid_code, language="mermaid")
+        return
+
+    # Add download buttons in a horizontal layout
+    col1, col2 = st.columns(2)
+    with col1:
+        single_svg_export(mermaid_code, selected_block)
+    with col2:
+        zip_export(result_df, page_id)
+
 if st.session_state.agent_result_df is not None:
     logger.info("Displaying results in main area")
     st.subheader("📊 Mermaid Graph Viewer")
-    
+
     # # Add theme selection
     # theme = st.sidebar.selectbox(
     #     "Select Theme",
     #     options=["default", "forest", "dark", "neutral"],
     #     help="Choose a theme for the Mermaid diagrams"
     # )
-    
-    # Create a dropdown with block names
-    block_names = st.session_state.agent_result_df['block_name'].tolist()
-    selected_block = st.selectbox("Select a graph to view:", block_names)
-    logger.debug(f"Selected block: {selected_block}")
-    
-    # Get the corresponding Mermaid code
-    selected_row = st.session_state.agent_result_df[st.session_state.agent_result_df['block_name'] == selected_block].iloc[0]
-    mermaid_code = selected_row['mermaid_graph']
-    
-    # Clean up the Mermaid code
-    mermaid_code = mermaid_code.strip()
-    if mermaid_code.startswith("```mermaid"):
-        mermaid_code = mermaid_code[len("```mermaid"):]
-    if mermaid_code.endswith("```"):
-        mermaid_code = mermaid_code[:-len("```")]
-    mermaid_code = mermaid_code.strip()
-    
-    # Display the graph
-    try:
-        logger.info(f"Rendering mermaid graph for block: {selected_block}")
-        st_mermaid(mermaid_code, height=600)
 
-        # Add download buttons in a horizontal layout
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("Prepare SVG for Download", key="prepare_svg"):
-                with st.spinner("Generating SVG..."):
-                    svg_content = mermaid_to_svg(
-                        mermaid_code,
-                        theme=theme
-                    )
-                
-                if svg_content:
-                    st.success("SVG generated successfully!")
-                    st.download_button(
-                        label="Download Graph (SVG)",
-                        data=svg_content,
-                        file_name=f"{selected_block.replace('/', '_')}.svg",
-                        mime="image/svg+xml",
-                        key="download_single_svg"
-                    )
-                else:
-                    st.error("Could not generate SVG for download.")
-
-        with col2:
-            if st.button("Prepare All Graphs (ZIP, SVG)", key="prepare_all_svgs"):
-                with st.spinner("Generating ZIP file with all SVGs..."):
-                    zip_bytes, error_message = create_zip_of_svgs(
-                        st.session_state.agent_result_df,
-                        theme=theme
-                    )
-                    
-                    if zip_bytes:
-                        st.success("ZIP file generated successfully!")
-                        if error_message:
-                            st.warning("Some SVGs could not be generated. See details below.")
-                            with st.expander("Error Details"):
-                                st.text(error_message)
-                        
-                        st.download_button(
-                            label="Download All SVGs (ZIP)",
-                            data=zip_bytes,
-                            file_name=f"all_graphs_{page_id_input}.zip",
-                            mime="application/zip",
-                            key="download_all_svgs"
-                        )
-                    else:
-                        st.error("Could not generate ZIP file.")
-
-        st.subheader("📊 CSV Data Sample (First 5 Rows)")
-        st.dataframe(st.session_state.agent_result_df.head())
-
-        # Convert DataFrame to CSV string for download
-        csv_string = st.session_state.agent_result_df.to_csv(index=False).encode('utf-8')
-        logger.info("Preparing CSV download")
+    # The page the results belong to, not the sidebar box (empty after a refresh, or another page after reattaching).
+    graph_viewer(st.session_state.agent_result_df, st.session_state.result_page_id)
 
-        st.download_button(
-            label="📥 Download Full CSV",
-            data=csv_string,
-            file_name=st.session_state.download_filename,
-            mime='text/csv',
-            key='download_button'
-        )
-    except Exception as e:
-        logger.error(f"Error rendering Mermaid graph: {str(e)}", exc_info=True)
-        st.error(f"Error rendering Mermaid graph: {str(e)}")
-        st.text("Raw Mermaid code:")
-        st.code(mermaid_code, language="mermaid")
+    st.subheader("📊 CSV Data Sample (First 5 Rows)")
+    st.dataframe(st.session_state.agent_result_df.head())
+
+    def full_csv(result_df: pd.DataFrame = st.session_state.agent_result_df) -> bytes:
+        """Serialized only when the button is clicked, not on every rerun; Streamlit still serves it from memory."""
+        csv_export_file = export_csv(result_df)
+        try:
+            return csv_export_file.read_bytes()
+        finally:
+            csv_export_file.close()
+
+    st.download_button(
+        label="📥 Download Full CSV",
+        data=full_csv,
+        file_name=st.session_state.download_filename,
+        mime='text/csv',
+        key='download_button'
+    )
+
+# Rerun latency: script start to this point (agent runs happen in background jobs, not here).
+rerun_seconds = time.perf_counter() - RERUN_START_TIME
+st.session_state.rerun_seconds = (st.session_state.rerun_seconds + [rerun_seconds])[-RERUN_HISTORY_SIZE:]
+if st.session_state.rerun_seconds:
+    with st.sidebar.expander("⏲️ Rerun Latency"):
+        st.caption(f"Last rerun: {rerun_seconds * 1000:.0f} ms · median of last {len(st.session_state.rerun_seconds)}: "
+                   f"{statistics.median(st.session_state.rerun_seconds) * 1000:.0f} ms")
 
 st.markdown("---")
 st.caption("A simple agent data extraction app.")
-logger.info("Application initialization completed")
\ No newline at end of file
+logger.debug(f"Rerun completed in {rerun_seconds * 1000:.0f} ms")
\ No newline at end of file
@@ -1,23 +1,27 @@
-import os
-import base64
+import time
+import threading
 import requests
-import tempfile
-from typing import TypedDict, List
-from dotenv import load_dotenv, find_dotenv
-
-import pandas as pd
+from typing import TypedDict, List, Dict, Any, Callable
 
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
+from agent_metrics import RowMetrics, RunMetrics
+from hedging import HedgedInvoker
+from mermaid_ir import strip_mermaid_fences
+from mermaid_render import mermaid_ink_url, MERMAID_INK_MAX_URL_CHARS
+from http_session import get_http_session
+import tracing
+import logging
 
-# Load environment variables
-load_dotenv(find_dotenv(), override=True)
+logger = logging.getLogger(__name__)
 
 # --- 1. State Definition ---
+# The chat model is not part of the state (it cannot be checkpointed); nodes
+# read it from config["configurable"]["llm"] instead.
 class AgentState(TypedDict):
-    llm: BaseChatModel
     original_logic: str
     clarified_logic: str
     mermaid_graph: str
@@ -26,6 +30,96 @@ class AgentState(TypedDict):
     max_retries: int
     current_retry: int
     feedback_history: List[str]
+    llm_usage: List[Dict[str, int]]
+
+# --- Prompt prefix ---
+# The fixed instructions are kept separate from the per-row logic so that
+# providers with prompt caching can reuse the prefix across rows and retries.
+# Anthropic only caches a prefix of at least 1024 tokens (Sonnet); the notes that
+# explain the numbered instructions keep the prefix above that minimum without
+# changing what is asked for. Keep it above the minimum when editing it
+# (fake_llm.FakeCachingChatModel reports no cache activity below it).
+MERMAID_SYSTEM_PROMPT = """
+You are an expert in generating Mermaid flowchart diagrams from business logic.
+Convert the following business logic into a Mermaid flowchart (`graph TD` or `flowchart TD`).
+
+**Important Instructions:**
+1.  **Syntax**: Ensure your output is valid Mermaid syntax. Pay close attention to node IDs, edge definitions (e.g., `A --> B`), and subgraph syntax if used.
+    *   Node IDs must be alphanumeric and cannot contain special characters like spaces, hyphens (unless part of a quoted label), or periods directly in the ID. If you need spaces or special characters in the *displayed text* of a node, use quotes: `id1["Node Text with Spaces"]`.
+    *   Ensure all declared nodes are used or connected.
+2.  **Decision Nodes**: Represent conditions as diamond shapes. Example: `condition1{Is X true?}`.
+3.  **Multi-Value Conditions**: If a condition checks a single variable against multiple distinct values (e.g., `if client_type == "type1"`, then `if client_type == "type2"`), the decision node for `client_type` should have edges directly labeled with these values (e.g., `client_type_check{Client Type?} -->|type1| outcome1`, `client_type_check -- type2 --> outcome2`). Do NOT use generic "true"/"false" edges for these cases.
+4.  **Values**: The values for the conditions are always placeholders, that's why you will see "[value]", however, this does not mean that they all share the same value each one should have a separate [value] node.
+5.  **Clarity and Readability**: Ensure the graph is easy to understand and accurately reflects the logic. Start with `graph TD` or `flowchart TD`.
+6.  **Output Format**: Provide ONLY the Mermaid code block, starting with ```mermaid and ending with ```. No other text or explanation before or after the code block.
+7.  **List all Conditions**: never forget to add any of the listed conditions.
+8.  **Long Text Values**: even you get a long text as value (e.g "if not condition is met [a long text]") for a condition you should omit it and use "[value]" for the result node.
+9.  **Important Rule**: always put the string inside curly or square brackets between qoutations.
+
+**Notes on the instructions above**
+These notes explain instructions 1-9 in more detail. They do not add any requirement of their own; when in doubt, follow the numbered instructions.
+
+*   On instruction 1 (Syntax): a node is written as an ID followed by its shape and label, for example `id1["Node Text with Spaces"]` for a rectangle or `condition1{"Is X true?"}` for a diamond. The ID is only used to connect nodes and is not displayed, which is why it must stay a plain alphanumeric name while the quoted label may contain any text. An edge connects two IDs, as in `A --> B`. Declaring a node that no edge reaches leaves it floating on its own in the rendered diagram, which is what "used or connected" rules out.
+*   On instruction 2 (Decision Nodes): the diamond shape comes from the curly brackets around the label. Every condition of the business logic is a diamond; the outcomes it leads to are not.
+*   On instruction 3 (Multi-Value Conditions): the two edge forms shown, `-->|type1|` and `-- type2 -->`, are equivalent Mermaid syntax for a labeled edge. What matters is that one decision node for the variable fans out into one labeled edge per value that the logic checks, instead of a chain of separate true/false checks on the same variable.
+*   On instruction 4 (Values): "[value]" stands for a value that is filled in later. Two results that both read "[value]" are still two different results, so each one gets its own node with its own ID, even though the labels look the same.
+*   On instruction 5 (Clarity and Readability): the first line of the code block is the diagram type, `graph TD` or `flowchart TD`, meaning a flowchart drawn from top to bottom. Reflecting the logic accurately takes precedence over making the graph shorter.
+*   On instruction 6 (Output Format): the response is read by a program that extracts the code between ```mermaid and ```. Any sentence before or after the code block is either discarded or breaks that extraction, so the code block is the whole answer.
+*   On instruction 7 (List all Conditions): every condition listed in the business logic appears in the graph, including conditions that are only reached on a rarely taken path. A graph that silently drops a condition misrepresents the logic even when its syntax is valid.
+*   On instruction 8 (Long Text Values): a long text that describes a result is still a result value. It is replaced by "[value]" in the result node, in the same way as a short value, so the graph stays readable.
+*   On instruction 9 (Important Rule): quoting the text inside the brackets, as in `["Node Text"]` or `{"Is X true?"}`, keeps characters such as parentheses, colons, slashes or comparison operators from being read as Mermaid syntax. Unquoted labels with such characters are the most common reason a generated diagram fails to render.
+"""
+
+# Chat model types (BaseChatModel._llm_type) that accept Anthropic-style
+# `cache_control` markers on content blocks.
+CACHE_CONTROL_LLM_TYPES = {"anthropic-chat", "fake-caching-chat"}
+
+def supports_cache_control(llm: BaseChatModel) -> bool:
+    return getattr(llm, "_llm_type", None) in CACHE_CONTROL_LLM_TYPES
+
+def build_mermaid_messages(llm: BaseChatModel, logic_to_use: str, feedback_intro: str = "") -> List[BaseMessage]:
+    """
+    Builds the generation prompt as a static system prefix followed by the
+    per-row business logic and retry feedback. When the provider supports it,
+    the system prefix is marked with an ephemeral cache breakpoint.
+    """
+    if supports_cache_control(llm):
+        system_message = SystemMessage(content=[{
+            "type": "text",
+            "text": MERMAID_SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"},
+        }])
+    else:
+        system_message = SystemMessage(content=MERMAID_SYSTEM_PROMPT)
+
+    human_prompt = f"""**Business Logic to Convert:**
+{logic_to_use}
+{feedback_intro}
+
+Generate the Mermaid code:
+"""
+    return [system_message, HumanMessage(content=human_prompt)]
+
+def extract_usage(response: Any) -> Dict[str, int]:
+    """
+    Reads token counts from a chat model response, including prompt cache
+    reads and writes when the provider reports them. Missing values are 0.
+    """
+    usage_metadata = getattr(response, "usage_metadata", None) or {}
+    token_details = usage_metadata.get("input_token_details") or {}
+    return {
+        "input_tokens": usage_metadata.get("input_tokens", 0),
+        "output_tokens": usage_metadata.get("output_tokens", 0),
+        "cache_read_tokens": token_details.get("cache_read", 0) or 0,
+        "cache_creation_tokens": token_details.get("cache_creation", 0) or 0,
+    }
+
+def summarize_usage(llm_usage: List[Dict[str, int]]) -> Dict[str, int]:
+    summary = {"llm_calls": len(llm_usage)}
+    for usage in llm_usage:
+        for key, value in usage.items():
+            summary[key] = summary.get(key, 0) + value
+    return summary
 
 # --- 2. Tools ---
 @tool
@@ -35,35 +129,28 @@ def validate_mermaid_syntax(mermaid_code: str) -> str:
     Returns "Graph is valid" if no errors are found.
     Otherwise, returns a string starting with "Error:" followed by the error details.
     """
-    print(f"--- Validating Mermaid Code via mermaid.ink API ---\n{mermaid_code}\n---")
+    logger.debug(f"Validating Mermaid code via mermaid.ink API:\n{mermaid_code}")
 
     # 1. Prepare the code for validation (remove markdown backticks)
-    code_to_validate = mermaid_code.strip()
-    if code_to_validate.startswith("```mermaid"):
-        code_to_validate = code_to_validate[len("```mermaid"):]
-    if code_to_validate.endswith("```"):
-        code_to_validate = code_to_validate[:-len("```")]
-    code_to_validate = code_to_validate.strip()
+    code_to_validate = strip_mermaid_fences(mermaid_code)
 
     if not code_to_validate:
         return "Error: Mermaid code is empty after stripping backticks."
 
-    try:
-        # Encode the Mermaid code
-        graphbytes = code_to_validate.encode("utf8")
-        base64_bytes = base64.urlsafe_b64encode(graphbytes)
-        base64_string = base64_bytes.decode("ascii")
+    url = mermaid_ink_url(code_to_validate)
+    if len(url) > MERMAID_INK_MAX_URL_CHARS:
+        return f"Error: The diagram is too large for mermaid.ink ({len(url)} URL characters); it could not be rendered or exported."
 
+    try:
         # Make the request to mermaid.ink API
-        url = f'https://mermaid.ink/svg/{base64_string}'
-        response = requests.get(url, timeout=15)
+        response = get_http_session().get(url, timeout=15)
 
         if response.status_code == 200:
-            print("Validation successful: Graph is valid")
+            logger.debug("Validation successful: Graph is valid")
             return "Graph is valid"
         else:
             error_message = response.text if response.text else f"HTTP {response.status_code}"
-            print(f"Validation failed: {error_message}")
+            logger.info(f"Validation failed: {error_message}")
             return f"Error: Mermaid syntax validation failed.\nAPI Response: {error_message}"
 
     except requests.Timeout:
@@ -73,9 +160,43 @@ def validate_mermaid_syntax(mermaid_code: str) -> str:
     except Exception as e:
         return f"Error: An unexpected error occurred during validation: {str(e)}"
 
-def clarify_logic_node(state: AgentState) -> AgentState:
-    print("--- Clarifying Business Logic Node ---")
-    llm = state["llm"]
+def validate_mermaid_locally(mermaid_code: str) -> str:
+    """
+    Cheap structural checks run before the mermaid.ink round trip.
+    Returns "Graph is valid" or a string starting with "Error:", like validate_mermaid_syntax.
+    """
+    code = strip_mermaid_fences(mermaid_code)
+    if not code:
+        return "Error: Mermaid code is empty after stripping backticks."
+
+    header = code.splitlines()[0].strip()
+    if not (header.startswith("graph") or header.startswith("flowchart")):
+        return f"Error: Diagram must start with `graph TD` or `flowchart TD`, found: {header}"
+
+    pairs = {")": "(", "]": "[", "}": "{"}
+    for line_number, line in enumerate(code.splitlines(), start=1):
+        stack = []
+        in_quotes = False
+        for char in line:
+            if char == '"':
+                in_quotes = not in_quotes
+            elif in_quotes:
+                continue
+            elif char in "([{":
+                stack.append(char)
+            elif char in pairs:
+                if not stack or stack.pop() != pairs[char]:
+                    return f"Error: Unbalanced '{char}' on line {line_number}: {line.strip()}"
+        if in_quotes:
+            return f"Error: Unclosed quotation mark on line {line_number}: {line.strip()}"
+        if stack:
+            return f"Error: Unclosed '{stack[-1]}' on line {line_number}: {line.strip()}"
+
+    return "Graph is valid"
+
+def clarify_logic_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    logger.debug("Clarifying business logic")
+    llm = config["configurable"]["llm"]
     original_logic = state["original_logic"]
 
     prompt = f"""
@@ -98,13 +219,18 @@ def clarify_logic_node(state: AgentState) -> AgentState:
     response = llm.invoke([HumanMessage(content=prompt)])
     clarified_logic = response.content.strip()
 
-    print(f"Clarified Logic:\n{clarified_logic}")
+    logger.debug(f"Clarified Logic:\n{clarified_logic}")
 
     return {"clarified_logic": clarified_logic, "current_retry": 0, "feedback_history": []}
 
-def generate_mermaid_node(state: AgentState) -> AgentState:
-    print("--- Generating Mermaid Graph Node ---")
-    llm = state["llm"]
+def _is_locally_valid_response(response) -> bool:
+    return validate_mermaid_locally(response.content) == "Graph is valid"
+
+def generate_mermaid_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    logger.debug("Generating Mermaid graph")
+    llm = config["configurable"]["llm"]
+    metrics = config["configurable"].get("metrics")
+    hedger = config["configurable"].get("hedger")
     logic_to_use = state["original_logic"]
     feedback_items = state.get("feedback_history", [])
 
@@ -114,49 +240,54 @@ def generate_mermaid_node(state: AgentState) -> AgentState:
         recent_feedback = "\n---\n".join(feedback_items[-3:])
         feedback_intro += recent_feedback
 
-    prompt_template = f"""
-    You are an expert in generating Mermaid flowchart diagrams from business logic.
-    Convert the following business logic into a Mermaid flowchart (`graph TD` or `flowchart TD`).
-
-    **Important Instructions:**
-    1.  **Syntax**: Ensure your output is valid Mermaid syntax. Pay close attention to node IDs, edge definitions (e.g., `A --> B`), and subgraph syntax if used.
-        *   Node IDs must be alphanumeric and cannot contain special characters like spaces, hyphens (unless part of a quoted label), or periods directly in the ID. If you need spaces or special characters in the *displayed text* of a node, use quotes: `id1["Node Text with Spaces"]`.
-        *   Ensure all declared nodes are used or connected.
-    2.  **Decision Nodes**: Represent conditions as diamond shapes. Example: `condition1{{Is X true?}}`.
-    3.  **Multi-Value Conditions**: If a condition checks a single variable against multiple distinct values (e.g., `if client_type == "type1"`, then `if client_type == "type2"`), the decision node for `client_type` should have edges directly labeled with these values (e.g., `client_type_check{{Client Type?}} -->|type1| outcome1`, `client_type_check -- type2 --> outcome2`). Do NOT use generic "true"/"false" edges for these cases.
-    4.  **Values**: The values for the conditions are always placeholders, that's why you will see "[value]", however, this does not mean that they all share the same value each one should have a separate [value] node.
-    5.  **Clarity and Readability**: Ensure the graph is easy to understand and accurately reflects the logic. Start with `graph TD` or `flowchart TD`.
-    6.  **Output Format**: Provide ONLY the Mermaid code block, starting with ```mermaid and ending with ```. No other text or explanation before or after the code block.
-    7.  **List all Conditions**: never forget to add any of the listed conditions.
-    8.  **Long Text Values**: even you get a long text as value (e.g "if not condition is met [a long text]") for a condition you should omit it and use "[value]" for the result node.
-    9.  **Important Rule**: always put the string inside curly or square brackets between qoutations. 
-
-    **Business Logic to Convert:**
-    {logic_to_use}
-    {feedback_intro}
-
-    Generate the Mermaid code:
-    """
-    print(prompt_template)
-    response = llm.invoke([HumanMessage(content=prompt_template)])
+    messages = build_mermaid_messages(llm, logic_to_use, feedback_intro)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Generation prompt:\n{messages[-1].content}")
+    start_time = time.perf_counter()
+    with tracing.span("llm.invoke", model=getattr(llm, "model", None) or llm._llm_type,
+                      attempt=state.get("current_retry", 0) + 1, hedged=hedger is not None) as llm_span:
+        if hedger is not None:
+            response = hedger.invoke(llm, messages, is_valid=_is_locally_valid_response)
+        else:
+            response = llm.invoke(messages)
+        usage = extract_usage(response)
+        llm_span.set(**usage)
+    llm_seconds = time.perf_counter() - start_time
     mermaid_code = response.content.strip()
+    if metrics is not None:
+        metrics.record_llm_call(usage, llm_seconds)
+    logger.debug(f"LLM call took {llm_seconds:.2f}s, token usage: {usage}")
 
     if not mermaid_code.startswith("```mermaid"):
         mermaid_code = "```mermaid\n" + mermaid_code
     if not mermaid_code.endswith("```"):
         mermaid_code = mermaid_code + "\n```"
 
-    print(f"Generated Mermaid Code (Attempt {state.get('current_retry', 0) + 1}):\n{mermaid_code}")
+    logger.debug(f"Generated Mermaid Code (Attempt {state.get('current_retry', 0) + 1}):\n{mermaid_code}")
 
     current_retry = state.get("current_retry", 0) + 1
-    return {"mermaid_graph": mermaid_code, "current_retry": current_retry}
+    llm_usage = state.get("llm_usage", [])
+    llm_usage.append(usage)
+    return {"mermaid_graph": mermaid_code, "current_retry": current_retry, "llm_usage": llm_usage}
 
-def validate_graph_node(state: AgentState) -> AgentState:
-    print("--- Validating Mermaid Graph Node ---")
+def validate_graph_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    logger.debug("Validating Mermaid graph")
     mermaid_code = state["mermaid_graph"]
-
-    validation_output = validate_mermaid_syntax.invoke({"mermaid_code": mermaid_code})
-    print(f"Validation Output: {validation_output}")
+    metrics = config["configurable"].get("metrics")
+
+    start_time = time.perf_counter()
+    validation_output = validate_mermaid_locally(mermaid_code)
+    remote = validation_output == "Graph is valid"
+    if remote:
+        validator = config["configurable"].get("validator")
+        with tracing.span("mermaid.ink.validate", attempt=state.get("current_retry", 0)):
+            if validator is not None:
+                validation_output = validator(mermaid_code)
+            else:
+                validation_output = validate_mermaid_syntax.invoke({"mermaid_code": mermaid_code})
+    if metrics is not None:
+        metrics.record_validation(time.perf_counter() - start_time, remote)
+    logger.debug(f"Validation Output: {validation_output}")
 
     if validation_output == "Graph is valid":
         return {"validation_result": "valid", "error_message": ""}
@@ -172,25 +303,28 @@ def validate_graph_node(state: AgentState) -> AgentState:
         return {"validation_result": "invalid", "error_message": error_message, "feedback_history": feedback_history}
 
 def should_retry_generation(state: AgentState) -> str:
-    print("--- Decision: Should Retry Generation? ---")
     if state["validation_result"] == "valid":
-        print("Decision: Graph is valid. End.")
+        logger.debug("Decision: Graph is valid. End.")
         return "end_process"
     else:
         if state["current_retry"] < state["max_retries"]:
-            print(f"Decision: Validation failed. Retry {state['current_retry']}/{state['max_retries']}.")
+            logger.info(f"Decision: Validation failed. Retry {state['current_retry']}/{state['max_retries']}.")
             return "regenerate_graph"
         else:
-            print(f"Decision: Validation failed. Max retries ({state['max_retries']}) reached. End with error.")
+            logger.warning(f"Decision: Validation failed. Max retries ({state['max_retries']}) reached. End with error.")
             return "end_with_error"
 
-def build_mermaid_agent():
+def build_mermaid_agent(checkpointer=None):
+    """
+    Compiles the generate/validate graph. Pass a LangGraph checkpointer (see
+    run_checkpoints.get_checkpointer) to persist every step so runs can resume.
+    """
     workflow = StateGraph(AgentState)
 
     # workflow.add_node("clarify_logic", clarify_logic_node)
-    workflow.add_node("generate_mermaid", generate_mermaid_node)
-    workflow.add_node("validate_graph", validate_graph_node)
-    workflow.add_node("final_error_node", lambda state: print(f"--- Max retries reached. Process failed. Last error: {state.get('error_message', 'N/A')} ---") or END)
+    workflow.add_node("generate_mermaid", _timed_node("generate_mermaid", generate_mermaid_node))
+    workflow.add_node("validate_graph", _timed_node("validate_graph", validate_graph_node))
+    workflow.add_node("final_error_node", lambda state: logger.warning(f"Max retries reached. Process failed. Last error: {state.get('error_message', 'N/A')}") or {})
 
     # workflow.set_entry_point("clarify_logic")
     # workflow.add_edge("clarify_logic", "generate_mermaid")
@@ -207,36 +341,202 @@ def build_mermaid_agent():
         }
     )
 
-    app = workflow.compile()
+    workflow.add_edge("final_error_node", END)
+
+    app = workflow.compile(checkpointer=checkpointer)
     return app
 
-def run_agent(app, llm: BaseChatModel, business_logic_text: str, max_retries=3):
+class ModelTier(TypedDict, total=False):
+    name: str
+    llm: BaseChatModel
+    max_retries: int
+    input_cost_per_mtok: float  # USD per million input tokens
+    output_cost_per_mtok: float  # USD per million output tokens
+
+def estimate_cost(usage: Dict[str, int], tier: ModelTier) -> float:
+    """
+    Estimates the USD cost of a set of token counts for a tier. Cache reads are
+    billed at 10% and cache writes at 125% of the input price.
+    """
+    input_price = tier.get("input_cost_per_mtok", 0.0) / 1_000_000
+    output_price = tier.get("output_cost_per_mtok", 0.0) / 1_000_000
+    cache_read = usage.get("cache_read_tokens", 0)
+    cache_creation = usage.get("cache_creation_tokens", 0)
+    uncached_input = max(usage.get("input_tokens", 0) - cache_read - cache_creation, 0)
+    return (
+        uncached_input * input_price
+        + cache_read * input_price * 0.1
+        + cache_creation * input_price * 1.25
+        + usage.get("output_tokens", 0) * output_price
+    )
+
+class CascadeStats:
+    """Per-tier counters for a batch run, safe to share between worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, float]] = {}
+        self.rows = 0
+        self.rows_succeeded = 0
+
+    def record_tier(self, tier_name: str, success: bool, latency: float, usage: Dict[str, int], cost: float):
+        with self._lock:
+            tier = self._tiers.setdefault(tier_name, {
+                "attempts": 0, "successes": 0, "latency_seconds": 0.0,
+                "llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0,
+            })
+            tier["attempts"] += 1
+            tier["successes"] += int(success)
+            tier["latency_seconds"] += latency
+            tier["llm_calls"] += usage.get("llm_calls", 0)
+            tier["input_tokens"] += usage.get("input_tokens", 0)
+            tier["output_tokens"] += usage.get("output_tokens", 0)
+            tier["cost_usd"] += cost
+
+    def merge_tiers(self, other: "CascadeStats"):
+        """Adds the per-tier counters of `other`, but not its rows (e.g. the chunks of one chunked row)."""
+        with other._lock:
+            other_tiers = {name: dict(tier) for name, tier in other._tiers.items()}
+        with self._lock:
+            for name, other_tier in other_tiers.items():
+                tier = self._tiers.setdefault(name, {key: 0.0 if isinstance(value, float) else 0 for key, value in other_tier.items()})
+                for key, value in other_tier.items():
+                    tier[key] += value
+
+    def record_row(self, success: bool):
+        with self._lock:
+            self.rows += 1
+            self.rows_succeeded += int(success)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {}
+            for name, tier in self._tiers.items():
+                attempts = tier["attempts"] or 1
+                tiers[name] = dict(
+                    tier,
+                    success_rate=tier["successes"] / attempts,
+                    avg_latency_seconds=tier["latency_seconds"] / attempts,
+                )
+            return {
+                "rows": self.rows,
+                "rows_succeeded": self.rows_succeeded,
+                "total_cost_usd": sum(tier["cost_usd"] for tier in self._tiers.values()),
+                "tiers": tiers,
+            }
+
+def _timed_node(node_name: str, node_fn):
+    """Wraps a graph node so its wall time lands on the row's RowMetrics, when one is configured."""
+    def timed(state: AgentState, config: RunnableConfig) -> AgentState:
+        metrics = config["configurable"].get("metrics")
+        with tracing.span(f"agent.{node_name}", attempt=state.get("current_retry", 0)):
+            if metrics is None:
+                return node_fn(state, config)
+            with metrics.time_node(node_name):
+                return node_fn(state, config)
+    return timed
+
+def _run_single_model(app, llm: BaseChatModel, business_logic_text: str, max_retries: int, thread_id: str = None,
+                      metrics: RowMetrics = None, hedger: HedgedInvoker = None,
+                      validator: Callable[[str], str] = None) -> Dict[str, Any]:
     inputs = {
         "original_logic": business_logic_text,
-        "llm": llm,
         "max_retries": max_retries,
         "current_retry": 0,
-        "feedback_history": []
+        "feedback_history": [],
+        "llm_usage": []
     }
+    config = {"configurable": {"llm": llm, "metrics": metrics, "hedger": hedger, "validator": validator}}
 
-    print("\n--- Running Agent ---")
-    final_state = app.invoke(inputs)
+    if thread_id is None:
+        logger.debug("Running agent")
+        final_state = app.invoke(inputs, config)
+    else:
+        config["configurable"]["thread_id"] = thread_id
+        snapshot = app.get_state(config)
+        if snapshot.values and not snapshot.next:
+            logger.info(f"Reusing finished checkpoint {thread_id}")
+            final_state = snapshot.values
+        elif snapshot.next:
+            logger.info(f"Resuming agent from checkpoint {thread_id} at {snapshot.next}")
+            final_state = app.invoke(None, config)
+        else:
+            logger.debug("Running agent")
+            final_state = app.invoke(inputs, config)
 
-    print("\n--- Agent Finished ---")
+    logger.debug(f"Agent finished. Token usage for this row: {summarize_usage(final_state.get('llm_usage', []))}")
     if final_state.get("validation_result") == "valid":
-        print("\nSuccessfully generated and validated Mermaid graph:")
-        print(final_state["mermaid_graph"])
-        return final_state["mermaid_graph"]
+        logger.debug(f"Successfully generated and validated Mermaid graph:\n{final_state['mermaid_graph']}")
     else:
-        print("\nFailed to generate a valid Mermaid graph after retries.")
-        print(f"Last Error: {final_state.get('error_message', 'Unknown error')}")
+        logger.warning(f"Failed to generate a valid Mermaid graph after retries. Last Error: {final_state.get('error_message', 'Unknown error')}")
         if final_state.get("mermaid_graph"):
-            print("Last Attempted Graph (which failed validation):")
-            print(final_state["mermaid_graph"])
+            logger.debug(f"Last Attempted Graph (which failed validation):\n{final_state['mermaid_graph']}")
+        for i, item in enumerate(final_state.get("feedback_history", [])):
+            logger.debug(f"Feedback for attempt {i+1}:\n{item}")
 
-        print("\nReview feedback history given to LLM during retries:")
-        if final_state.get("feedback_history"):
-            for i, item in enumerate(final_state.get("feedback_history", [])):
-                print(f"Feedback for attempt {i+1}:\n{item}\n")
-        else:
-            print("No feedback history recorded (or first attempt failed).")
\ No newline at end of file
+    return final_state
+
+def run_agent(app, llm, business_logic_text: str, max_retries=3, cascade_stats: CascadeStats = None, thread_id: str = None,
+              run_metrics: RunMetrics = None, hedger: HedgedInvoker = None, validator: Callable[[str], str] = None):
+    """
+    Runs the agent for one piece of business logic.
+
+    `llm` is either a single chat model or an ordered list of ModelTier dicts,
+    cheapest first. Each tier gets its own retry budget (falling back to
+    `max_retries`), and the row escalates to the next tier only when every
+    attempt on the current tier failed local or mermaid.ink validation.
+    When `app` was built with a checkpointer, pass a `thread_id` (one per row,
+    see run_checkpoints.row_thread_id) so finished tiers are reused and an
+    interrupted tier resumes from its last completed step.
+    Pass `run_metrics` to collect per-row timings, tokens and retries, and a
+    shared `hedger` to duplicate LLM calls that run past the usual latency.
+    `validator` (code -> "Graph is valid" / "Error: ...") replaces the mermaid.ink check.
+    Returns the validated Mermaid code, or None if all tiers failed.
+    """
+    if isinstance(llm, list):
+        tiers = llm
+    else:
+        tiers = [{"name": getattr(llm, "model", None) or llm._llm_type, "llm": llm}]
+
+    row_metrics = RowMetrics(row_key=thread_id) if run_metrics is not None else None
+    row_start_time = time.perf_counter()
+    try:
+        for tier_index, tier in enumerate(tiers):
+            tier_retries = tier.get("max_retries", max_retries)
+            logger.info(f"Tier {tier_index + 1}/{len(tiers)}: {tier['name']} (max retries {tier_retries})")
+            start_time = time.perf_counter()
+            tier_thread_id = f"{thread_id}:{tier['name']}" if thread_id else None
+            with tracing.span("agent.tier", tier=tier["name"], thread_id=tier_thread_id) as tier_span:
+                final_state = _run_single_model(app, tier["llm"], business_logic_text, tier_retries, tier_thread_id, row_metrics, hedger, validator)
+                tier_span.set(attempts=final_state.get("current_retry", 0), result=final_state.get("validation_result"))
+            latency = time.perf_counter() - start_time
+
+            success = final_state.get("validation_result") == "valid"
+            usage = summarize_usage(final_state.get("llm_usage", []))
+            cost = estimate_cost(usage, tier)
+            if cascade_stats is not None:
+                cascade_stats.record_tier(tier["name"], success, latency, usage, cost)
+            if row_metrics is not None:
+                row_metrics.tier = tier["name"]
+                row_metrics.attempts += final_state.get("current_retry", 0)
+                row_metrics.cost_usd += cost
+            if success:
+                if cascade_stats is not None:
+                    cascade_stats.record_row(True)
+                if row_metrics is not None:
+                    row_metrics.outcome = "valid"
+                return final_state["mermaid_graph"]
+
+        if cascade_stats is not None:
+            cascade_stats.record_row(False)
+        if row_metrics is not None:
+            row_metrics.outcome = "failed"
+        return None
+    except Exception:
+        if row_metrics is not None:
+            row_metrics.outcome = "error"
+        raise
+    finally:
+        if row_metrics is not None:
+            row_metrics.wall_seconds = time.perf_counter() - row_start_time
+            run_metrics.add_row(row_metrics)
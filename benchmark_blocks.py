@@ -0,0 +1,215 @@
+"""
+Benchmarks the spec extraction stages over the bundled blocks/ snapshots and
+synthetic pages scaled from them.
+
+    python benchmark_blocks.py                      # all snapshots, scales 1x, 10x, 100x
+    python benchmark_blocks.py --scales 1 10 --repeat 5
+    python benchmark_blocks.py --compare benchmarks/<older>.json
+
+Results are written to benchmarks/<timestamp>_<commit>.json.
+"""
+import os
+import gc
+import glob
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+
+from config import SPEC_BLOCK_IDENTIFIER_DEFAULT
+from parse_spec_block import (
+    load_blocks_from_file, build_block_maps, find_spec_blocks, get_all_descendants_content_with_indent,
+    get_block_plain_text,
+)
+
+RESULTS_DIR = "benchmarks"
+STAGES = ["load_blocks_from_file", "build_block_maps", "find_spec_blocks", "descendants_content", "write_csv"]
+
+
+def scale_blocks(blocks: List[Dict[str, Any]], factor: int) -> List[Dict[str, Any]]:
+    """
+    Builds a synthetic page `factor` times larger by repeating the snapshot with
+    fresh block IDs. Parent links inside each copy are remapped, so every copy
+    keeps its own spec toggles and descendant trees.
+    """
+    if factor == 1:
+        return blocks
+    block_ids = {block["id"] for block in blocks if "id" in block}
+    scaled = []
+    for copy_index in range(factor):
+        suffix = f"-x{copy_index}"
+        for block in blocks:
+            new_block = dict(block)
+            if "id" in block:
+                new_block["id"] = block["id"] + suffix
+            parent = dict(block.get("parent", {}))
+            if parent.get("block_id") in block_ids:
+                parent["block_id"] = parent["block_id"] + suffix
+            new_block["parent"] = parent
+            scaled.append(new_block)
+    return scaled
+
+
+def _run_stages(blocks_path: str, csv_path: str) -> Tuple[Dict[str, Callable[[], Any]], Dict[str, Any]]:
+    """Stage callables sharing intermediate results, executed in STAGES order."""
+    results: Dict[str, Any] = {}
+
+    def load():
+        results["blocks"] = load_blocks_from_file(blocks_path)
+
+    def maps():
+        results["maps"] = build_block_maps(results["blocks"])
+
+    def specs():
+        results["specs"] = find_spec_blocks(results["blocks"], SPEC_BLOCK_IDENTIFIER_DEFAULT, {})
+
+    def descendants():
+        all_blocks_map, blocks_by_parent_id = results["maps"]
+        rows = []
+        for spec_block in results["specs"]:
+            rows.append({
+                "block_name": get_block_plain_text(spec_block, {}).replace(SPEC_BLOCK_IDENTIFIER_DEFAULT, "").strip(),
+                "block_content": get_all_descendants_content_with_indent(
+                    spec_block["id"], spec_block.get("level", 0), all_blocks_map, blocks_by_parent_id, {}
+                ),
+            })
+        results["rows"] = rows
+
+    def write_csv():
+        pd.DataFrame(results["rows"], columns=["block_name", "block_content"]).to_csv(csv_path, index=False, encoding="utf-8")
+
+    return dict(zip(STAGES, [load, maps, specs, descendants, write_csv])), results
+
+
+def benchmark_page(blocks_path: str, repeat: int, measure_memory: bool = True) -> Dict[str, Any]:
+    csv_path = os.path.join(tempfile.gettempdir(), "benchmark_spec_block_contents.csv")
+    seconds: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    for _ in range(repeat):
+        stages, results = _run_stages(blocks_path, csv_path)
+        for stage, run in stages.items():
+            gc.collect()
+            start_time = time.perf_counter()
+            run()
+            seconds[stage].append(time.perf_counter() - start_time)
+
+    # Memory is measured in a separate pass: tracemalloc slows Python down too much to time under it.
+    peak_bytes: Dict[str, int] = {stage: 0 for stage in STAGES}
+    if measure_memory:
+        stages, results = _run_stages(blocks_path, csv_path)
+        for stage, run in stages.items():
+            gc.collect()
+            tracemalloc.start()
+            run()
+            peak_bytes[stage] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        "file_bytes": os.path.getsize(blocks_path),
+        "blocks": len(results["blocks"]),
+        "spec_blocks": len(results["specs"]),
+        "stages": {
+            stage: {
+                "median_seconds": statistics.median(seconds[stage]),
+                "min_seconds": min(seconds[stage]),
+                "peak_memory_bytes": peak_bytes[stage],
+            }
+            for stage in STAGES
+        },
+        "total_median_seconds": sum(statistics.median(seconds[stage]) for stage in STAGES),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Lists stages whose median time or peak memory grew by more than `threshold` (e.g. 0.1 = 10%)."""
+    regressions = []
+    for page, page_result in current["pages"].items():
+        baseline_page = baseline.get("pages", {}).get(page)
+        if not baseline_page:
+            continue
+        for stage, stage_result in page_result["stages"].items():
+            baseline_stage = baseline_page["stages"].get(stage)
+            if not baseline_stage:
+                continue
+            for metric in ("median_seconds", "peak_memory_bytes"):
+                before, after = baseline_stage[metric], stage_result[metric]
+                if before and (after - before) / before > threshold:
+                    regressions.append(f"{page} {stage} {metric}: {before:.6g} -> {after:.6g} (+{(after - before) / before:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark spec extraction over blocks/ snapshots.")
+    parser.add_argument("--blocks-glob", default="blocks/*_all_blocks.txt")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help=f"Result file (defaults to {RESULTS_DIR}/<timestamp>_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative growth reported as a regression")
+    parser.add_argument("--skip-memory", action="store_true", help="Only time the stages (the tracemalloc pass is slow at 100x)")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "repeat": args.repeat,
+        "pages": {},
+    }
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for snapshot_path in sorted(glob.glob(args.blocks_glob)):
+            page_id = os.path.basename(snapshot_path).replace("_all_blocks.txt", "")
+            snapshot_blocks = load_blocks_from_file(snapshot_path)
+            for factor in args.scales:
+                if factor == 1:
+                    blocks_path = snapshot_path
+                else:
+                    blocks_path = os.path.join(scratch_dir, f"{page_id}_x{factor}_all_blocks.txt")
+                    with open(blocks_path, "w", encoding="utf-8") as f:
+                        f.write(str(scale_blocks(snapshot_blocks, factor)))
+                name = f"{page_id}@x{factor}"
+                result = benchmark_page(blocks_path, args.repeat, measure_memory=not args.skip_memory)
+                report["pages"][name] = result
+                print(f"{name}: {result['blocks']} blocks, {result['spec_blocks']} specs, "
+                      f"{result['total_median_seconds'] * 1000:.1f} ms total")
+                for stage, stage_result in result["stages"].items():
+                    print(f"    {stage:<22} {stage_result['median_seconds'] * 1000:9.2f} ms "
+                          f"{stage_result['peak_memory_bytes'] / 1024 / 1024:9.2f} MiB peak")
+
+    output_path = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}_{commit}.json"
+    )
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions against {baseline.get('commit', args.compare)}:")
+            for line in regressions:
+                print(f"    {line}")
+            raise SystemExit(1)
+        print(f"No regressions against {baseline.get('commit', args.compare)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Optional pipeline stage: converts the `💡 BUSINESS_FUNCTION_VALUE` sections of
+a crawled page into `💡TECHNICAL_FUNCTION_VALUE` specs with BUSINESS_2_TECH_PROMPT,
+and hands them to Mermaid generation as the page's spec blocks - without writing
+the technical blocks back to Notion first.
+
+Each outermost business section is rendered to the Markdown the prompt expects
+(nested sections stay inside their parent, as the prompt requires) and
+converted once: results are cached in tech_specs/<sha256>.md, keyed by the
+prompt and the section's Markdown, so unchanged sections cost nothing on later
+runs. Sections are converted concurrently, with LLM calls spaced to stay under
+`requests_per_minute`.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from parse_spec_block import load_blocks_from_file, build_block_maps, find_spec_blocks
+from notion_utils import extract_table_data
+from file_cache import SingleFlight, atomic_write_text, atomic_write_csv
+from config import SPEC_BLOCK_IDENTIFIER_DEFAULT
+from prompts import BUSINESS_2_TECH_PROMPT
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Title prefix of the business-function toggles the prompt converts.
+BUSINESS_FUNCTION_IDENTIFIER = "💡 BUSINESS_FUNCTION_VALUE:"
+# One Markdown file per converted section, named by its cache key.
+TECH_SPEC_CACHE_DIR = "tech_specs"
+# Sections converted at once, and the LLM request rate they share.
+CONVERSION_WORKERS = 4
+CONVERSION_REQUESTS_PER_MINUTE = 60
+
+# `- 💡TECHNICAL_FUNCTION_VALUE: Name`, as in the prompt's example output (models sometimes add a space after the emoji).
+_TECHNICAL_HEADING_RE = re.compile(r"^[\s\-*]*💡\s*TECHNICAL_FUNCTION_VALUE:\s*(.*)$")
+# Parts of the technical Markdown that describe the spec rather than its logic.
+_TABLE_LINE_RE = re.compile(r"^\s*\|")
+_SECTION_LABEL_RE = re.compile(r"^\s*(?:Parameter|Prompts|API:.*)\s*$")
+_FENCE_RE = re.compile(r"^\s*```")
+
+
+class RateLimiter:
+    """Spaces calls at least 60 / requests_per_minute seconds apart across all threads."""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _segments_markdown(segments: List[Dict[str, Any]], params: Dict[str, Dict[str, Any]]) -> str:
+    """Rich text as Markdown; mentions become `[name](link)`, ERP parameters under their API parameter name."""
+    text = ""
+    for segment in segments:
+        if segment.get("type") == "mention":
+            mention = segment.get("mention", {})
+            target = mention.get(mention.get("type"), {})
+            param = params.get(target.get("id", "").replace("-", ""), {}) if isinstance(target, dict) else {}
+            name = param.get("API Parameter Name") or param.get("Name") or segment.get("plain_text", "")
+            link = param.get("ERP Link") or segment.get("href")
+            text += f"[{name}]({link})" if link else f"[{name}]"
+        else:
+            text += segment.get("plain_text", "")
+    return text
+
+
+def blocks_to_markdown(block_id: str, blocks_by_parent_id: Dict[str, List[Dict[str, Any]]],
+                       params: Dict[str, Dict[str, Any]], depth: int = 0) -> List[str]:
+    """Markdown lines for the descendants of a block, indented four spaces per level."""
+    lines = []
+    indent = "    " * depth
+    for child in blocks_by_parent_id.get(block_id, []):
+        child_type = child.get("type")
+        content = child.get(child_type) if isinstance(child.get(child_type), dict) else {}
+        if child_type == "table_row":
+            cells = [_segments_markdown(cell, params).strip() for cell in content.get("cells", [])]
+            lines.append(f"{indent}| {' | '.join(cells)} |")
+            continue
+        text = _segments_markdown(content.get("rich_text", []), params)
+        prefix = {"quote": "> ", "bulleted_list_item": "- ", "numbered_list_item": "1. ", "toggle": "- ",
+                  "to_do": "- [ ] ", "heading_1": "# ", "heading_2": "## ", "heading_3": "### "}.get(child_type, "")
+        if child_type == "code":
+            lines.extend([f"{indent}```", *(f"{indent}{line}" for line in text.splitlines()), f"{indent}```"])
+        elif text.strip():
+            lines.extend(f"{indent}{prefix}{line}" for line in text.splitlines())
+        lines.extend(blocks_to_markdown(child["id"], blocks_by_parent_id, params, depth + 1))
+    return lines
+
+
+def business_sections(all_blocks: List[Dict[str, Any]], params: Dict[str, Dict[str, Any]],
+                      identifier: str = BUSINESS_FUNCTION_IDENTIFIER) -> List[Tuple[str, str]]:
+    """(block id, Markdown) of every business section that is not nested in another one, in page order."""
+    all_blocks_map, blocks_by_parent_id = build_block_maps(all_blocks)
+    section_blocks = find_spec_blocks(all_blocks, identifier, params)
+    section_ids = {block["id"] for block in section_blocks}
+
+    def nested(block: Dict[str, Any]) -> bool:
+        parent_id = block.get("parent", {}).get("block_id")
+        while parent_id:
+            if parent_id in section_ids:
+                return True
+            parent_id = all_blocks_map.get(parent_id, {}).get("parent", {}).get("block_id")
+        return False
+
+    sections = []
+    for block in section_blocks:
+        if nested(block):
+            continue
+        title = _segments_markdown(block.get("toggle", {}).get("rich_text", []), params).strip()
+        body = blocks_to_markdown(block["id"], blocks_by_parent_id, params, depth=1)
+        sections.append((block["id"], "\n".join([f"- {title}", *body])))
+    return sections
+
+
+def parse_technical_sections(markdown: str) -> List[Tuple[str, str]]:
+    """
+    (name, logic) per `💡TECHNICAL_FUNCTION_VALUE:` heading of the converted Markdown. The logic keeps the
+    conditions, comments and values, indented like block_content; the Parameter / Prompts tables and API line are left out.
+    """
+    sections: List[Tuple[str, List[str]]] = []
+    for line in markdown.splitlines():
+        heading = _TECHNICAL_HEADING_RE.match(line)
+        if heading:
+            sections.append((heading.group(1).strip(), []))
+            continue
+        if not sections or not line.strip() or _TABLE_LINE_RE.match(line) or _SECTION_LABEL_RE.match(line) or _FENCE_RE.match(line):
+            continue
+        sections[-1][1].append(line.rstrip())
+
+    parsed = []
+    for name, lines in sections:
+        margin = min((len(line) - len(line.lstrip()) for line in lines), default=0)
+        parsed.append((name, "\n".join("\t" + line[margin:] for line in lines)))
+    return parsed
+
+
+class BusinessConverter:
+    """
+    Converts business sections with one chat model. Shared by every job of the process:
+    the rate limit, the cache and the deduplication of identical in-flight sections apply across jobs.
+    """
+
+    def __init__(self, llm, max_workers: int = CONVERSION_WORKERS, requests_per_minute: float = CONVERSION_REQUESTS_PER_MINUTE,
+                 cache_dir: str = TECH_SPEC_CACHE_DIR):
+        self.llm = llm
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self._flights = SingleFlight()
+
+    def cache_key(self, markdown: str) -> str:
+        return hashlib.sha256(f"{BUSINESS_2_TECH_PROMPT}\x00{markdown}".encode("utf-8")).hexdigest()
+
+    def convert(self, markdown: str) -> Tuple[str, bool]:
+        """(technical Markdown, whether it was reused - from the cache or a concurrent identical call) for one business section."""
+        key = self.cache_key(markdown)
+        cache_path = os.path.join(self.cache_dir, f"{key}.md")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read(), True
+        technical, shared = self._flights.do_shared(key, lambda: self._convert_uncached(markdown, cache_path))
+        return technical, shared
+
+    @tracing.traced("business.convert_section")
+    def _convert_uncached(self, markdown: str, cache_path: str) -> str:
+        from langchain_core.messages import HumanMessage
+
+        self.rate_limiter.acquire()
+        response = self.llm.invoke([HumanMessage(content=f"{BUSINESS_2_TECH_PROMPT}\n\n**Input**:\n{markdown}\n\n**Output**:\n")])
+        technical = response.content.strip()
+        if not parse_technical_sections(technical):
+            raise ValueError(f"Conversion has no {SPEC_BLOCK_IDENTIFIER_DEFAULT} section")
+        atomic_write_text(cache_path, technical)
+        return technical
+
+    def convert_blocks(self, all_blocks: List[Dict[str, Any]], params: Dict[str, Dict[str, Any]],
+                       identifier: str = BUSINESS_FUNCTION_IDENTIFIER) -> Tuple[pd.DataFrame, Dict[str, int]]:
+        """
+        Spec DataFrame (block_name, block_content) of every technical section converted from the
+        business sections of `all_blocks`, in page order, and conversion counts. A section that
+        fails to convert is logged and left out; a technical name seen twice keeps its first logic.
+        """
+        sections = business_sections(all_blocks, params, identifier)
+        stats = {"sections": len(sections), "cached": 0, "converted": 0, "failed": 0}
+        stats_lock = threading.Lock()
+
+        def convert_section(section: Tuple[str, str]) -> Optional[str]:
+            block_id, markdown = section
+            try:
+                technical, cached = self.convert(markdown)
+            except Exception as e:
+                logger.error(f"Could not convert business section {block_id}: {str(e)}")
+                technical, cached = None, None
+            with stats_lock:
+                stats["failed" if technical is None else "cached" if cached else "converted"] += 1
+            return technical
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix="business-convert") as executor:
+            conversions = list(executor.map(tracing.propagate(convert_section), sections))
+
+        rows, seen = [], set()
+        for technical in conversions:
+            for name, logic in parse_technical_sections(technical or ""):
+                if name in seen:
+                    continue
+                seen.add(name)
+                rows.append({"block_name": name, "block_content": logic})
+        logger.info(f"Business conversion: {stats}, {len(rows)} technical specs")
+        return pd.DataFrame(rows, columns=["block_name", "block_content"]), stats
+
+    @tracing.traced("business.convert_page")
+    def convert_page(self, block_identifier: str, page_id: str, table_page_id: str, notion_client: Any,
+                     run_state: Dict[str, Any] = None):
+        """
+        Drop-in for parse_spec_block.process_spec_blocks: reads blocks/<page_id>_all_blocks.txt, converts the
+        sections titled `block_identifier` and writes the technical specs to <page_id>_spec_block_contents.csv.
+        Returns [] for an empty snapshot and None when it has no business sections, like process_spec_blocks.
+        """
+        tracing.current_span().set(page_id=page_id, table_id=table_page_id)
+        all_blocks = load_blocks_from_file(f"blocks/{page_id}_all_blocks.txt")
+        if not all_blocks:
+            return all_blocks
+        params = extract_table_data(table_page_id, notion_client)
+        df, stats = self.convert_blocks(all_blocks, params, block_identifier)
+        if run_state is not None:
+            run_state["business_conversion"] = stats
+        if stats["sections"] == 0:
+            logger.warning(f"No business sections found with identifier '{block_identifier}'")
+            return None
+        atomic_write_csv(df, f"{page_id}_spec_block_contents.csv", index=False)
+        return df
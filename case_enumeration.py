@@ -0,0 +1,652 @@
+"""
+Deterministic test-case enumeration for spec blocks: the variable-state
+combinations that CASES_LISTING_PROMPT asks an LLM for, computed by walking
+the block's validated Mermaid decision graph (or, without one, the if/else
+tree of its block_content) with a memoized depth-first search.
+
+    python case_enumeration.py 1ef7432eb8438081be51f2ec9121f6bd
+    python case_enumeration.py 1ef7432eb8438081be51f2ec9121f6bd --block "Pregnancy flow."
+    python case_enumeration.py 1ef7432eb8438081be51f2ec9121f6bd --llm-fallback --max-cases 64
+
+Cases follow the prompt's format: one JSON object per path through the logic,
+mapping each variable on the path to its state ("missing", a literal, true/false,
+or a placeholder such as "another_value" for `!=` constraints). Contradictory
+paths are dropped and duplicates are emitted once. The LLM prompt is only used,
+when a model is given, for blocks whose logic cannot be parsed.
+"""
+import re
+import json
+import argparse
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from file_cache import atomic_open
+from mermaid_ir import MermaidGraph, SHAPE_NAMES, load_graph
+from prompts import CASES_LISTING_PROMPT
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on cases per block; graphs with combinatorial fan-out are cut off here and flagged as truncated.
+MAX_CASES = 256
+# Bulk exports live next to the graphs cache.
+CASES_DIR = "graphs"
+CASES_SUFFIX = "_cases.jsonl"
+
+# Placeholders for states the logic constrains without naming a value (see CASES_LISTING_PROMPT).
+PRESENT_VALUE = "present_value"
+OTHER_VALUE = "another_value"
+MISSING_VALUE = "missing"
+
+# Where a block's cases came from.
+SOURCE_GRAPH = "graph"
+SOURCE_CONTENT = "content"
+SOURCE_LLM = "llm"
+SOURCE_NONE = "none"
+
+# Edge labels of a yes/no decision (`{"x == CC?"}`), and catch-all branches of a value decision (`{"x?"}`).
+YES_LABELS = {"yes", "y", "true", "valid"}
+NO_LABELS = {"no", "n", "false", "invalid"}
+OTHER_LABELS = {"other", "others", "else", "otherwise", "default"}
+# Words that mean "no value" on the right-hand side of a comparison.
+MISSING_WORDS = {"missing", "null", "none", "empty", "nil", "undefined"}
+
+_NEGATED_OPS = {"==": "!=", "!=": "==", "<": ">=", ">=": "<", ">": "<=", "<=": ">", "missing": "present", "present": "missing"}
+_MARKDOWN_LINK_RE = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_IF_KEYWORD_RE = re.compile(r"\b(?:else\s+if|elif|if)\b", re.IGNORECASE)
+# `if {x == 1} -> outcome`: the outcome is not part of the condition.
+_OUTCOME_RE = re.compile(r"\s*->.*$")
+_SPLIT_RE = re.compile(r"(\(|\)|&&|\|\||&|\||\b(?:and|or)\b)", re.IGNORECASE)
+_LOGICAL_TOKENS = {"&&": "and", "&": "and", "and": "and", "||": "or", "|": "or", "or": "or"}
+# `var == value`, `[Variable Name] != value`, `var is not missing`; the value runs up to the next comparison.
+_COMPARISON_RE = re.compile(
+    r"(\[[^\]]+\]|[A-Za-z_][\w.\-]*)\s*(==|!=|>=|<=|=|>|<|\bis\s+not\b|\bis\b)\s*", re.IGNORECASE,
+)
+_OPERATOR_PREFIX_RE = re.compile(r"^\s*(==|!=|>=|<=|=|>|<)")
+_LINE_KIND_RE = re.compile(r"^(else\s+if|elif|if|else)\b[\s:]*", re.IGNORECASE)
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class ConditionParseError(ValueError):
+    """The condition text does not fit the comparison grammar (`var op value` joined by and/or and parentheses)."""
+
+
+# A condition tree is ("atom", (variable, op, value)), ("and", [children]), ("or", [children]) or ("not", child).
+Atom = Tuple[str, str, Any]
+
+
+def _literal(text: str) -> Any:
+    value = text.strip().strip('"\'`“”').strip()
+    lowered = value.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _variable_name(text: str) -> str:
+    return text.strip().strip("[]").strip()
+
+
+def _comparison(variable: str, op: str, value_text: str) -> Atom:
+    op = op.lower()
+    op = re.sub(r"\s+", " ", op)
+    value = _literal(value_text)
+    no_value = isinstance(value, str) and value.lower() in MISSING_WORDS
+    if op in ("is", "is not"):
+        if no_value:
+            return variable, "missing" if op == "is" else "present", None
+        op = "==" if op == "is" else "!="
+    if op == "=":
+        op = "=="
+    if no_value and op in ("==", "!="):
+        return variable, "missing" if op == "==" else "present", None
+    return variable, op, value
+
+
+def _parse_comparisons(chunk: str) -> Optional[tuple]:
+    """Atoms of a chunk without logical operators; several comparisons in one chunk are ANDed. None for a bare value."""
+    matches = list(_COMPARISON_RE.finditer(chunk))
+    if not matches:
+        return None
+    if chunk[:matches[0].start()].strip():
+        raise ConditionParseError(f"Unexpected text before comparison: {chunk!r}")
+    atoms = []
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        value_text = chunk[match.end():next_match.start() if next_match else len(chunk)]
+        if not value_text.strip():
+            raise ConditionParseError(f"Comparison without a value: {chunk!r}")
+        atoms.append(("atom", _comparison(_variable_name(match.group(1)), match.group(2), value_text)))
+    return atoms[0] if len(atoms) == 1 else ("and", atoms)
+
+
+class _ConditionParser:
+    """Recursive descent over `or` > `and` > parenthesized groups; a bare value after `or` reuses the previous comparison."""
+
+    def __init__(self, text: str):
+        text = _MARKDOWN_LINK_RE.sub(r"[\1]", text).replace("{", "(").replace("}", ")")
+        text = _OUTCOME_RE.sub("", _IF_KEYWORD_RE.sub(" ", text)).strip().rstrip(":").strip()
+        self.tokens = [token.strip() for token in _SPLIT_RE.split(text) if token and token.strip()]
+        self.position = 0
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            raise ConditionParseError("Empty condition")
+        node = self._parse_or()
+        if self.position != len(self.tokens):
+            raise ConditionParseError(f"Unexpected {self.tokens[self.position]!r}")
+        return node
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _logical(self) -> Optional[str]:
+        token = self._peek()
+        return _LOGICAL_TOKENS.get(token.lower()) if token else None
+
+    def _parse_or(self) -> tuple:
+        children = [self._parse_and()]
+        while self._logical() == "or":
+            self.position += 1
+            child = self._parse_and()
+            if child[0] == "bare":
+                previous = _last_atom(children[-1])
+                if previous is None:
+                    raise ConditionParseError(f"Value {child[1]!r} without a comparison")
+                child = ("atom", _comparison(previous[0], previous[1] if previous[1] in ("==", "!=") else "==", child[1]))
+            children.append(child)
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def _parse_and(self) -> tuple:
+        children = [self._parse_group()]
+        while self._logical() == "and":
+            self.position += 1
+            children.append(self._parse_group())
+        if len(children) == 1:
+            return children[0]
+        if any(child[0] == "bare" for child in children):
+            raise ConditionParseError(f"Value without a comparison in {self.tokens!r}")
+        return ("and", children)
+
+    def _parse_group(self) -> tuple:
+        token = self._peek()
+        if token is None or self._logical() or token == ")":
+            raise ConditionParseError(f"Expected a comparison, got {token!r}")
+        self.position += 1
+        if token == "(":
+            node = self._parse_or()
+            if self._peek() != ")":
+                raise ConditionParseError("Unbalanced parentheses")
+            self.position += 1
+            return node
+        node = _parse_comparisons(token)
+        return node if node is not None else ("bare", token)
+
+
+def _last_atom(node: tuple) -> Optional[Atom]:
+    if node[0] == "atom":
+        return node[1]
+    if node[0] in ("and", "or"):
+        return _last_atom(node[1][-1])
+    return None
+
+
+def parse_condition(text: str) -> tuple:
+    """Condition tree of one if/else-if condition, e.g. `maidHasBed == false && (maidStatus == No Show)`."""
+    node = _ConditionParser(text).parse()
+    if node[0] == "bare":
+        raise ConditionParseError(f"No comparison in {text!r}")
+    return node
+
+
+def _negate_atom(atom: Atom) -> Atom:
+    variable, op, value = atom
+    return variable, _NEGATED_OPS[op], value
+
+
+def _value_key(value: Any) -> Any:
+    return value.lower() if isinstance(value, str) else value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _bounded_value(bounds: List[Tuple[str, Any]]) -> Any:
+    """A number satisfying every <, <=, >, >= bound, None when they contradict; non-numeric bounds are kept as text."""
+    if not all(_is_number(value) for _, value in bounds):
+        return " and ".join(f"{op} {value}" for op, value in bounds)
+    candidates = []
+    for op, value in bounds:
+        candidates.extend({"<": [value - 1], "<=": [value], ">": [value + 1], ">=": [value]}[op])
+    lows = [value for op, value in bounds if op in (">", ">=")]
+    highs = [value for op, value in bounds if op in ("<", "<=")]
+    if lows and highs:
+        candidates.append((max(lows) + min(highs)) / 2)
+    for candidate in candidates:
+        if all(_satisfies(candidate, op, value) for op, value in bounds):
+            return candidate
+    return None
+
+
+def _satisfies(candidate: Any, op: str, value: Any) -> bool:
+    return {"<": candidate < value, "<=": candidate <= value, ">": candidate > value, ">=": candidate >= value}[op]
+
+
+def case_from_atoms(atoms: Tuple[Atom, ...]) -> Optional[Dict[str, Any]]:
+    """Variable -> state for a conjunction of comparisons, in order of first mention; None when they contradict."""
+    constraints: Dict[str, Dict[str, Any]] = {}
+    for variable, op, value in atoms:
+        constraint = constraints.setdefault(variable, {"eq": {}, "neq": set(), "bounds": [], "missing": False, "present": False})
+        if op == "==":
+            constraint["eq"][_value_key(value)] = value
+        elif op == "!=":
+            constraint["neq"].add(_value_key(value))
+        elif op == "missing":
+            constraint["missing"] = True
+        elif op == "present":
+            constraint["present"] = True
+        else:
+            constraint["bounds"].append((op, value))
+
+    case = {}
+    for variable, constraint in constraints.items():
+        eq, neq, bounds = constraint["eq"], constraint["neq"], constraint["bounds"]
+        if constraint["missing"]:
+            if eq or neq or bounds or constraint["present"]:
+                return None
+            case[variable] = MISSING_VALUE
+        elif eq:
+            if len(eq) > 1 or next(iter(eq)) in neq:
+                return None
+            value = next(iter(eq.values()))
+            if bounds and not (_is_number(value) and all(_is_number(bound) and _satisfies(value, op, bound) for op, bound in bounds)):
+                return None
+            case[variable] = value
+        elif bounds:
+            value = _bounded_value(bounds)
+            if value is None or _value_key(value) in neq:
+                return None
+            case[variable] = value
+        elif neq and neq <= {True, False}:
+            if len(neq) == 2:
+                return None
+            case[variable] = not next(iter(neq))
+        elif neq:
+            case[variable] = OTHER_VALUE
+        else:
+            case[variable] = PRESENT_VALUE
+    return case
+
+
+def _case_items(case: Dict[str, Any]) -> set:
+    return {(variable, type(value).__name__, value) for variable, value in case.items()}
+
+
+def absorb(conjunctions: List[Tuple[Atom, ...]]) -> List[Tuple[Atom, ...]]:
+    """
+    Drops contradictory conjunctions and those whose case only adds variables to
+    another's (`{a: missing, b: true}` next to `{a: missing}`), keeping the minimal
+    cases of one condition. Order is kept.
+    """
+    cases = [(conjunction, case_from_atoms(conjunction)) for conjunction in conjunctions]
+    cases = [(conjunction, _case_items(case)) for conjunction, case in cases if case is not None]
+    kept = []
+    for conjunction, items in cases:
+        if any(other <= items for _, other in kept):
+            continue
+        kept = [(earlier, other) for earlier, other in kept if not items < other]
+        kept.append((conjunction, items))
+    return [conjunction for conjunction, _ in kept]
+
+
+class CaseEnumerator:
+    """
+    Enumerates the cases of one block. Sub-results are memoized per graph node, so
+    a decision reached by several branches is expanded once; every list is capped
+    at `max_cases`, and `truncated` records whether the cap cut anything off.
+    """
+
+    def __init__(self, max_cases: int = MAX_CASES):
+        self.max_cases = max_cases
+        self.truncated = False
+        self.source = SOURCE_NONE
+
+    def _cap(self, conjunctions: Iterator[Tuple[Atom, ...]]) -> List[Tuple[Atom, ...]]:
+        capped = list(islice(conjunctions, self.max_cases + 1))
+        if len(capped) > self.max_cases:
+            self.truncated = True
+            capped.pop()
+        return capped
+
+    def _dnf(self, node: tuple, negate: bool = False) -> List[Tuple[Atom, ...]]:
+        """The condition as a list of conjunctions (disjunctive normal form), without contradictory ones."""
+        kind = node[0]
+        if kind == "atom":
+            return [(_negate_atom(node[1]) if negate else node[1],)]
+        if kind == "not":
+            return self._dnf(node[1], not negate)
+        if (kind == "or") != negate:
+            return self._cap(conjunction for child in node[1] for conjunction in self._dnf(child, negate))
+        return self._product([self._dnf(child, negate) for child in node[1]])
+
+    def _product(self, alternatives: List[List[Tuple[Atom, ...]]]) -> List[Tuple[Atom, ...]]:
+        combined = [()]
+        for options in alternatives:
+            combined = self._cap(
+                left + right for left in combined for right in options if case_from_atoms(left + right) is not None
+            )
+        return combined
+
+    def _emit(self, conjunctions: Iterator[Tuple[Atom, ...]]) -> Iterator[Dict[str, Any]]:
+        seen = set()
+        for conjunction in conjunctions:
+            case = case_from_atoms(conjunction)
+            if case is None:
+                continue
+            key = json.dumps(case, sort_keys=True, default=str)
+            if key in seen:
+                continue
+            if len(seen) == self.max_cases:
+                self.truncated = True
+                return
+            seen.add(key)
+            yield case
+
+    # Mermaid decision graphs
+
+    def graph_cases(self, graph: MermaidGraph) -> Iterator[Dict[str, Any]]:
+        """Cases for every start-to-leaf path of the graph; edges out of rhombus nodes carry the conditions."""
+        rhombus = SHAPE_NAMES.index("rhombus")
+        out_edges: List[List[int]] = [[] for _ in range(graph.node_count)]
+        has_incoming = [False] * graph.node_count
+        for edge in range(graph.edge_count):
+            out_edges[graph.edge_src[edge]].append(edge)
+            has_incoming[graph.edge_dst[edge]] = True
+        roots = [node for node in range(graph.node_count) if not has_incoming[node]] or [0]
+        memo: Dict[int, List[Tuple[Atom, ...]]] = {}
+        visiting = set()
+
+        def branch_conjunctions(node: int, edge: int) -> List[Tuple[Atom, ...]]:
+            if graph.node_shape[node] != rhombus:
+                return [()]
+            siblings = [graph.edge_text(sibling) for sibling in out_edges[node]]
+            return self._branch_conjunctions(graph.node_text(node), graph.edge_text(edge), siblings)
+
+        def expand(node: int) -> Iterator[Tuple[Atom, ...]]:
+            if not out_edges[node]:
+                yield ()
+                return
+            for edge in out_edges[node]:
+                target = graph.edge_dst[edge]
+                # A back edge ends the path instead of looping.
+                rest_paths = [()] if target in visiting else paths(target)
+                for branch in branch_conjunctions(node, edge):
+                    for rest in rest_paths:
+                        if case_from_atoms(branch + rest) is not None:
+                            yield branch + rest
+
+        def paths(node: int) -> List[Tuple[Atom, ...]]:
+            if node not in memo:
+                visiting.add(node)
+                try:
+                    memo[node] = self._cap(expand(node))
+                finally:
+                    visiting.discard(node)
+            return memo[node]
+
+        def root_paths() -> Iterator[Tuple[Atom, ...]]:
+            for root in roots:
+                visiting.add(root)
+                try:
+                    yield from expand(root)
+                finally:
+                    visiting.discard(root)
+
+        return self._emit(root_paths())
+
+    def _branch_conjunctions(self, question: str, edge_label: Optional[str], siblings: List[Optional[str]]) -> List[Tuple[Atom, ...]]:
+        """Constraints for taking the branch `edge_label` out of the decision `question`."""
+        question = question.strip().rstrip("?").strip().strip('"')
+        label = edge_label.strip().strip('"') if edge_label else None
+        if not label:
+            return [()]
+        try:
+            condition = parse_condition(question)
+        except ConditionParseError:
+            condition = None
+
+        if condition is not None:
+            if label.lower() in YES_LABELS:
+                return absorb(self._dnf(condition))
+            if label.lower() in NO_LABELS or label.lower() in OTHER_LABELS:
+                return absorb(self._dnf(condition, negate=True))
+            return [()]
+
+        variable = _variable_name(question)
+        if label.lower() in OTHER_LABELS:
+            named = [sibling.strip().strip('"') for sibling in siblings if sibling and sibling.strip().strip('"').lower() not in OTHER_LABELS]
+            return [tuple((variable, "!=", _literal(sibling)) for sibling in named if not sibling.lower().startswith("not "))]
+        if label.lower().startswith("not "):
+            return [((variable, "!=", _literal(label[4:])),)]
+        if _OPERATOR_PREFIX_RE.match(label):
+            text = f"[{variable}] {label}"
+        else:
+            text = f"[{variable}] == {label}"
+        try:
+            return self._dnf(parse_condition(text))
+        except ConditionParseError:
+            return [(_comparison(variable, "==", label),)]
+
+    # block_content condition trees
+
+    def content_cases(self, block_content: str) -> Iterator[Dict[str, Any]]:
+        """
+        Cases for the if / else if / else lines of block_content, nested by indentation:
+        each innermost condition yields its own condition ANDed with its ancestors'.
+        `else if` and `else` also negate the earlier branches of their chain.
+        Raises ConditionParseError right away for a condition line that does not parse.
+        """
+        roots = _parse_condition_tree(block_content)
+        leaf_conditions = list(_leaf_conditions(roots, []))
+
+        def conjunctions() -> Iterator[Tuple[Atom, ...]]:
+            for condition in leaf_conditions:
+                yield from absorb(self._dnf(condition))
+
+        return self._emit(conjunctions())
+
+    # Whole blocks
+
+    def block_cases(self, block_content: Any, mermaid_graph: Any = None, graph_ir: Any = None, llm=None) -> Iterator[Dict[str, Any]]:
+        """
+        Cases from the block's graph when it has decisions, else from block_content,
+        else (with `llm`) from CASES_LISTING_PROMPT. Sets `source` to the one used.
+        """
+        graph = load_graph(mermaid_graph, graph_ir)
+        if graph is not None and SHAPE_NAMES.index("rhombus") in graph.node_shape:
+            self.source = SOURCE_GRAPH
+            return self.graph_cases(graph)
+
+        content = block_content if isinstance(block_content, str) else ""
+        try:
+            cases = self.content_cases(content)
+            self.source = SOURCE_CONTENT
+            return cases
+        except ConditionParseError as e:
+            if llm is None:
+                raise
+            logger.info(f"Falling back to the LLM for unparseable logic: {str(e)}")
+        self.source = SOURCE_LLM
+        cases = llm_cases(llm, content)
+        self.truncated = len(cases) > self.max_cases
+        return iter(cases[:self.max_cases])
+
+
+class _ConditionLine:
+    def __init__(self, indent: int, kind: str, condition: Optional[tuple]):
+        self.indent = indent
+        self.kind = kind
+        self.condition = condition
+        self.children: List["_ConditionLine"] = []
+
+
+def _parse_condition_tree(block_content: str) -> List[_ConditionLine]:
+    """if / else if / else lines as a tree by indentation; 💡 section headers are transparent, other lines are outcomes."""
+    root = _ConditionLine(-1, "root", None)
+    stack = [root]
+    for raw_line in str(block_content).splitlines():
+        if not raw_line.strip():
+            continue
+        stripped = raw_line.lstrip()
+        indent = len(raw_line[:len(raw_line) - len(stripped)].expandtabs(4))
+        match = _LINE_KIND_RE.match(stripped)
+        if match:
+            kind = re.sub(r"\s+", " ", match.group(1).lower()).replace("elif", "else if")
+            condition = None if kind == "else" else parse_condition(stripped[match.end():])
+            line = _ConditionLine(indent, kind, condition)
+        elif "BUSINESS_FUNCTION_VALUE" in stripped:
+            line = _ConditionLine(indent, "section", None)
+        else:
+            continue
+        while stack[-1].indent >= indent:
+            stack.pop()
+        stack[-1].children.append(line)
+        stack.append(line)
+    return root.children
+
+
+def _leaf_conditions(lines: List[_ConditionLine], ancestors: List[tuple]) -> Iterator[tuple]:
+    chain: List[tuple] = []
+    for line in lines:
+        if line.kind == "section":
+            yield from _leaf_conditions(line.children, ancestors)
+            continue
+        if line.kind == "if":
+            chain = []
+        negated_chain = [("not", earlier) for earlier in chain]
+        own = negated_chain if line.kind == "else" else negated_chain + [line.condition]
+        if line.condition is not None:
+            chain.append(line.condition)
+        path = ancestors + own
+        if _has_conditions(line.children):
+            yield from _leaf_conditions(line.children, path)
+        elif path:
+            yield ("and", path)
+
+
+def _has_conditions(lines: List[_ConditionLine]) -> bool:
+    return any(line.kind != "section" or _has_conditions(line.children) for line in lines)
+
+
+def llm_cases(llm, logic: str) -> List[Dict[str, Any]]:
+    """Cases from CASES_LISTING_PROMPT, for logic the parser cannot handle."""
+    from langchain_core.messages import HumanMessage
+
+    response = llm.invoke([HumanMessage(content=f"{CASES_LISTING_PROMPT}\n{logic}")])
+    text = _JSON_FENCE_RE.sub("", response.content.strip())
+    start, end = text.find("["), text.rfind("]")
+    cases = json.loads(text[start:end + 1]) if start >= 0 else None
+    if not isinstance(cases, list) or not all(isinstance(case, dict) for case in cases):
+        raise ValueError("LLM response is not a JSON array of case objects")
+    return cases
+
+
+def iter_case_array_json(cases: Iterator[Dict[str, Any]], indent: Optional[int] = 2) -> Iterator[str]:
+    """Chunks of the JSON array of `cases`, produced as the cases are, for writing to a file or a response."""
+    separator = "\n" if indent is not None else ""
+    yield "["
+    for position, case in enumerate(cases):
+        yield ("," if position else "") + separator + " " * (indent or 0) + json.dumps(case, ensure_ascii=False, default=str)
+    yield separator + "]"
+
+
+def block_case_record(row_index: Any, row: Dict[str, Any], llm=None, max_cases: int = MAX_CASES) -> Dict[str, Any]:
+    """Cases of one graphs-DataFrame row, with where they came from and whether the cap truncated them."""
+    enumerator = CaseEnumerator(max_cases)
+    record = {"row": row_index, "block_name": row.get("block_name") if isinstance(row.get("block_name"), str) else ""}
+    try:
+        cases = list(enumerator.block_cases(row.get("block_content"), row.get("mermaid_graph"), row.get("graph_ir"), llm=llm))
+        error = None
+    except Exception as e:
+        cases, error = [], str(e)
+        logger.error(f"Could not enumerate cases for block '{record['block_name']}': {error}")
+    record.update({"source": enumerator.source, "truncated": enumerator.truncated, "error": error, "cases": cases})
+    return record
+
+
+def iter_page_cases(df: pd.DataFrame, llm=None, max_cases: int = MAX_CASES) -> Iterator[Dict[str, Any]]:
+    for row_index, row in zip(df.index, df.to_dict(orient="records")):
+        yield block_case_record(row_index, row, llm=llm, max_cases=max_cases)
+
+
+def export_page_cases(page_id: str, output_path: Optional[str] = None, graphs_dir: str = "graphs", llm=None,
+                      max_cases: int = MAX_CASES) -> Dict[str, int]:
+    """
+    Writes one JSON line per block of graphs/<page_id>_graphs.csv (or the spec CSV
+    when the page has no graphs yet) to `output_path`, block by block.
+    Returns the number of blocks per source.
+    """
+    graphs_path = f"{graphs_dir}/{page_id}_graphs.csv"
+    try:
+        df = pd.read_csv(graphs_path)
+    except FileNotFoundError:
+        df = pd.read_csv(f"{page_id}_spec_block_contents.csv")
+    output_path = output_path or f"{CASES_DIR}/{page_id}{CASES_SUFFIX}"
+
+    counts: Dict[str, int] = {}
+    with atomic_open(output_path) as f:
+        for record in iter_page_cases(df, llm=llm, max_cases=max_cases):
+            source = "error" if record["error"] else record["source"]
+            counts[source] = counts.get(source, 0) + 1
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    logger.info(f"Wrote cases for {len(df)} blocks of page {page_id} to {output_path}: {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enumerate the test cases of a page's spec blocks from their decision graphs.")
+    parser.add_argument("page_id")
+    parser.add_argument("--block", help="Print the case array of this block only")
+    parser.add_argument("--output", help=f"JSONL file for the whole page (default: {CASES_DIR}/<page_id>{CASES_SUFFIX})")
+    parser.add_argument("--graphs-dir", default="graphs")
+    parser.add_argument("--max-cases", type=int, default=MAX_CASES, help="Cases per block before the enumeration is cut off")
+    parser.add_argument("--llm-fallback", action="store_true",
+                        help="Ask the cheapest model tier (CASES_LISTING_PROMPT) for blocks whose logic does not parse")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    llm = None
+    if args.llm_fallback:
+        from dotenv import load_dotenv, find_dotenv
+        from config import build_model_tiers
+        load_dotenv(find_dotenv(usecwd=True), override=False)
+        llm = build_model_tiers()[0]["llm"]
+
+    if not args.block:
+        counts = export_page_cases(args.page_id, args.output, graphs_dir=args.graphs_dir, llm=llm, max_cases=args.max_cases)
+        print(json.dumps(counts))
+        return
+
+    df = pd.read_csv(f"{args.graphs_dir}/{args.page_id}_graphs.csv")
+    rows = df[df["block_name"] == args.block].to_dict(orient="records")
+    if not rows:
+        parser.error(f"page {args.page_id} has no block named {args.block!r}")
+    enumerator = CaseEnumerator(args.max_cases)
+    cases = enumerator.block_cases(rows[0].get("block_content"), rows[0].get("mermaid_graph"), rows[0].get("graph_ir"), llm=llm)
+    for chunk in iter_case_array_json(cases):
+        print(chunk, end="", flush=True)
+    print()
+    logger.info(f"Cases from {enumerator.source}{' (truncated)' if enumerator.truncated else ''}")
+
+
+if __name__ == "__main__":
+    main()
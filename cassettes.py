@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class Cassette:
+    """
+    A JSON file of recorded responses, keyed by a hash of the request.
+
+    Identical requests can legitimately return different responses over a run
+    (e.g. an LLM asked the same thing twice), so every key holds a list that
+    is replayed in order; once exhausted, the last response keeps being served.
+    Each entry also keeps the time the live call took, for simulated latency.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._replay_positions: Dict[str, int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def record(self, key: str, response: Any, duration: float):
+        with self._lock:
+            self._entries.setdefault(key, []).append({"response": response, "duration": duration})
+
+    def play(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMissError(f"No recorded response for request {key[:12]} in {self.path}")
+            position = self._replay_positions.get(key, 0)
+            self._replay_positions[key] = position + 1
+            return entries[min(position, len(entries) - 1)]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+        logger.info(f"Saved {sum(len(v) for v in self._entries.values())} recorded responses to {self.path}")
+
+
+def _simulate_latency(entry: Dict[str, Any], latency_scale: float):
+    if latency_scale > 0:
+        time.sleep(entry.get("duration", 0.0) * latency_scale)
+
+
+# --- Notion ---
+
+class _NotionEndpoint:
+    """Mirrors one level of the notion-client attribute tree (client.blocks.children.list ...)."""
+
+    def __init__(self, path: str, call: Callable[[str, Dict[str, Any]], Any], target: Any = None):
+        self._path = path
+        self._call = call
+        self._target = target
+
+    def __getattr__(self, name: str) -> "_NotionEndpoint":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        target = getattr(self._target, name) if self._target is not None else None
+        return _NotionEndpoint(f"{self._path}.{name}" if self._path else name, self._call, target)
+
+    def __call__(self, **kwargs) -> Any:
+        return self._call(self._path, kwargs, self._target)
+
+
+class RecordingNotionClient(_NotionEndpoint):
+    """Wraps a real NotionClient and records every endpoint call into `cassette`."""
+
+    def __init__(self, notion_client: Any, cassette: Cassette):
+        self.cassette = cassette
+        super().__init__("", self._record_call, notion_client)
+
+    def _record_call(self, path: str, kwargs: Dict[str, Any], target: Any) -> Any:
+        start_time = time.perf_counter()
+        response = target(**kwargs)
+        self.cassette.record(Cassette.make_key(path, kwargs), response, time.perf_counter() - start_time)
+        return response
+
+
+class ReplayNotionClient(_NotionEndpoint):
+    """Serves recorded Notion responses. `latency_scale` 1.0 replays the recorded call durations."""
+
+    def __init__(self, cassette: Cassette, latency_scale: float = 0.0):
+        self.cassette = cassette
+        self.latency_scale = latency_scale
+        super().__init__("", self._replay_call)
+
+    def _replay_call(self, path: str, kwargs: Dict[str, Any], target: Any) -> Any:
+        entry = self.cassette.play(Cassette.make_key(path, kwargs))
+        _simulate_latency(entry, self.latency_scale)
+        return entry["response"]
+
+
+# --- Chat models ---
+
+def _messages_key(model_name: str, messages: List[BaseMessage]) -> str:
+    return Cassette.make_key(model_name, [(message.type, message.content) for message in messages])
+
+
+def _serialize_ai_message(message: AIMessage) -> Dict[str, Any]:
+    return {
+        "content": message.content,
+        "usage_metadata": message.usage_metadata,
+        "response_metadata": message.response_metadata,
+    }
+
+
+class RecordingChatModel(BaseChatModel):
+    """Delegates to `inner` and records each response, keyed by model name and messages."""
+
+    inner: BaseChatModel
+    cassette: Any
+    model_name: str
+
+    @property
+    def _llm_type(self) -> str:
+        # Keep the wrapped model's type so provider-specific prompt handling
+        # (e.g. cache_control markers) stays the same while recording.
+        return self.inner._llm_type
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        start_time = time.perf_counter()
+        response = self.inner.invoke(messages, stop=stop, **kwargs)
+        self.cassette.record(_messages_key(self.model_name, messages), _serialize_ai_message(response), time.perf_counter() - start_time)
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+
+class ReplayChatModel(BaseChatModel):
+    """Serves responses recorded by RecordingChatModel for the same model name."""
+
+    cassette: Any
+    model_name: str
+    llm_type: str = "replay-chat"
+    latency_scale: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return self.llm_type
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        entry = self.cassette.play(_messages_key(self.model_name, messages))
+        _simulate_latency(entry, self.latency_scale)
+        recorded = entry["response"]
+        message = AIMessage(
+            content=recorded["content"],
+            usage_metadata=recorded.get("usage_metadata"),
+            response_metadata=recorded.get("response_metadata") or {},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# --- Mermaid validation ---
+
+def recording_validator(validator: Callable[[str], str], cassette: Cassette) -> Callable[[str], str]:
+    def validate(mermaid_code: str) -> str:
+        start_time = time.perf_counter()
+        result = validator(mermaid_code)
+        cassette.record(Cassette.make_key(mermaid_code), result, time.perf_counter() - start_time)
+        return result
+    return validate
+
+
+def replay_validator(cassette: Cassette, latency_scale: float = 0.0) -> Callable[[str], str]:
+    def validate(mermaid_code: str) -> str:
+        entry = cassette.play(Cassette.make_key(mermaid_code))
+        _simulate_latency(entry, latency_scale)
+        return entry["response"]
+    return validate
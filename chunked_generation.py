@@ -0,0 +1,307 @@
+"""
+Chunked generation for oversized spec blocks.
+
+A block whose logic is longer than CHUNK_THRESHOLD_CHARS is split along its
+top-level indentation branches (descending through single wrapper lines such
+as `if user == "maid":`, which are repeated at the top of every chunk for
+context). Consecutive branches are packed into chunks of about
+CHUNK_TARGET_CHARS, every chunk goes through the agent - and its validation -
+on its own and in parallel, and the chunk graphs are stitched into one
+flowchart: each chunk becomes a subgraph whose node ids are prefixed with
+`c<chunk>_`, hanging off a shared start node that replaces the chunks' own
+"Start" nodes. The stitched diagram is validated like any other graph; it is
+sent to mermaid.ink compressed (see mermaid_render.mermaid_ink_url), and a
+block whose diagram is still too large for it fails instead of being saved
+as a graph that cannot be rendered or exported.
+
+Comparing whole-block and chunked generation on the largest blocks:
+
+    python chunked_generation.py --largest 5 --scale 20 --fake-llm --latency 1 --latency-per-kchar 2
+    python chunked_generation.py --graphs-glob "graphs/*_graphs.csv" --largest 3 --local-validation-only
+"""
+import os
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from agent_metrics import RowMetrics, RunMetrics
+from b2m_agent import run_agent, validate_mermaid_locally, validate_mermaid_syntax, CascadeStats
+from mermaid_ir import parse_mermaid
+from mermaid_render import mermaid_ink_renderable
+from run_checkpoints import row_thread_id
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Blocks with longer logic are generated in chunks; 0 disables chunking.
+CHUNK_THRESHOLD_CHARS = 3000
+# Size the branches of a chunk are packed up to (a single larger branch stays whole).
+CHUNK_TARGET_CHARS = 1500
+# Chunks of one block generated at once.
+CHUNK_WORKERS = 4
+# Longest chunk subgraph title.
+CHUNK_TITLE_CHARS = 60
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip("\t "))
+
+
+def logic_branches(lines: List[str]) -> List[List[str]]:
+    """Splits lines into branches: a line at the shallowest indentation and the deeper lines below it."""
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return []
+    top = min(_indent(line) for line in lines)
+    branches: List[List[str]] = []
+    for line in lines:
+        if _indent(line) == top or not branches:
+            branches.append([line])
+        else:
+            branches[-1].append(line)
+    return branches
+
+
+def split_logic(logic: str, target_chars: int = CHUNK_TARGET_CHARS) -> List[str]:
+    """
+    Chunks of `logic`, each holding whole top-level branches and about `target_chars` long.
+    Lines wrapping every branch (a single top-level line with children) are repeated at the top of each chunk.
+    Returns [logic] when it has a single branch.
+    """
+    preamble: List[str] = []
+    branches = logic_branches(str(logic).splitlines())
+    while len(branches) == 1 and len(branches[0]) > 1:
+        preamble.append(branches[0][0])
+        branches = logic_branches(branches[0][1:])
+    if len(branches) < 2:
+        return [logic]
+
+    preamble_chars = sum(len(line) + 1 for line in preamble)
+    chunks: List[List[str]] = []
+    chunk_chars = 0
+    for branch in branches:
+        branch_chars = sum(len(line) + 1 for line in branch)
+        if chunks and preamble_chars + chunk_chars + branch_chars <= target_chars:
+            chunks[-1].extend(branch)
+            chunk_chars += branch_chars
+        else:
+            chunks.append(list(branch))
+            chunk_chars = branch_chars
+    if len(chunks) < 2:
+        return [logic]
+    return ["\n".join(preamble + chunk) for chunk in chunks]
+
+
+def chunk_title(chunk: str, preamble_lines: int = 0) -> str:
+    lines = [line.strip() for line in chunk.splitlines() if line.strip()]
+    title = lines[min(preamble_lines, len(lines) - 1)] if lines else ""
+    title = title.replace('"', "'")
+    return title if len(title) <= CHUNK_TITLE_CHARS else title[:CHUNK_TITLE_CHARS - 3] + "..."
+
+
+def _is_start_node(graph, node: int) -> bool:
+    return graph.node_ids[node].lower() == "start" or graph.node_text(node).strip().lower() == "start"
+
+
+def stitch_graphs(block_name: str, chunks: List[str], chunk_graphs: List[str]) -> str:
+    """
+    One flowchart from the chunk graphs: a start node, then one subgraph per chunk with `c<chunk>_`-prefixed node ids.
+    A chunk's own start node (a root with id or label "Start") is merged into the shared one.
+    """
+    graphs = [parse_mermaid(chunk_graph) for chunk_graph in chunk_graphs]
+    # The preamble is the common first lines of all chunks; the title is the chunk's first own line.
+    chunk_lines = [chunk.splitlines() for chunk in chunks]
+    preamble_lines = 0
+    while all(len(lines) > preamble_lines + 1 for lines in chunk_lines) and len({lines[preamble_lines] for lines in chunk_lines}) == 1:
+        preamble_lines += 1
+
+    start_label = (block_name or "Start").replace('"', "'")
+    lines = ["```mermaid", f"flowchart {graphs[0].direction if graphs else 'TD'}", f'    start(["{start_label}"])']
+    edges = []
+    for chunk_index, (chunk, graph) in enumerate(zip(chunks, graphs), start=1):
+        prefix = f"c{chunk_index}_"
+        start_nodes = {root for root in graph.roots() if _is_start_node(graph, root)}
+        lines.append(f'    subgraph chunk{chunk_index}["{chunk_title(chunk, preamble_lines)}"]')
+        lines.extend(f"        {graph.node_statement(node, prefix)}" for node in range(graph.node_count) if node not in start_nodes)
+        lines.append("    end")
+        edges.extend(f"    start --> {prefix}{graph.node_ids[root]}" for root in graph.roots() if root not in start_nodes)
+        edges.extend(f"    {graph.edge_statement(edge, prefix, 'start' if graph.edge_src[edge] in start_nodes else None)}"
+                     for edge in range(graph.edge_count))
+    lines.extend(edges)
+    lines.append("```")
+    return "\n".join(lines)
+
+
+def generate_chunked(app, model_tiers, logic: str, block_name: str = "", max_retries: int = 3,
+                     cascade_stats: CascadeStats = None, run_id: str = None, run_metrics: RunMetrics = None,
+                     hedger=None, validator: Callable[[str], str] = None, max_workers: int = CHUNK_WORKERS,
+                     target_chars: int = CHUNK_TARGET_CHARS, row_key: str = "") -> Optional[str]:
+    """
+    Generates the graph of one oversized block chunk by chunk (see split_logic), like b2m_agent.run_agent: returns the
+    stitched Mermaid code, or None when any chunk failed on every tier. Each chunk is validated on its own, then the
+    stitched graph with `validator` (mermaid.ink by default); a stitched graph too large for mermaid.ink counts as failed.
+    The row counts once in `cascade_stats` and `run_metrics`, with the counters of all its chunks.
+    `row_key` is the row's run_checkpoints.row_thread_id key; each chunk gets its own thread under it.
+    """
+    chunks = split_logic(logic, target_chars)
+    if len(chunks) == 1:
+        return run_agent(app, model_tiers, logic, max_retries=max_retries, cascade_stats=cascade_stats,
+                         thread_id=row_thread_id(run_id, logic, row_key) if run_id else None, run_metrics=run_metrics,
+                         hedger=hedger, validator=validator)
+
+    logger.info(f"Generating block '{block_name}' ({len(logic)} chars) in {len(chunks)} chunks")
+    chunk_stats = CascadeStats()
+    chunk_metrics = RunMetrics(run_id)
+    row_metrics = RowMetrics(row_key=row_thread_id(run_id, logic, row_key) if run_id else None)
+    start_time = time.perf_counter()
+
+    def generate_chunk(chunk_index: int, chunk: str) -> Optional[str]:
+        with tracing.span("chunked.chunk", chars=len(chunk)):
+            chunk_thread_id = row_thread_id(run_id, chunk, f"{row_key}:chunk{chunk_index}") if run_id else None
+            return run_agent(app, model_tiers, chunk, max_retries=max_retries, cascade_stats=chunk_stats,
+                             thread_id=chunk_thread_id, run_metrics=chunk_metrics,
+                             hedger=hedger, validator=validator)
+
+    try:
+        with tracing.span("chunked.generate", block_name=block_name, chunks=len(chunks)):
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))), thread_name_prefix="mermaid-chunk") as executor:
+                chunk_graphs = list(executor.map(tracing.propagate(generate_chunk), range(len(chunks)), chunks))
+        failed_chunks = sum(1 for chunk_graph in chunk_graphs if chunk_graph is None)
+        mermaid_graph = None
+        if failed_chunks:
+            logger.warning(f"{failed_chunks} of {len(chunks)} chunks of block '{block_name}' failed")
+        else:
+            mermaid_graph = stitch_graphs(block_name, chunks, chunk_graphs)
+            validation = validate_mermaid_locally(mermaid_graph)
+            if validation == "Graph is valid" and not mermaid_ink_renderable(mermaid_graph):
+                validation = "Error: too large for mermaid.ink"
+            if validation == "Graph is valid":
+                with tracing.span("mermaid.ink.validate", stitched=True):
+                    validation = validator(mermaid_graph) if validator is not None else validate_mermaid_syntax.invoke({"mermaid_code": mermaid_graph})
+            if validation != "Graph is valid":
+                logger.warning(f"Stitched graph of block '{block_name}' is invalid: {validation}")
+                mermaid_graph = None
+        row_metrics.outcome = "valid" if mermaid_graph is not None else "failed"
+        return mermaid_graph
+    except Exception:
+        row_metrics.outcome = "error"
+        raise
+    finally:
+        for chunk_row in chunk_metrics.rows:
+            row_metrics.merge(chunk_row)
+        row_metrics.wall_seconds = time.perf_counter() - start_time
+        if run_metrics is not None:
+            run_metrics.add_row(row_metrics)
+        if cascade_stats is not None:
+            cascade_stats.merge_tiers(chunk_stats)
+            cascade_stats.record_row(row_metrics.outcome == "valid")
+
+
+def scale_logic(logic: str, factor: int) -> str:
+    """A synthetic block `factor` times larger: the top-level branches repeated, each copy numbered."""
+    if factor <= 1:
+        return logic
+    branches = logic_branches(str(logic).splitlines())
+    copies = []
+    for copy_index in range(factor):
+        for branch in branches:
+            copies.append(f"{branch[0]} #{copy_index + 1}")
+            copies.extend(branch[1:])
+    return "\n".join(copies)
+
+
+def compare_block(app, model_tiers, block_name: str, logic: str, args: argparse.Namespace, validator) -> Dict[str, Any]:
+    """Latency and outcome of one block generated whole, then chunked."""
+    result = {"block_name": block_name, "chars": len(logic), "chunks": len(split_logic(logic, args.target_chars))}
+    for mode in ("whole", "chunked"):
+        run_id = f"chunked-report-{mode}"
+        run_metrics = RunMetrics(run_id)
+        start_time = time.perf_counter()
+        if mode == "whole":
+            mermaid_graph = run_agent(app, model_tiers, logic, max_retries=args.max_retries, thread_id=row_thread_id(run_id, logic),
+                                      run_metrics=run_metrics, validator=validator)
+        else:
+            mermaid_graph = generate_chunked(app, model_tiers, logic, block_name, max_retries=args.max_retries, run_id=run_id,
+                                             run_metrics=run_metrics, validator=validator, max_workers=args.chunk_workers,
+                                             target_chars=args.target_chars)
+        summary = run_metrics.summary()
+        result[mode] = {"seconds": time.perf_counter() - start_time, "valid": mermaid_graph is not None,
+                        "llm_calls": summary["llm_calls"], "attempts": summary["attempts"]}
+    return result
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'block':<40} {'chars':>7} {'chunks':>6} {'whole s':>8} {'ok':>3} {'chunked s':>10} {'ok':>3} {'speedup':>8}")
+    for result in results:
+        whole, chunked = result["whole"], result["chunked"]
+        speedup = whole["seconds"] / chunked["seconds"] if chunked["seconds"] else 0.0
+        print(f"{result['block_name'][:40]:<40} {result['chars']:>7} {result['chunks']:>6} {whole['seconds']:>8.2f} "
+              f"{'y' if whole['valid'] else 'n':>3} {chunked['seconds']:>10.2f} {'y' if chunked['valid'] else 'n':>3} {speedup:>7.2f}x")
+    for mode in ("whole", "chunked"):
+        seconds = [result[mode]["seconds"] for result in results]
+        valid = sum(1 for result in results if result[mode]["valid"])
+        if results:
+            print(f"{mode:>8}: mean {sum(seconds) / len(seconds):.2f} s, success {valid}/{len(results)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare whole-block and chunked generation on the largest spec blocks.")
+    parser.add_argument("--graphs-glob", default="graphs/*_graphs.csv", help="CSV files whose block_content column supplies the blocks")
+    parser.add_argument("--largest", type=int, default=5, help="Number of largest blocks to compare")
+    parser.add_argument("--scale", type=int, default=1, help="Repeat each block's top-level branches this many times")
+    parser.add_argument("--target-chars", type=int, default=CHUNK_TARGET_CHARS)
+    parser.add_argument("--chunk-workers", type=int, default=CHUNK_WORKERS)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--fake-llm", action="store_true", help="Use FakeLatencyChatModel instead of the model cascade")
+    parser.add_argument("--latency", type=float, default=1.0, help="Fake LLM mean seconds per call")
+    parser.add_argument("--latency-per-kchar", type=float, default=1.0, help="Fake LLM extra seconds per 1,000 prompt characters")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fake LLM share of calls answering invalid Mermaid")
+    parser.add_argument("--local-validation-only", action="store_true",
+                        help="Validate graphs with the local structural checks instead of mermaid.ink")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from dotenv import load_dotenv, find_dotenv
+    from langgraph.checkpoint.memory import MemorySaver
+    from b2m_agent import build_mermaid_agent
+
+    load_dotenv(find_dotenv(usecwd=True), override=False)
+    blocks = []
+    for graphs_path in sorted(glob.glob(args.graphs_glob)):
+        graphs_df = pd.read_csv(graphs_path)
+        blocks.extend((str(name), scale_logic(str(logic), args.scale))
+                      for name, logic in zip(graphs_df["block_name"], graphs_df["block_content"]) if isinstance(logic, str) and logic.strip())
+    blocks = sorted(blocks, key=lambda block: len(block[1]), reverse=True)[:args.largest]
+    if not blocks:
+        parser.error(f"no blocks found in {args.graphs_glob}")
+
+    if args.fake_llm:
+        from fake_llm import FakeLatencyChatModel
+        llm = FakeLatencyChatModel(latency_seconds=args.latency, latency_per_kchar=args.latency_per_kchar,
+                                   failure_rate=args.failure_rate, seed=42)
+        model_tiers = [{"name": "fake-latency", "llm": llm, "max_retries": args.max_retries}]
+    else:
+        from config import build_model_tiers
+        model_tiers = build_model_tiers()
+    validator = validate_mermaid_locally if args.local_validation_only else None
+    app = build_mermaid_agent(checkpointer=MemorySaver())
+
+    results = [compare_block(app, model_tiers, block_name, logic, args, validator) for block_name, logic in blocks]
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2, default=str)
+        print(f"Results written to {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
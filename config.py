@@ -0,0 +1,48 @@
+from typing import List, Dict, Any
+
+# --- LLM Setup ---
+MODEL_GEMINI_2_0_FLASH = "gemini-2.0-flash"
+GEMINI_MODEL = "gemini-2.5-flash-preview-05-20"
+ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
+
+# Model cascade: each row starts on the cheapest tier and escalates only after
+# that tier's retry budget is exhausted. Prices are USD per million tokens.
+MODEL_TIER_SPECS: List[Dict[str, Any]] = [
+    {
+        "name": MODEL_GEMINI_2_0_FLASH,
+        "provider": "google_genai",
+        "max_retries": 2,
+        "input_cost_per_mtok": 0.10,
+        "output_cost_per_mtok": 0.40,
+    },
+    {
+        "name": GEMINI_MODEL,
+        "provider": "google_genai",
+        "max_retries": 2,
+        "input_cost_per_mtok": 0.15,
+        "output_cost_per_mtok": 0.60,
+    },
+    {
+        "name": ANTHROPIC_MODEL,
+        "provider": "anthropic",
+        "max_retries": 3,
+        "input_cost_per_mtok": 3.00,
+        "output_cost_per_mtok": 15.00,
+    },
+]
+
+# Table mapping configuration
+TABLE_MAPPING = {
+    "MV_Resolvers": "1eb7432eb8438080b80bf2483e27b9b9",
+    "Doctors": "1ed7432eb843809f912fdbb4c370998e",
+    "MaidsAT": "1ed7432eb84380409717ffa3cbc506ef"
+}
+
+SPEC_BLOCK_IDENTIFIER_DEFAULT = "💡TECHNICAL_FUNCTION_VALUE:"
+
+
+def build_model_tiers(specs: List[Dict[str, Any]] = MODEL_TIER_SPECS) -> List[Dict[str, Any]]:
+    """Instantiates the chat model for every tier spec (b2m_agent.ModelTier dicts)."""
+    from langchain.chat_models import init_chat_model
+
+    return [dict(spec, llm=init_chat_model(f"{spec['provider']}:{spec['name']}")) for spec in specs]
@@ -0,0 +1,253 @@
+"""
+Dependency index between the ERP parameter rows of the TABLE_MAPPING
+databases and the spec blocks that mention them, kept in
+graphs/<page_id>_dependencies.json and updated by the pipeline whenever a
+page's graphs are generated or loaded.
+
+Each page file records, per spec block, the parameter row IDs it mentions and
+a digest of every such row as it was when the graphs were made. A later run
+of the page compares those digests with the table and regenerates only the
+blocks whose parameters changed; this CLI does the same across all pages:
+
+    python dependency_index.py --param 1f67432eb8438032b350f09ae8ea3965
+    python dependency_index.py --table MV_Resolvers --changed
+    python dependency_index.py --table MV_Resolvers --changed --jobs-file affected.json
+    python run_batch.py --jobs-file affected.json
+
+`--changed` queries the table and lists the parameters that changed since the
+graphs were made, with the pages and blocks they affect. `--jobs-file` writes
+those pages as a run_batch jobs file; running it regenerates exactly the
+affected blocks and reuses every other graph.
+"""
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+import contextlib
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from file_cache import atomic_write_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Page files live next to the graphs cache, one file per page.
+DEPENDENCY_INDEX_DIR = "graphs"
+DEPENDENCY_INDEX_SUFFIX = "_dependencies.json"
+# Bumped whenever the stored edges or digests change meaning; older page files are ignored until the page is re-indexed.
+DEPENDENCY_INDEX_VERSION = 2
+# The parameter row fields parse_spec_block.get_block_plain_text writes into block_content; editing any other
+# field (descriptions, links) leaves the spec logic unchanged, so it does not make a block stale.
+DIGEST_FIELDS = ("API Parameter Name", "Name")
+
+
+def parameter_digest(row: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Digest of the DIGEST_FIELDS of one parameter table row (None for a row missing from the table)."""
+    if row is None:
+        return None
+    fields = {field: row.get(field) for field in DIGEST_FIELDS}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def parameter_digests(params: Dict[str, Dict[str, Any]], param_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    return {param_id: parameter_digest(params.get(param_id)) for param_id in sorted(set(param_ids))}
+
+
+class DependencyIndex:
+    """
+    Parameter row -> page -> block names, kept in memory for impact queries.
+    Each page is persisted as its own `<directory>/<page_id>_dependencies.json`,
+    so update_page() rewrites only the page that changed. Safe to share across threads.
+    """
+
+    def __init__(self, directory: str = DEPENDENCY_INDEX_DIR):
+        self.directory = directory
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._dependents: Dict[str, Dict[str, Set[str]]] = defaultdict(dict)
+        self._lock = threading.RLock()
+        self.load()
+
+    def _page_path(self, page_id: str) -> str:
+        return os.path.join(self.directory, f"{page_id}{DEPENDENCY_INDEX_SUFFIX}")
+
+    def load(self):
+        loaded = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, f"*{DEPENDENCY_INDEX_SUFFIX}"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    page = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read dependency index file {path}, skipping it: {str(e)}")
+                continue
+            if page.get("version") != DEPENDENCY_INDEX_VERSION:
+                logger.info(f"Dependency index file {path} has version {page.get('version')}, ignoring it until the page is re-indexed")
+                continue
+            with self._lock:
+                self._add_page(page)
+            loaded += 1
+        if loaded:
+            logger.info(f"Loaded dependency index for {loaded} pages from {self.directory}")
+
+    def _add_page(self, page: Dict[str, Any]):
+        page_id = page["page_id"]
+        self._pages[page_id] = page
+        for block_name, param_ids in page["blocks"].items():
+            for param_id in param_ids:
+                self._dependents[param_id].setdefault(page_id, set()).add(block_name)
+
+    def _remove_page(self, page_id: str):
+        page = self._pages.pop(page_id, None)
+        if page is None:
+            return
+        for param_ids in page["blocks"].values():
+            for param_id in param_ids:
+                pages = self._dependents.get(param_id)
+                if pages is not None:
+                    pages.pop(page_id, None)
+                    if not pages:
+                        del self._dependents[param_id]
+
+    def update_page(self, page_id: str, table_id: str, block_identifier: str, block_parameters: Dict[str, List[str]],
+                    digests: Dict[str, Optional[str]]) -> bool:
+        """
+        Records the parameter row IDs each block of `page_id` mentions and the digests of those rows.
+        Returns False when the page was already indexed with the same edges and digests.
+        """
+        page = {"version": DEPENDENCY_INDEX_VERSION, "page_id": page_id, "table_id": table_id, "block_identifier": block_identifier,
+                "blocks": {block_name: sorted(param_ids) for block_name, param_ids in block_parameters.items()},
+                "parameters": dict(sorted(digests.items()))}
+        with self._lock:
+            if self._pages.get(page_id) == page:
+                return False
+            self._remove_page(page_id)
+            self._add_page(page)
+            atomic_write_text(self._page_path(page_id), json.dumps(page, ensure_ascii=False, indent=1))
+        logger.info(f"Indexed the parameters of {len(page['blocks'])} blocks of page {page_id}")
+        return True
+
+    def remove_page(self, page_id: str):
+        with self._lock:
+            self._remove_page(page_id)
+            if os.path.exists(self._page_path(page_id)):
+                os.unlink(self._page_path(page_id))
+
+    def dependents(self, param_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Page -> sorted names of the blocks mentioning any of `param_ids` (with or without dashes)."""
+        affected = defaultdict(set)
+        with self._lock:
+            for param_id in param_ids:
+                for page_id, block_names in self._dependents.get(param_id.replace("-", ""), {}).items():
+                    affected[page_id].update(block_names)
+        return {page_id: sorted(block_names) for page_id, block_names in sorted(affected.items())}
+
+    def stale_blocks(self, page_id: str, table_id: str, params: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        Blocks of `page_id` mentioning a parameter row that changed (or appeared or disappeared) since the page was
+        indexed against `table_id`. Empty for a page that was never indexed or was indexed against another table.
+        """
+        with self._lock:
+            page = self._pages.get(page_id)
+            if page is None or page["table_id"] != table_id:
+                return []
+            changed = {param_id for param_id, digest in page["parameters"].items() if parameter_digest(params.get(param_id)) != digest}
+            return sorted(block_name for block_name, param_ids in page["blocks"].items() if changed.intersection(param_ids))
+
+    def changed_parameters(self, table_id: str, params: Dict[str, Dict[str, Any]]) -> List[str]:
+        """Parameter row IDs whose current row differs from the one recorded by any page indexed against `table_id`."""
+        changed = set()
+        with self._lock:
+            for page in self._pages.values():
+                if page["table_id"] != table_id:
+                    continue
+                changed.update(param_id for param_id, digest in page["parameters"].items()
+                               if parameter_digest(params.get(param_id)) != digest)
+        return sorted(changed)
+
+    def affected_pages(self, table_id: str, params: Dict[str, Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Page -> stale block names for every page indexed against `table_id`, leaving out pages with none."""
+        with self._lock:
+            page_ids = sorted(page_id for page_id, page in self._pages.items() if page["table_id"] == table_id)
+        affected = {page_id: self.stale_blocks(page_id, table_id, params) for page_id in page_ids}
+        return {page_id: block_names for page_id, block_names in affected.items() if block_names}
+
+    def page(self, page_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._pages.get(page_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"pages": len(self._pages),
+                    "blocks": sum(len(page["blocks"]) for page in self._pages.values()),
+                    "parameters": len(self._dependents),
+                    "edges": sum(len(block_names) for pages in self._dependents.values() for block_names in pages.values())}
+
+
+_index: Optional[DependencyIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_dependency_index() -> DependencyIndex:
+    """Process-wide index loaded from DEPENDENCY_INDEX_DIR on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DependencyIndex()
+        return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the spec blocks and pages that depend on ERP parameter rows.")
+    parser.add_argument("--param", action="append", default=[], metavar="ROW_ID",
+                        help="Parameter table row ID to look up (repeatable)")
+    parser.add_argument("--table", help="TABLE_MAPPING name whose rows --changed compares")
+    parser.add_argument("--changed", action="store_true",
+                        help="Query --table and report the parameters that changed since the graphs were made")
+    parser.add_argument("--jobs-file", help="With --changed, write the affected pages as a run_batch.py jobs file")
+    parser.add_argument("--index-dir", default=DEPENDENCY_INDEX_DIR, help="Directory holding the page dependency files")
+    parser.add_argument("--notion-base-url", help="Notion API base URL (e.g. a notion_stub_server.py instance)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    index = DependencyIndex(args.index_dir)
+    report: Dict[str, Any] = {}
+    if args.param:
+        report["dependents"] = {param_id: index.dependents([param_id]) for param_id in args.param}
+
+    if args.changed:
+        from dotenv import load_dotenv, find_dotenv
+        from notion_client import Client as NotionClient
+        from config import TABLE_MAPPING
+        from notion_utils import extract_table_data
+
+        if args.table not in TABLE_MAPPING:
+            parser.error(f"--changed needs --table, one of {sorted(TABLE_MAPPING)}")
+        load_dotenv(find_dotenv(usecwd=True), override=False)
+        notion_token = os.environ.get("NOTION_SECRET")
+        if not notion_token:
+            parser.error("NOTION_SECRET environment variable is required for --changed")
+        client_options = {"base_url": args.notion_base_url} if args.notion_base_url else {}
+        table_id = TABLE_MAPPING[args.table]
+        # notion_utils reports progress with print(); keep stdout for the report.
+        with contextlib.redirect_stdout(sys.stderr):
+            params = extract_table_data(table_id, NotionClient(auth=notion_token, **client_options))
+        changed = index.changed_parameters(table_id, params)
+        affected = index.affected_pages(table_id, params)
+        report["changed_parameters"] = {param_id: index.dependents([param_id]) for param_id in changed}
+        report["affected_pages"] = affected
+        if args.jobs_file:
+            jobs = [{"page_id": page_id, "table": args.table, "block_identifier": index.page(page_id)["block_identifier"]}
+                    for page_id in affected]
+            atomic_write_text(args.jobs_file, json.dumps(jobs, indent=2, ensure_ascii=False))
+            logger.warning(f"Wrote {len(jobs)} affected pages to {args.jobs_file}")
+
+    if not report:
+        report = index.stats()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
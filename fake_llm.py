@@ -0,0 +1,234 @@
+import re
+import math
+import time
+import random
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+DEFAULT_MERMAID_RESPONSE = """```mermaid
+flowchart TD
+    start["Start"] --> check{"condition?"}
+    check -->|true| value1["[value]"]
+    check -->|false| value2["[value]"]
+```"""
+# Shortest prefix Anthropic caches on Sonnet; shorter cache_control prefixes are ignored.
+ANTHROPIC_MIN_CACHEABLE_TOKENS = 1024
+
+
+def _estimate_tokens(text: str) -> int:
+    # Rough approximation, good enough for relative cache accounting offline.
+    return max(1, len(text) // 4)
+
+
+def _message_text_blocks(message: BaseMessage) -> List[Dict[str, Any]]:
+    if isinstance(message.content, str):
+        return [{"type": "text", "text": message.content}]
+    blocks = []
+    for block in message.content:
+        if isinstance(block, str):
+            blocks.append({"type": "text", "text": block})
+        else:
+            blocks.append(block)
+    return blocks
+
+
+class FakeCachingChatModel(BaseChatModel):
+    """
+    Offline chat model that mimics Anthropic prompt caching.
+
+    Every content block up to and including the last block carrying a
+    `cache_control` marker is treated as the cacheable prefix. The first call
+    with a given prefix reports it as `cache_creation`, later calls report it
+    as `cache_read`, and everything after the prefix counts as regular input.
+    Like the provider, a prefix shorter than `min_cacheable_tokens` is not
+    cached at all: it is billed as regular input on every call.
+
+    Responses are served round-robin from `responses`.
+    """
+
+    responses: List[str] = [DEFAULT_MERMAID_RESPONSE]
+    min_cacheable_tokens: int = ANTHROPIC_MIN_CACHEABLE_TOKENS
+    cached_prefixes: Dict[str, int] = {}
+    call_count: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-caching-chat"
+
+    def _split_prefix(self, messages: List[BaseMessage]):
+        prefix_parts: List[str] = []
+        all_parts: List[str] = []
+        for message in messages:
+            for block in _message_text_blocks(message):
+                all_parts.append(block.get("text", ""))
+                if block.get("cache_control"):
+                    prefix_parts = list(all_parts)
+        prefix = "".join(prefix_parts)
+        remainder = "".join(all_parts[len(prefix_parts):])
+        return prefix, remainder
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prefix, remainder = self._split_prefix(messages)
+        cache_read = 0
+        cache_creation = 0
+        if prefix and _estimate_tokens(prefix) < self.min_cacheable_tokens:
+            remainder = prefix + remainder
+        elif prefix:
+            if prefix in self.cached_prefixes:
+                cache_read = self.cached_prefixes[prefix]
+            else:
+                cache_creation = _estimate_tokens(prefix)
+                self.cached_prefixes[prefix] = cache_creation
+
+        content = self.responses[self.call_count % len(self.responses)]
+        self.call_count += 1
+
+        uncached_tokens = _estimate_tokens(remainder) if remainder else 0
+        output_tokens = _estimate_tokens(content)
+        input_tokens = uncached_tokens + cache_read + cache_creation
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {
+                    "cache_read": cache_read,
+                    "cache_creation": cache_creation,
+                },
+            },
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+# Unbalanced bracket: fails validate_mermaid_locally, so the agent retries.
+INVALID_MERMAID_RESPONSE = """```mermaid
+flowchart TD
+    start["Start"] --> check{"condition?"
+```"""
+
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "normal", "lognormal", "exponential")
+
+
+class FakeLLMError(RuntimeError):
+    """Stands in for a provider error (timeout, 5xx) raised by FakeLatencyChatModel."""
+
+
+def template_mermaid(logic: str, max_conditions: int = 8) -> str:
+    """Builds a decision chain from the `if ...` lines of the business logic."""
+    conditions = []
+    for line in logic.splitlines():
+        line = line.strip()
+        if line.lower().startswith(("if ", "if(", "elif ", "else if")):
+            conditions.append(re.sub(r'[\[\]{}()"|]', "", line)[:80])
+        if len(conditions) == max_conditions:
+            break
+    if not conditions:
+        return DEFAULT_MERMAID_RESPONSE
+
+    lines = ["```mermaid", "flowchart TD", '    start["Start"] --> c0']
+    for index, condition in enumerate(conditions):
+        lines.append(f'    c{index}{{"{condition}"}} -->|true| v{index}["[value {index}]"]')
+        next_node = f"c{index + 1}" if index + 1 < len(conditions) else 'fallback["[default value]"]'
+        lines.append(f"    c{index} -->|false| {next_node}")
+    lines.append("```")
+    return "\n".join(lines)
+
+
+class FakeLatencyChatModel(BaseChatModel):
+    """
+    Offline chat model for load tests: sleeps for a sampled latency, then
+    returns Mermaid built from the `if` lines of the prompt (or the next of
+    `responses`, when given).
+
+    `failure_rate` of the calls answer with invalid Mermaid, which exercises
+    the agent's generate/validate retry loop; `error_rate` of the calls raise
+    FakeLLMError instead. Latency is `latency_seconds` on average, spread by
+    `latency_spread` according to `latency_distribution` (see
+    LATENCY_DISTRIBUTIONS; for lognormal the spread is sigma), plus
+    `latency_per_kchar` seconds per 1,000 characters of the prompt, so larger
+    blocks answer slower like with a real model. Safe to share across worker threads.
+    """
+
+    responses: List[str] = []
+    latency_distribution: str = "lognormal"
+    latency_seconds: float = 1.0
+    latency_spread: float = 0.5
+    latency_per_kchar: float = 0.0
+    failure_rate: float = 0.0
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+    call_count: int = 0
+
+    _random: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def model_post_init(self, __context: Any):
+        if self.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution must be one of {LATENCY_DISTRIBUTIONS}")
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency-chat"
+
+    def _sample_latency(self) -> float:
+        mean, spread = self.latency_seconds, self.latency_spread
+        if self.latency_distribution == "constant":
+            return mean
+        if self.latency_distribution == "uniform":
+            return self._random.uniform(max(0.0, mean - spread), mean + spread)
+        if self.latency_distribution == "normal":
+            return max(0.0, self._random.gauss(mean, spread))
+        if self.latency_distribution == "exponential":
+            return self._random.expovariate(1 / mean) if mean > 0 else 0.0
+        # lognormal with the requested mean: long right tail, like real LLM latencies
+        return self._random.lognormvariate(math.log(mean) - spread ** 2 / 2, spread) if mean > 0 else 0.0
+
+    def _plan_call(self, messages: List[BaseMessage]):
+        prompt = messages[-1].content if isinstance(messages[-1].content, str) else ""
+        with self._lock:
+            latency = self._sample_latency() + self.latency_per_kchar * len(prompt) / 1000
+            roll = self._random.random()
+            call_index = self.call_count
+            self.call_count += 1
+        if roll < self.error_rate:
+            return latency, None
+        if roll < self.error_rate + self.failure_rate:
+            return latency, INVALID_MERMAID_RESPONSE
+        if self.responses:
+            return latency, self.responses[call_index % len(self.responses)]
+        return latency, template_mermaid(prompt)
+
+    def _result(self, messages: List[BaseMessage], content: Optional[str], latency: float) -> ChatResult:
+        if content is None:
+            raise FakeLLMError(f"Simulated provider error after {latency:.2f}s")
+        input_tokens = sum(_estimate_tokens(block.get("text", "")) for message in messages for block in _message_text_blocks(message))
+        output_tokens = _estimate_tokens(content)
+        message = AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        latency, content = self._plan_call(messages)
+        time.sleep(latency)
+        return self._result(messages, content, latency)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        latency, content = self._plan_call(messages)
+        await asyncio.sleep(latency)
+        return self._result(messages, content, latency)
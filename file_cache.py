@@ -0,0 +1,123 @@
+import os
+import uuid
+import contextlib
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterator, TextIO
+
+import pandas as pd
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mode of a newly created cache file before the umask, as for open(path, "w").
+NEW_FILE_MODE = 0o666
+
+
+@contextlib.contextmanager
+def atomic_open(path: str) -> Iterator[TextIO]:
+    """
+    Text file handle for streaming writes to `path`: the content goes to a temporary
+    file next to `path`, which replaces `path` only once the block exits without error.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Unlike mkstemp (owner-only files), O_CREAT applies the process umask to NEW_FILE_MODE without reading or changing it.
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{uuid.uuid4().hex}.tmp")
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, NEW_FILE_MODE)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path: str, text: str):
+    """
+    Writes `text` to a temporary file next to `path` and renames it over `path`,
+    so readers see either the old file or the complete new one, never a partial write.
+    """
+    with atomic_open(path) as f:
+        f.write(text)
+
+
+def atomic_write_csv(df: pd.DataFrame, path: str, **to_csv_kwargs):
+    """DataFrame.to_csv with the write-then-rename of atomic_write_text."""
+    atomic_write_text(path, df.to_csv(**to_csv_kwargs))
+
+
+class KeyedLocks:
+    """
+    One lock per key (e.g. a cache file path), so writers of the same file
+    serialize while different files proceed in parallel. Locks are kept for
+    the life of the process; there is one per page, so the map stays small.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, threading.RLock] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, key: Hashable) -> threading.RLock:
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.RLock()
+            return lock
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls: while `do(key, fn)` runs for a key, other
+    callers with the same key wait for it and get its result (or its exception)
+    instead of running `fn` again. Once the call returns, the next caller runs anew.
+    Only deduplicates within this process.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        return self.do_shared(key, fn)[0]
+
+    def do_shared(self, key: Hashable, fn: Callable[[], Any]) -> tuple:
+        """Like do(), but returns (result, shared): `shared` is True when the result came from another caller's run."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            logger.info(f"Waiting for in-flight call {key}")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
@@ -0,0 +1,197 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Deque, Dict, List, Optional, Any
+
+import tracing
+import logging
+
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger(__name__)
+
+# Pipeline defaults: duplicate a call once it runs past this percentile of
+# recent latencies, spending at most this fraction of extra requests per run.
+HEDGE_PERCENTILE = 90
+HEDGE_BUDGET_FRACTION = 0.1
+
+
+class HedgedInvoker:
+    """
+    Sends a duplicate LLM request when the first one is slower than usual.
+
+    The hedge delay is the `percentile` of the last `window` latencies observed
+    for the same model. No hedging happens until `min_samples` calls have been
+    seen. The first response accepted by `is_valid` wins and the other request
+    is cancelled; if neither is accepted, the first response to arrive is used.
+    A primary cancelled because its hedge won is recorded with the time it had
+    run, a lower bound for its latency.
+
+    Hedges are capped per run: at most `budget_fraction` of all calls, and at
+    most `max_hedges` in total when it is set.
+
+    Requests run as asyncio tasks on one background event loop owned by this
+    object, so cancelling the loser aborts its HTTP request instead of leaving
+    a thread running to completion.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 90,
+        window: int = 50,
+        min_samples: int = 5,
+        budget_fraction: float = 0.1,
+        max_hedges: Optional[int] = None,
+    ):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.budget_fraction = budget_fraction
+        self.max_hedges = max_hedges
+
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.calls = 0
+        self.hedges_launched = 0
+        self.hedge_wins = 0
+        self.hedges_over_budget = 0
+        self.estimated_seconds_saved = 0.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+
+    # --- latency bookkeeping ---
+
+    def _model_key(self, llm: "BaseChatModel") -> str:
+        return getattr(llm, "model", None) or llm._llm_type
+
+    def _recent(self, model_key: str) -> List[float]:
+        with self._lock:
+            return sorted(self._latencies.get(model_key, ()))
+
+    def _record_latency(self, model_key: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(model_key, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, llm: "BaseChatModel") -> Optional[float]:
+        """Seconds to wait before hedging a call to `llm`, or None while there is too little history."""
+        recent = self._recent(self._model_key(llm))
+        if len(recent) < self.min_samples:
+            return None
+        index = min(len(recent) - 1, int(round(self.percentile / 100 * (len(recent) - 1))))
+        return recent[index]
+
+    def _take_hedge_budget(self) -> bool:
+        with self._lock:
+            over_fraction = self.hedges_launched + 1 > self.budget_fraction * self.calls
+            over_max = self.max_hedges is not None and self.hedges_launched >= self.max_hedges
+            if over_fraction or over_max:
+                self.hedges_over_budget += 1
+                return False
+            self.hedges_launched += 1
+            return True
+
+    def _estimate_primary_latency(self, model_key: str, elapsed: float) -> float:
+        # The cancelled primary's real latency is unknown; use the mean of the
+        # recent latencies that were at least as slow as the hedge's win time.
+        slower = [latency for latency in self._recent(model_key) if latency > elapsed]
+        return sum(slower) / len(slower) if slower else elapsed
+
+    # --- event loop ---
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(target=self._loop.run_forever, name="llm-hedging", daemon=True)
+                self._loop_thread.start()
+            return self._loop
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+    # --- invocation ---
+
+    def invoke(self, llm: "BaseChatModel", messages: List["BaseMessage"], is_valid: Callable[[Any], bool] = None) -> Any:
+        with self._lock:
+            self.calls += 1
+        coroutine = self._with_parent_span(tracing.current_span(), self._hedged_invoke(llm, messages, is_valid))
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._get_loop())
+        return future.result()
+
+    @staticmethod
+    async def _with_parent_span(parent: Any, coroutine):
+        # The loop thread has its own context; carry the caller's span over so hedge spans nest under it.
+        with tracing.use_parent(parent):
+            return await coroutine
+
+    async def _hedged_invoke(self, llm: "BaseChatModel", messages: List["BaseMessage"], is_valid: Callable[[Any], bool]):
+        model_key = self._model_key(llm)
+        start_time = time.perf_counter()
+        primary = asyncio.ensure_future(llm.ainvoke(messages))
+        pending = {primary}
+
+        delay = self.hedge_delay(llm)
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and self._take_hedge_budget():
+                logger.info(f"LLM call to {model_key} exceeded {delay:.2f}s (p{self.percentile:g}), launching hedge request")
+                tracing.current_span().set(hedge_launched_after=delay)
+                pending.add(asyncio.ensure_future(llm.ainvoke(messages)))
+
+        first_response = None
+        first_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    response = task.result()
+                    first_response = first_response or response
+                    elapsed = time.perf_counter() - start_time
+                    if task is primary:
+                        self._record_latency(model_key, elapsed)
+                    if is_valid is None or is_valid(response):
+                        if task is not primary:
+                            with self._lock:
+                                self.hedge_wins += 1
+                            saved = self._estimate_primary_latency(model_key, elapsed) - elapsed
+                            with self._lock:
+                                self.estimated_seconds_saved += max(saved, 0.0)
+                            logger.info(f"Hedge request to {model_key} won after {elapsed:.2f}s")
+                            tracing.current_span().set(hedge_won=True)
+                        return response
+        finally:
+            for task in pending:
+                task.cancel()
+            if primary in pending:
+                # The primary lost and is cancelled before it finishes; the time it had run so far
+                # is a lower bound for its latency. Dropping it would let the delay percentile drift
+                # down to the fast calls only, so more and more requests would be hedged.
+                self._record_latency(model_key, time.perf_counter() - start_time)
+
+        if first_response is not None:
+            return first_response
+        raise first_error
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "hedges_launched": self.hedges_launched,
+                "hedge_rate": self.hedges_launched / self.calls if self.calls else 0.0,
+                "hedge_wins": self.hedge_wins,
+                "hedges_over_budget": self.hedges_over_budget,
+                "estimated_seconds_saved": self.estimated_seconds_saved,
+                "percentile": self.percentile,
+                "budget_fraction": self.budget_fraction,
+                "max_hedges": self.max_hedges,
+            }
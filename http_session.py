@@ -0,0 +1,39 @@
+import atexit
+import threading
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept alive per host; rows validated in parallel share the pool.
+HTTP_POOL_SIZE = 16
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Process-wide requests.Session for mermaid.ink calls (validation and SVG
+    rendering), so repeated calls reuse pooled keep-alive connections instead
+    of opening a new TLS connection each time.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def close_http_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+atexit.register(close_http_session)
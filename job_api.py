@@ -0,0 +1,229 @@
+"""
+HTTP job API around the pipeline, for tools that cannot drive the Streamlit UI.
+
+    python job_api.py --port 8080 --concurrency 4 --max-queued 16
+    python job_api.py --notion-base-url http://127.0.0.1:8765 --fake-llm --local-validation-only
+
+Endpoints:
+    POST /jobs                          {"page_id", "table", "block_identifier"?, "force_recreate"?, "hedge"?,
+                                         "convert_business"?}
+                                        -> 202 with the job (the active job when the same page is already running),
+                                           429 with Retry-After when the queue is full
+    GET  /jobs                          all known jobs (?active=1 for running ones only)
+    GET  /jobs/{job_id}                 status, row progress and per-stage timings
+    GET  /jobs/{job_id}/graphs          generated rows as JSON (?format=csv for the graphs CSV)
+    GET  /jobs/{job_id}/svgs/{row}      one rendered graph as image/svg+xml
+    GET  /jobs/{job_id}/svgs.zip        every rendered graph
+    GET  /health
+
+Pipeline runs go through one JobManager (bounded worker pool), and every request
+shares the Notion client, chat models, HTTP session and SVG cache of the process.
+Results endpoints answer 409 until the job is done.
+"""
+import os
+import json
+import asyncio
+import argparse
+import functools
+from typing import Any, Dict
+
+import pandas as pd
+from aiohttp import web
+from dotenv import load_dotenv, find_dotenv
+
+from config import TABLE_MAPPING, SPEC_BLOCK_IDENTIFIER_DEFAULT
+from jobs import Job, JobManager, JobQueueFull, JobConflict, pipeline_job, JOB_DONE, MAX_CONCURRENT_JOBS, MAX_FINISHED_JOBS
+from mermaid_render import mermaid_to_svg_cached, export_zip_of_svgs, export_csv, ExportFile
+from run_batch import build_backends
+from business_conversion import BusinessConverter, BUSINESS_FUNCTION_IDENTIFIER
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Jobs allowed to wait for a worker before POST /jobs answers 429.
+MAX_QUEUED_JOBS = 16
+# Retry-After seconds sent with 429 responses.
+QUEUE_FULL_RETRY_AFTER = 30
+
+# aiohttp application keys for the shared resources.
+JOB_MANAGER_KEY = web.AppKey("job_manager", JobManager)
+BACKENDS_KEY = web.AppKey("backends", dict)
+
+# Snapshots hold timestamps and numpy values that json.dumps cannot encode by itself.
+_dumps = functools.partial(json.dumps, default=str)
+
+
+def job_summary(job: Job) -> Dict[str, Any]:
+    snapshot = job.snapshot()
+    snapshot["completed_rows"] = len(snapshot["completed_rows"])
+    snapshot["svg_paths"] = len(snapshot["svg_paths"])
+    return snapshot
+
+
+def _get_job(request: web.Request) -> Job:
+    job = request.app[JOB_MANAGER_KEY].get(request.match_info["job_id"])
+    if job is None:
+        raise web.HTTPNotFound(text=f"Unknown job {request.match_info['job_id']}")
+    return job
+
+
+def _get_finished_job(request: web.Request) -> Job:
+    job = _get_job(request)
+    if job.status != JOB_DONE:
+        raise web.HTTPConflict(text=f"Job {job.job_id} is {job.status}")
+    return job
+
+
+async def submit_job(request: web.Request) -> web.Response:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+    page_id, table = body.get("page_id"), body.get("table")
+    if not page_id or table not in TABLE_MAPPING:
+        raise web.HTTPBadRequest(text=f"Need a page_id and a table, one of {sorted(TABLE_MAPPING)}")
+
+    backends = request.app[BACKENDS_KEY]
+    force_recreate = bool(body.get("force_recreate", False))
+    convert_business = bool(body.get("convert_business", False))
+    default_identifier = BUSINESS_FUNCTION_IDENTIFIER if convert_business else SPEC_BLOCK_IDENTIFIER_DEFAULT
+    run = pipeline_job(
+        backends["notion"], backends["model_tiers"], TABLE_MAPPING[table], force_recreate=force_recreate,
+        hedge=bool(body.get("hedge", False)), max_retries=backends["max_retries"], validator=backends["validator"],
+        row_workers=backends["row_workers"],
+        business_converter=backends["business_converter"] if convert_business else None,
+    )
+    try:
+        job = request.app[JOB_MANAGER_KEY].submit(page_id, table, body.get("block_identifier") or default_identifier, run)
+    except JobQueueFull as e:
+        raise web.HTTPTooManyRequests(text=str(e), headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)})
+    except JobConflict as e:
+        raise web.HTTPConflict(text=str(e))
+    return web.json_response(job_summary(job), status=202, dumps=_dumps)
+
+
+async def list_jobs(request: web.Request) -> web.Response:
+    jobs = request.app[JOB_MANAGER_KEY].list_jobs(active_only=request.query.get("active") == "1")
+    return web.json_response([job_summary(job) for job in jobs], dumps=_dumps)
+
+
+async def get_job(request: web.Request) -> web.Response:
+    return web.json_response(job_summary(_get_job(request)), dumps=_dumps)
+
+
+async def get_graphs(request: web.Request) -> web.Response:
+    job = _get_finished_job(request)
+    if request.query.get("format") == "csv":
+        csv_export = await asyncio.get_running_loop().run_in_executor(None, export_csv, job.result_df)
+        return await _stream_export(request, csv_export, "text/csv",
+                                    {"Content-Disposition": f'attachment; filename="{job.page_id}_graphs.csv"'})
+    rows = job.result_df.astype(object).where(job.result_df.notna(), None)
+    return web.json_response(
+        [dict(row, row=row_index) for row_index, row in zip(rows.index, rows.to_dict(orient="records"))], dumps=_dumps,
+    )
+
+
+async def get_svg(request: web.Request) -> web.Response:
+    job = _get_finished_job(request)
+    try:
+        row = job.result_df.loc[int(request.match_info["row"])]
+    except (KeyError, ValueError):
+        raise web.HTTPNotFound(text=f"Job {job.job_id} has no row {request.match_info['row']}")
+    if pd.isna(row["mermaid_graph"]):
+        raise web.HTTPNotFound(text=f"No graph was generated for row {request.match_info['row']}")
+    # mermaid.ink calls block; keep them off the event loop.
+    svg_content = await asyncio.get_running_loop().run_in_executor(None, mermaid_to_svg_cached, row["mermaid_graph"])
+    if not svg_content:
+        raise web.HTTPBadGateway(text="mermaid.ink could not render the graph")
+    return web.Response(text=svg_content, content_type="image/svg+xml")
+
+
+async def get_svgs_zip(request: web.Request) -> web.Response:
+    job = _get_finished_job(request)
+    graphs_df = job.result_df.dropna(subset=["mermaid_graph"])
+    zip_export = await asyncio.get_running_loop().run_in_executor(None, export_zip_of_svgs, graphs_df)
+    headers = {"Content-Disposition": f'attachment; filename="{job.page_id}_flowcharts.zip"'}
+    if zip_export.error_message:
+        headers["X-Render-Errors"] = str(zip_export.error_message.count("\n") + 1)
+    return await _stream_export(request, zip_export, "application/zip", headers)
+
+
+async def _stream_export(request: web.Request, export: ExportFile, content_type: str, headers: Dict[str, str]) -> web.StreamResponse:
+    """Sends an export in EXPORT_CHUNK_BYTES pieces from its spooled file, then closes it."""
+    try:
+        response = web.StreamResponse(headers=headers)
+        response.content_type = content_type
+        response.content_length = export.size
+        await response.prepare(request)
+        for chunk in export.iter_chunks():
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+    finally:
+        export.close()
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok", "active_jobs": len(request.app[JOB_MANAGER_KEY].list_jobs(active_only=True))})
+
+
+def create_app(notion, model_tiers: list, validator=None, max_retries: int = 3, row_workers: int = 1,
+               max_concurrent_jobs: int = MAX_CONCURRENT_JOBS, max_queued_jobs: int = MAX_QUEUED_JOBS,
+               max_finished_jobs: int = MAX_FINISHED_JOBS, trace_file: str = None) -> web.Application:
+    """Builds the aiohttp application; the backends are shared by every request."""
+    app = web.Application()
+    app[JOB_MANAGER_KEY] = JobManager(max_concurrent_jobs=max_concurrent_jobs, max_finished_jobs=max_finished_jobs,
+                                      trace_file=trace_file, max_queued_jobs=max_queued_jobs)
+    app[BACKENDS_KEY] = {"notion": notion, "model_tiers": model_tiers, "validator": validator,
+                         "max_retries": max_retries, "row_workers": row_workers,
+                         "business_converter": BusinessConverter(model_tiers[0]["llm"])}
+
+    async def shutdown_jobs(app: web.Application):
+        app[JOB_MANAGER_KEY].shutdown()
+
+    app.on_cleanup.append(shutdown_jobs)
+    app.add_routes([
+        web.post("/jobs", submit_job),
+        web.get("/jobs", list_jobs),
+        web.get("/jobs/{job_id}", get_job),
+        web.get("/jobs/{job_id}/graphs", get_graphs),
+        web.get("/jobs/{job_id}/svgs.zip", get_svgs_zip),
+        web.get("/jobs/{job_id}/svgs/{row}", get_svg),
+        web.get("/health", health),
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the flowchart pipeline as an HTTP job API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_JOBS, help="Pipeline jobs running at once")
+    parser.add_argument("--max-queued", type=int, default=MAX_QUEUED_JOBS, help="Jobs waiting for a worker before submissions get 429")
+    parser.add_argument("--row-workers", type=int, default=1, help="Rows generated at once within a job")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--workdir", default=".", help="Where blocks/, graphs/, checkpoints/ and metrics/ live")
+    parser.add_argument("--notion-base-url", help="Notion API base URL (e.g. a notion_stub_server.py instance)")
+    parser.add_argument("--fake-llm", action="store_true", help="Use FakeLatencyChatModel instead of the model cascade")
+    parser.add_argument("--local-validation-only", action="store_true",
+                        help="Validate graphs with the local structural checks instead of mermaid.ink")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(find_dotenv(usecwd=True), override=False)
+    trace_file = tracing.enable_from_env()
+    notion, model_tiers, validator = build_backends(args)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    os.chdir(args.workdir)
+    os.makedirs("blocks", exist_ok=True)
+    os.makedirs("graphs", exist_ok=True)
+
+    app = create_app(notion, model_tiers, validator, max_retries=args.max_retries, row_workers=args.row_workers,
+                     max_concurrent_jobs=args.concurrency, max_queued_jobs=args.max_queued, trace_file=trace_file)
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from mermaid_render import mermaid_to_svg_cached, graph_render_key
+from file_cache import atomic_write_text
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pipeline runs executing at once across all users; further submissions queue.
+MAX_CONCURRENT_JOBS = 4
+# Finished jobs kept around so a refreshed page can still collect its results.
+MAX_FINISHED_JOBS = 20
+
+# Render keys of the SVGs in each svgs/<page_id>/ directory, used to skip unchanged graphs.
+SVG_MANIFEST_FILE = "manifest.json"
+
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_GENERATING = "generating"
+JOB_RENDERING = "rendering"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_EXTRACTING, JOB_GENERATING, JOB_RENDERING)
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when `max_queued_jobs` jobs are already waiting for a worker."""
+
+
+class JobConflict(Exception):
+    """Raised by JobManager.submit when the page already has an active job run with different options."""
+
+
+class Job:
+    """
+    One crawl -> extract -> generate run. Written by the worker thread, read by
+    any number of Streamlit sessions through snapshot().
+    """
+
+    def __init__(self, job_id: str, page_id: str, table_name: str, block_identifier: str, options: Dict[str, Any] = None):
+        self.job_id = job_id
+        self.page_id = page_id
+        self.table_name = table_name
+        self.block_identifier = block_identifier
+        self.options: Dict[str, Any] = dict(options or {})
+        self.status = JOB_QUEUED
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.spec_df: Optional[pd.DataFrame] = None
+        self.result_df: Optional[pd.DataFrame] = None
+        self.completed_rows: Dict[Any, Optional[str]] = {}
+        self.run_state: Dict[str, Any] = {}
+        self.svg_paths: Dict[Any, Optional[str]] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self._stage_started = self.submitted_at
+        self._lock = threading.Lock()
+
+    @property
+    def key(self) -> tuple:
+        return (self.page_id, self.table_name, self.block_identifier)
+
+    def set_status(self, status: str, error: str = None):
+        with self._lock:
+            now = time.time()
+            self.stage_seconds[self.status] = self.stage_seconds.get(self.status, 0.0) + now - self._stage_started
+            self._stage_started = now
+            self.status = status
+            self.error = error
+            if status not in ACTIVE_STATUSES:
+                self.finished_at = now
+
+    def record_row(self, row_index: Any, mermaid_graph: Optional[str]):
+        with self._lock:
+            self.completed_rows[row_index] = mermaid_graph
+
+    def record_svg(self, row_index: Any, svg_path: Optional[str]):
+        with self._lock:
+            self.svg_paths[row_index] = svg_path
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Consistent copy of the job's progress for display."""
+        with self._lock:
+            total_rows = len(self.spec_df) if self.spec_df is not None else None
+            completed = dict(self.completed_rows)
+            return {
+                "job_id": self.job_id,
+                "page_id": self.page_id,
+                "table_name": self.table_name,
+                "block_identifier": self.block_identifier,
+                "options": dict(self.options),
+                "status": self.status,
+                "error": self.error,
+                "run_id": self.run_state.get("run_id"),
+                "total_rows": total_rows,
+                "completed_rows": completed,
+                "svg_paths": dict(self.svg_paths),
+                "stage_seconds": dict(self.stage_seconds),
+                "elapsed_seconds": (self.finished_at or time.time()) - self.submitted_at,
+            }
+
+
+def pipeline_job(notion: Any, model_tiers: list, table_id: str, force_recreate: bool = False,
+                 resume_run_id: str = None, hedge: bool = False, max_retries: int = 3,
+                 validator: Callable[[str], str] = None, row_workers: int = 1,
+                 svg_dir: str = None, business_converter=None, chunk_threshold: Optional[int] = None) -> Callable[[Job], None]:
+    """
+    Builds the job body for JobManager.submit: extract the spec blocks, then generate a graph per row.
+    `validator` replaces the mermaid.ink syntax check (see process_dataframe_with_mermaid_agent).
+    With `svg_dir`, every generated graph is also rendered to `<svg_dir>/<page_id>/<block_name>.svg`.
+    With `business_converter`, the job's block identifier names business sections, which are converted to technical specs first.
+    Blocks longer than `chunk_threshold` characters (default chunked_generation.CHUNK_THRESHOLD_CHARS) are generated in chunks (0 disables it).
+    The pipeline and its LLM stack are imported when the first job runs, not when this module is.
+    The options that change the job's results are exposed as `run.options`, so JobManager.submit
+    only attaches a submission to an active job that was asked for the same thing.
+    """
+    def run(job: Job):
+        from pipeline import fetch_data_spec_content, process_dataframe_with_mermaid_agent
+        from chunked_generation import CHUNK_THRESHOLD_CHARS
+
+        job.set_status(JOB_EXTRACTING)
+        spec_df = fetch_data_spec_content(job.block_identifier, job.page_id, table_id, notion, force_recreate=force_recreate,
+                                          run_state=job.run_state, business_converter=business_converter)
+        if spec_df is None or len(spec_df) == 0:
+            raise ValueError(f"No spec blocks matching '{job.block_identifier}' found on page {job.page_id}")
+        job.spec_df = spec_df
+
+        job.set_status(JOB_GENERATING)
+        job.result_df = process_dataframe_with_mermaid_agent(
+            job.page_id, spec_df, model_tiers, logic_column="block_content", max_retries=max_retries,
+            run_id=resume_run_id, hedge=hedge, force_recreate=force_recreate,
+            run_state=job.run_state, validator=validator, max_workers=row_workers, on_row_complete=job.record_row,
+            chunk_threshold=CHUNK_THRESHOLD_CHARS if chunk_threshold is None else chunk_threshold,
+        )
+
+        if svg_dir:
+            job.set_status(JOB_RENDERING)
+            render_svgs(job, os.path.join(svg_dir, job.page_id))
+
+    run.options = {
+        "force_recreate": force_recreate, "resume_run_id": resume_run_id, "hedge": hedge, "max_retries": max_retries,
+        "validator": getattr(validator, "__name__", type(validator).__name__) if validator is not None else None,
+        "svg_dir": svg_dir, "convert_business": business_converter is not None, "chunk_threshold": chunk_threshold,
+    }
+    return run
+
+
+def render_svgs(job: Job, output_dir: str):
+    """
+    Writes one SVG per generated graph of `job.result_df`; rows that fail to render map to None in job.svg_paths.
+    An SVG whose graph is structurally unchanged since it was written (per the render keys in
+    SVG_MANIFEST_FILE) is kept as is, so re-runs only render the graphs that changed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, SVG_MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {manifest_path}, rendering every graph: {str(e)}")
+
+    rendered = skipped = 0
+    try:
+        for row_index, row in job.result_df.iterrows():
+            if pd.isna(row["mermaid_graph"]):
+                continue
+            file_name = f"{str(row['block_name']).replace('/', '_')}.svg"
+            svg_path = os.path.join(output_dir, file_name)
+            render_key = graph_render_key(row["mermaid_graph"], row.get("graph_ir"))
+            if manifest.get(file_name) == render_key and os.path.exists(svg_path):
+                skipped += 1
+                job.record_svg(row_index, svg_path)
+                continue
+            svg_content = mermaid_to_svg_cached(row["mermaid_graph"], graph_ir=row.get("graph_ir"))
+            if not svg_content:
+                svg_path = None
+                manifest.pop(file_name, None)
+            else:
+                atomic_write_text(svg_path, svg_content)
+                manifest[file_name] = render_key
+                rendered += 1
+            job.record_svg(row_index, svg_path)
+    finally:
+        atomic_write_text(manifest_path, json.dumps(manifest, indent=2, ensure_ascii=False))
+    logger.info(f"Rendered {rendered} SVGs for page {job.page_id}, kept {skipped} unchanged")
+
+
+class JobManager:
+    """
+    Runs pipeline jobs on a bounded thread pool shared by every Streamlit
+    session in the process. Submitting the same page/table/identifier while a
+    job for it is still active returns that job instead of starting another,
+    so two sessions never crawl or write the same page files at once; when the
+    run options differ (see pipeline_job), the submission is refused with JobConflict.
+    With `trace_file`, each job's tracing spans are written to `<trace_file stem>_<job_id><ext>` when it ends
+    and then dropped from memory, so a long-running process does not keep every job's trace.
+    With `max_queued_jobs`, new submissions are refused with JobQueueFull once
+    that many jobs are waiting, instead of queueing without bound.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = MAX_CONCURRENT_JOBS, max_finished_jobs: int = MAX_FINISHED_JOBS,
+                 trace_file: str = None, max_queued_jobs: int = None):
+        self.max_finished_jobs = max_finished_jobs
+        self.max_queued_jobs = max_queued_jobs
+        self.trace_file = trace_file
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="pipeline-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+
+    def submit(self, page_id: str, table_name: str, block_identifier: str, run: Callable[[Job], None]) -> Job:
+        """Queues `run(job)` and returns the job (or the already active job for the same inputs and `run.options`)."""
+        options = getattr(run, "options", {})
+        with self._lock:
+            for job in self._jobs.values():
+                if job.key == (page_id, table_name, block_identifier) and job.status in ACTIVE_STATUSES:
+                    if job.options != options:
+                        differing = sorted(key for key in set(job.options) | set(options) if job.options.get(key) != options.get(key))
+                        raise JobConflict(f"Job {job.job_id} is already running for page {page_id} with different options "
+                                          f"({', '.join(differing)}); wait for it to finish")
+                    logger.info(f"Attaching to active job {job.job_id} for page {page_id}")
+                    return job
+            if self.max_queued_jobs is not None:
+                queued_jobs = sum(1 for job in self._jobs.values() if job.status == JOB_QUEUED)
+                if queued_jobs >= self.max_queued_jobs:
+                    raise JobQueueFull(f"{queued_jobs} jobs are already queued")
+            job = Job(uuid.uuid4().hex[:12], page_id, table_name, block_identifier, options)
+            self._jobs[job.job_id] = job
+            self._prune()
+        logger.info(f"Queued job {job.job_id} for page {page_id}, table {table_name}")
+        self._executor.submit(self._run, job, tracing.propagate(run))
+        return job
+
+    def _run(self, job: Job, run: Callable[[Job], None]):
+        job_span = None
+        try:
+            with tracing.span("job.run", job_id=job.job_id, page_id=job.page_id, table=job.table_name) as job_span:
+                run(job)
+            job.set_status(JOB_DONE)
+            logger.info(f"Job {job.job_id} finished")
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {str(e)}", exc_info=True)
+            job.set_status(JOB_FAILED, str(e))
+        finally:
+            if self.trace_file and isinstance(job_span, tracing.Span):
+                trace_stem, trace_ext = os.path.splitext(self.trace_file)
+                trace_path = f"{trace_stem}_{job.job_id}{trace_ext or '.json'}"
+                span_count = tracing.export_chrome_trace(trace_path, clear=True, root_span_id=job_span.span_id)
+                logger.info(f"Wrote {span_count} trace spans to {trace_path}")
+
+    def _prune(self):
+        finished = sorted(
+            (job for job in self._jobs.values() if job.status not in ACTIVE_STATUSES),
+            key=lambda job: job.finished_at or 0,
+        )
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, active_only: bool = False) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if active_only:
+            jobs = [job for job in jobs if job.status in ACTIVE_STATUSES]
+        return sorted(jobs, key=lambda job: job.submitted_at, reverse=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,149 @@
+"""
+Load-tests process_dataframe_with_mermaid_agent with FakeLatencyChatModel, so
+scaling with row count and concurrency can be measured without spending tokens.
+
+    python load_test_agent.py --rows 200 --concurrency 1 4 16
+    python load_test_agent.py --latency 2.0 --latency-spread 0.8 --failure-rate 0.3 --error-rate 0.02
+
+Rows are taken from the block_content column of graphs/*.csv (cycled). Repeated
+logic does not share a checkpoint: each row gets its own block name, and rows
+are checkpointed by block name as well as logic. Every concurrency level runs
+from a fresh in-memory checkpointer in a scratch directory.
+"""
+import os
+import glob
+import json
+import time
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+import pandas as pd
+from langgraph.checkpoint.memory import MemorySaver
+
+from fake_llm import FakeLatencyChatModel, LATENCY_DISTRIBUTIONS
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def load_logic_rows(graphs_glob: str, rows: int) -> pd.DataFrame:
+    logic = []
+    for graphs_path in sorted(glob.glob(graphs_glob)):
+        graphs_df = pd.read_csv(graphs_path)
+        if "block_content" in graphs_df:
+            logic.extend(text for text in graphs_df["block_content"].dropna() if str(text).strip())
+    if not logic:
+        logic = ['if user == "maid":\n\treturn "A"\nelse if nationality == "Filipina":\n\treturn "B"\nelse:\n\treturn "C"']
+    return pd.DataFrame({
+        "block_name": [f"load-test-{index}" for index in range(rows)],
+        "block_content": [logic[index % len(logic)] for index in range(rows)],
+    })
+
+
+def run_level(df: pd.DataFrame, concurrency: int, args: argparse.Namespace) -> Dict[str, Any]:
+    from pipeline import process_dataframe_with_mermaid_agent
+
+    llm = FakeLatencyChatModel(
+        latency_distribution=args.latency_distribution,
+        latency_seconds=args.latency,
+        latency_spread=args.latency_spread,
+        failure_rate=args.failure_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    model_tiers = [{"name": "fake-latency", "llm": llm, "max_retries": args.max_retries}]
+    run_state: Dict[str, Any] = {}
+    error = None
+
+    start_time = time.perf_counter()
+    try:
+        process_dataframe_with_mermaid_agent(
+            f"loadtest_c{concurrency}", df, model_tiers, logic_column="block_content", max_retries=args.max_retries,
+            hedge=args.hedge, force_recreate=True, run_state=run_state,
+            validator=lambda mermaid_code: "Graph is valid", checkpointer=MemorySaver(), max_workers=concurrency,
+        )
+    except RuntimeError as e:
+        # Raised when some rows hit simulated provider errors; metrics were still collected.
+        error = str(e)
+    elapsed = time.perf_counter() - start_time
+
+    summary = run_state["run_metrics"].summary()
+    result = {
+        "concurrency": concurrency,
+        "rows": len(df),
+        "elapsed_seconds": elapsed,
+        "rows_per_second": len(df) / elapsed if elapsed else 0.0,
+        "row_seconds": summary["row_seconds"],
+        "outcomes": summary["outcomes"],
+        "llm_calls": summary["llm_calls"],
+        "attempts": summary["attempts"],
+        "extra_attempts": summary["attempts"] - sum(summary["outcomes"].get(key, 0) for key in ("valid", "failed")),
+        "error": error,
+    }
+    if "hedging" in run_state.get("run_summary", {}):
+        result["hedging"] = run_state["run_summary"]["hedging"]
+    return result
+
+
+def print_report(results: List[Dict[str, Any]]):
+    print(f"{'workers':>7} {'rows':>6} {'seconds':>9} {'rows/s':>8} {'p50':>7} {'p95':>7} {'p99':>7} "
+          f"{'llm':>6} {'retries':>8} {'valid':>6} {'failed':>6} {'error':>6}")
+    for result in results:
+        row_seconds, outcomes = result["row_seconds"], result["outcomes"]
+        print(f"{result['concurrency']:>7} {result['rows']:>6} {result['elapsed_seconds']:>9.2f} {result['rows_per_second']:>8.2f} "
+              f"{row_seconds['p50']:>7.2f} {row_seconds['p95']:>7.2f} {row_seconds['p99']:>7.2f} "
+              f"{result['llm_calls']:>6} {result['extra_attempts']:>8} {outcomes.get('valid', 0):>6} "
+              f"{outcomes.get('failed', 0):>6} {outcomes.get('error', 0):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the mermaid agent pipeline against a fake LLM.")
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--graphs-glob", default="graphs/*_graphs.csv", help="CSV files whose block_content column supplies the logic")
+    parser.add_argument("--latency", type=float, default=1.0, help="Mean seconds per LLM call")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="Spread around the mean (sigma for lognormal)")
+    parser.add_argument("--latency-distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--failure-rate", type=float, default=0.2, help="Share of calls answering invalid Mermaid")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls raising a provider error")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--hedge", action="store_true", help="Enable hedged LLM requests")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    df = load_logic_rows(args.graphs_glob, args.rows)
+    output_path = os.path.abspath(args.output) if args.output else None
+    trace_path = os.path.abspath(args.trace) if args.trace else None
+    if trace_path:
+        tracing.enable()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="blv_loadtest_") as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        os.makedirs("graphs", exist_ok=True)
+        try:
+            for concurrency in args.concurrency:
+                results.append(run_level(df, concurrency, args))
+                logger.info(f"Finished concurrency {concurrency}")
+        finally:
+            os.chdir(cwd)
+
+    print_report(results)
+    if trace_path:
+        print(f"Wrote {tracing.export_chrome_trace(trace_path)} trace spans to {trace_path}")
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2, default=str)
+        print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Measures Streamlit rerun latency of app.py with streamlit.testing's AppTest,
+with and without the process-wide cached resources (models, Notion client,
+logging, .env).
+
+    python measure_reruns.py --reruns 20
+
+Placeholder credentials are used when none are set; no external call is made
+because no widget that triggers the agent is clicked.
+"""
+import os
+import time
+import argparse
+import statistics
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+PLACEHOLDER_ENV = {
+    "NOTION_SECRET": "measure-reruns",
+    "GOOGLE_API_KEY": "measure-reruns",
+    "ANTHROPIC_API_KEY": "measure-reruns",
+}
+
+
+def measure(app_path: str, reruns: int, clear_cache: bool) -> list:
+    app_test = AppTest.from_file(app_path, default_timeout=120)
+    timings = []
+    for _ in range(reruns):
+        if clear_cache:
+            st.cache_resource.clear()
+        start_time = time.perf_counter()
+        app_test.run()
+        timings.append(time.perf_counter() - start_time)
+        if app_test.exception:
+            raise RuntimeError(f"app.py raised: {app_test.exception[0].message}")
+    return timings
+
+
+def _describe(label: str, timings: list):
+    warm = timings[1:] or timings
+    print(f"{label:<22} first {timings[0] * 1000:8.1f} ms   warm median {statistics.median(warm) * 1000:8.1f} ms   "
+          f"warm max {max(warm) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app.py rerun latency.")
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    for key, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(key, value)
+
+    _describe("cached resources", measure(args.app, args.reruns, clear_cache=False))
+    _describe("cache cleared per run", measure(args.app, args.reruns, clear_cache=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Measures the cold start of app.py: the modules its first Streamlit run imports
+(from `python -X importtime`) and checks them against a startup budget.
+
+    python measure_startup.py
+    python measure_startup.py --top 30 --budget-ms 800
+
+Two fresh interpreters are profiled: one that only imports streamlit's AppTest,
+and one that also runs app.py once with it. Modules loaded by the second and not
+the first are app.py's own import cost. The run fails (exit status 1) when that
+cost exceeds the budget or when a module that should only load on first use
+(chat models, LangGraph, the Notion client, the Mermaid component) was imported.
+Placeholder credentials are used when none are set; no external call is made
+because no widget that triggers the agent is clicked.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+from measure_reruns import PLACEHOLDER_ENV
+
+# Import time app.py's first run may add on top of streamlit itself.
+STARTUP_IMPORT_BUDGET_MS = 750
+# Top-level packages that must not be imported before the agent is run or a graph is shown.
+LAZY_PACKAGES = ("langchain", "langchain_core", "langchain_google_genai", "langchain_anthropic", "langgraph",
+                 "notion_client", "streamlit_mermaid")
+
+_BASELINE_CODE = "from streamlit.testing.v1 import AppTest"
+_APP_RUN_CODE = """
+import sys, json
+from streamlit.testing.v1 import AppTest
+app_test = AppTest.from_file({app_path!r}, default_timeout=120)
+app_test.run()
+if app_test.exception:
+    raise SystemExit("app.py raised: " + app_test.exception[0].message)
+print(json.dumps(sorted(name for name in sys.modules if "." not in name)))
+"""
+# `import time: self [us] | cumulative | imported package`; the package name is indented by nesting depth.
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def profile_imports(code: str) -> tuple:
+    """({module: (self us, cumulative us, depth)}, stdout) for `code` run in a fresh `python -X importtime`."""
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    for key, value in PLACEHOLDER_ENV.items():
+        env.setdefault(key, value)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"Profiled interpreter failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.setdefault(name, (int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules, result.stdout
+
+
+def startup_report(app_path: str, top: int) -> dict:
+    baseline, _ = profile_imports(_BASELINE_CODE)
+    app_run, stdout = profile_imports(_APP_RUN_CODE.format(app_path=app_path))
+    added = {name: timing for name, timing in app_run.items() if name not in baseline}
+    loaded_packages = set(json.loads(stdout.strip().splitlines()[-1]))
+    # The shallowest newly imported modules are the ones app.py (or its imports) asked for directly.
+    shallowest = min((depth for _, _, depth in added.values()), default=0)
+    heaviest = sorted(((name, cumulative_us) for name, (_, cumulative_us, depth) in added.items() if depth == shallowest),
+                      key=lambda item: item[1], reverse=True)
+    return {
+        "app": app_path,
+        "import_ms": round(sum(self_us for self_us, _, _ in added.values()) / 1000, 1),
+        "modules": len(added),
+        "heaviest": [{"module": name, "cumulative_ms": round(cumulative_us / 1000, 1)} for name, cumulative_us in heaviest[:top]],
+        "eager_lazy_packages": sorted(loaded_packages.intersection(LAZY_PACKAGES)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the imports of app.py's first run against a startup budget.")
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest top-level imports to list")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_IMPORT_BUDGET_MS)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = startup_report(args.app, args.top)
+    report["budget_ms"] = args.budget_ms
+    report["within_budget"] = report["import_ms"] <= args.budget_ms and not report["eager_lazy_packages"]
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['app']}: {report['import_ms']:.1f} ms importing {report['modules']} modules "
+              f"(budget {args.budget_ms:.0f} ms)")
+        for entry in report["heaviest"]:
+            print(f"  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+        if report["eager_lazy_packages"]:
+            print(f"Imported at startup, should load on first use: {', '.join(report['eager_lazy_packages'])}")
+    sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Compact intermediate representation of the generated Mermaid flowcharts.
+
+A diagram is parsed once into parallel arrays (node table, edge table) whose
+labels are interned in one string table, serialized next to the diagram in the
+`graph_ir` column of graphs/<page_id>_graphs.csv. The IR gives each graph a
+structural fingerprint (so unchanged graphs are not rendered or exported again)
+and a structural diff between two versions of a block's graph.
+"""
+import re
+import json
+import hashlib
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the serialized layout changes; older IR strings are re-parsed from the diagram.
+IR_VERSION = 2
+
+# (opening, closing, shape) - longest openers first.
+NODE_SHAPES: List[Tuple[str, str, str]] = [
+    ("(((", ")))", "double_circle"),
+    ("((", "))", "circle"),
+    ("([", "])", "stadium"),
+    ("[[", "]]", "subroutine"),
+    ("[(", ")]", "cylinder"),
+    ("{{", "}}", "hexagon"),
+    ("[/", "/]", "parallelogram"),
+    ("[\\", "\\]", "parallelogram_alt"),
+    ("[", "]", "rect"),
+    ("(", ")", "round"),
+    ("{", "}", "rhombus"),
+    (">", "]", "flag"),
+]
+SHAPE_NAMES = ("rect",) + tuple(dict.fromkeys(shape for _, _, shape in NODE_SHAPES if shape != "rect"))
+SHAPE_DELIMITERS = {shape: (opening, closing) for opening, closing, shape in NODE_SHAPES}
+ARROWS = ("-->", "---", "-.->", "-.-", "==>", "===", "--o", "--x", "<-->")
+
+_HEADER_RE = re.compile(r"^(?:graph|flowchart)\b\s*(\w+)?", re.IGNORECASE)
+_DIRECTIVE_STATEMENTS = ("classDef ", "class ", "style ", "linkStyle ", "click ", "subgraph ", "direction ")
+_NODE_ID_RE = re.compile(r"\s*([^\s\[\](){}<>|&;\"'=.-][^\s\[\](){}<>|&;\"'=]*?)(?=[\s\[\](){}>|&;]|-[-.>ox]|==|$)")
+_LINK_RE = re.compile(r"\s*(<-->|-\.+->|-\.+-|={2,}>|={3,}|-{2,}>|-{3,}|--o|--x)\s*(?:\|([^|]*)\|)?")
+# `A -- label --> B` / `A -. label .-> B` / `A == label ==> B`
+_TEXT_LINK_RE = re.compile(r"\s*(--|-\.|==)\s+([^|>]+?)\s*(-->|---|\.->|==>)")
+_TEXT_LINK_ARROWS = {"-->": "-->", "---": "---", ".->": "-.->", "==>": "==>"}
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def strip_mermaid_fences(mermaid_code: str) -> str:
+    """Removes the surrounding ```mermaid ... ``` fences from generated code."""
+    code = mermaid_code.strip()
+    if code.startswith("```mermaid"):
+        code = code[len("```mermaid"):]
+    if code.endswith("```"):
+        code = code[:-len("```")]
+    return code.strip()
+
+
+def _normalize_label(label: str) -> str:
+    return _WHITESPACE_RE.sub(" ", label.replace("#quot;", '"')).strip()
+
+
+def _canonical_arrow(arrow: str) -> str:
+    if arrow.startswith("<"):
+        return "<-->"
+    if arrow.startswith("-."):
+        return "-.->" if arrow.endswith(">") else "-.-"
+    if arrow.startswith("="):
+        return "==>" if arrow.endswith(">") else "==="
+    if arrow.endswith("o") or arrow.endswith("x"):
+        return "--" + arrow[-1]
+    return "-->" if arrow.endswith(">") else "---"
+
+
+class MermaidGraph:
+    """
+    Flowchart as parallel arrays: node i is (node_ids[i], labels[node_label[i]],
+    SHAPE_NAMES[node_shape[i]]); edge j goes from node edge_src[j] to node
+    edge_dst[j] with label labels[edge_label[j]] (-1 when unlabeled) and arrow
+    ARROWS[edge_arrow[j]]. Labels are interned, so repeated "[value]" leaves cost one string.
+    `directives` keeps the styling and grouping statements (classDef, style,
+    subgraph, ...) verbatim: they are not diffed, but they change the rendering.
+    `unparsed` counts the statements the parser could not read (e.g. `A ~~~ B`);
+    they are missing from the arrays, so the fingerprint does not identify such a diagram.
+    """
+
+    __slots__ = ("direction", "labels", "node_ids", "node_label", "node_shape",
+                 "edge_src", "edge_dst", "edge_label", "edge_arrow", "directives", "unparsed", "_label_index", "_node_index")
+
+    def __init__(self, direction: str = "TD"):
+        self.direction = direction
+        self.labels: List[str] = []
+        self.node_ids: List[str] = []
+        self.node_label = array("i")
+        self.node_shape = array("b")
+        self.edge_src = array("i")
+        self.edge_dst = array("i")
+        self.edge_label = array("i")
+        self.edge_arrow = array("b")
+        self.directives: List[str] = []
+        self.unparsed = 0
+        self._label_index: Dict[str, int] = {}
+        self._node_index: Dict[str, int] = {}
+
+    def intern(self, label: str) -> int:
+        index = self._label_index.get(label)
+        if index is None:
+            index = self._label_index[label] = len(self.labels)
+            self.labels.append(label)
+        return index
+
+    def add_node(self, node_id: str, label: Optional[str] = None, shape: str = "rect") -> int:
+        """Returns the node's index; a later definition with a label replaces a bare reference."""
+        index = self._node_index.get(node_id)
+        if index is None:
+            index = self._node_index[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+            self.node_label.append(self.intern(label if label is not None else node_id))
+            self.node_shape.append(SHAPE_NAMES.index(shape))
+        elif label is not None and self.labels[self.node_label[index]] == node_id:
+            self.node_label[index] = self.intern(label)
+            self.node_shape[index] = SHAPE_NAMES.index(shape)
+        return index
+
+    def add_edge(self, source: int, target: int, label: Optional[str] = None, arrow: str = "-->"):
+        self.edge_src.append(source)
+        self.edge_dst.append(target)
+        self.edge_label.append(self.intern(label) if label else -1)
+        self.edge_arrow.append(ARROWS.index(arrow))
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_src)
+
+    def node_text(self, node: int) -> str:
+        return self.labels[self.node_label[node]]
+
+    def edge_text(self, edge: int) -> Optional[str]:
+        label_index = self.edge_label[edge]
+        return self.labels[label_index] if label_index >= 0 else None
+
+    def roots(self) -> List[int]:
+        """Nodes without incoming edges, in definition order (the first node when every node has one)."""
+        targets = set(self.edge_dst)
+        roots = [node for node in range(self.node_count) if node not in targets]
+        return roots or ([0] if self.node_count else [])
+
+    def node_statement(self, node: int, id_prefix: str = "") -> str:
+        """Mermaid definition of one node, e.g. `check{"condition?"}`, with its id prefixed by `id_prefix`."""
+        opening, closing = SHAPE_DELIMITERS[SHAPE_NAMES[self.node_shape[node]]]
+        label = self.node_text(node).replace('"', "#quot;")
+        return f'{id_prefix}{self.node_ids[node]}{opening}"{label}"{closing}'
+
+    def edge_statement(self, edge: int, id_prefix: str = "", source: Optional[str] = None) -> str:
+        """Mermaid statement of one edge; `source` replaces the (prefixed) source node id, e.g. with a shared node."""
+        label = self.edge_text(edge)
+        link = f"{ARROWS[self.edge_arrow[edge]]}|{label.replace('|', '/')}|" if label else ARROWS[self.edge_arrow[edge]]
+        source = source if source is not None else f"{id_prefix}{self.node_ids[self.edge_src[edge]]}"
+        return f"{source} {link} {id_prefix}{self.node_ids[self.edge_dst[edge]]}"
+
+    def to_json(self) -> str:
+        return json.dumps([
+            IR_VERSION, self.direction, self.labels, self.node_ids,
+            self.node_label.tolist(), self.node_shape.tolist(),
+            self.edge_src.tolist(), self.edge_dst.tolist(), self.edge_label.tolist(), self.edge_arrow.tolist(),
+            self.directives, self.unparsed,
+        ], ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: str) -> "MermaidGraph":
+        fields = json.loads(payload)
+        if fields[0] != IR_VERSION:
+            raise ValueError(f"Unsupported graph IR version {fields[0]}")
+        _, direction, labels, node_ids, node_label, node_shape, edge_src, edge_dst, edge_label, edge_arrow, directives, unparsed = fields
+        graph = cls(direction)
+        graph.labels = labels
+        graph.node_ids = node_ids
+        graph.node_label = array("i", node_label)
+        graph.node_shape = array("b", node_shape)
+        graph.edge_src = array("i", edge_src)
+        graph.edge_dst = array("i", edge_dst)
+        graph.edge_label = array("i", edge_label)
+        graph.edge_arrow = array("b", edge_arrow)
+        graph.directives = directives
+        graph.unparsed = unparsed
+        graph._label_index = {label: index for index, label in enumerate(labels)}
+        graph._node_index = {node_id: index for index, node_id in enumerate(node_ids)}
+        return graph
+
+    def fingerprint(self) -> str:
+        """Hash of everything that affects rendering; equal for diagrams that differ only in whitespace, fences or comments."""
+        return hashlib.sha256(self.to_json().encode("utf-8")).hexdigest()
+
+    def _node_key(self, node: int) -> Tuple[str, str]:
+        return SHAPE_NAMES[self.node_shape[node]], self.node_text(node)
+
+    def node_keys(self) -> Counter:
+        """Nodes by (shape, label); ids are ignored because regenerated graphs rename them freely."""
+        return Counter(self._node_key(node) for node in range(self.node_count))
+
+    def edge_keys(self) -> Counter:
+        return Counter(
+            (self.node_text(self.edge_src[edge]), self.edge_text(edge), self.node_text(self.edge_dst[edge]))
+            for edge in range(self.edge_count)
+        )
+
+    def decisions(self) -> Dict[str, List[Tuple[Optional[str], str]]]:
+        """Decision (rhombus) label -> sorted (branch label, target label) pairs."""
+        rhombus = SHAPE_NAMES.index("rhombus")
+        branches: Dict[str, List[Tuple[Optional[str], str]]] = {}
+        for node in range(self.node_count):
+            if self.node_shape[node] == rhombus:
+                branches.setdefault(self.node_text(node), [])
+        for edge in range(self.edge_count):
+            source = self.edge_src[edge]
+            if self.node_shape[source] == rhombus:
+                branches[self.node_text(source)].append((self.edge_text(edge), self.node_text(self.edge_dst[edge])))
+        return {label: sorted(pairs, key=lambda pair: (pair[0] or "", pair[1])) for label, pairs in branches.items()}
+
+
+def _parse_node(graph: MermaidGraph, line: str, position: int) -> Tuple[Optional[int], int]:
+    match = _NODE_ID_RE.match(line, position)
+    if not match:
+        return None, position
+    node_id, position = match.group(1), match.end()
+    for opening, closing, shape in NODE_SHAPES:
+        if not line.startswith(opening, position):
+            continue
+        label_start = position + len(opening)
+        if line.startswith('"', label_start):
+            quote_end = line.find('"', label_start + 1)
+            if quote_end < 0 or not line.startswith(closing, quote_end + 1):
+                continue
+            label, position = line[label_start + 1:quote_end], quote_end + 1 + len(closing)
+        else:
+            label_end = line.find(closing, label_start)
+            if label_end < 0:
+                continue
+            label, position = line[label_start:label_end], label_end + len(closing)
+        return graph.add_node(node_id, _normalize_label(label), shape), position
+    return graph.add_node(node_id), position
+
+
+def _parse_node_group(graph: MermaidGraph, line: str, position: int) -> Tuple[List[int], int]:
+    """`A`, or `A & B & C`."""
+    nodes = []
+    while True:
+        node, position = _parse_node(graph, line, position)
+        if node is None:
+            return nodes, position
+        nodes.append(node)
+        ampersand = re.compile(r"\s*&").match(line, position)
+        if not ampersand:
+            return nodes, position
+        position = ampersand.end()
+
+
+def _parse_statement(graph: MermaidGraph, line: str) -> bool:
+    """Adds the statement's nodes and edges; False when part of it could not be read."""
+    sources, position = _parse_node_group(graph, line, 0)
+    while sources:
+        link = _LINK_RE.match(line, position)
+        if link:
+            arrow, label = _canonical_arrow(link.group(1)), link.group(2)
+        else:
+            link = _TEXT_LINK_RE.match(line, position)
+            if not link:
+                return not line[position:].strip()
+            arrow, label = _TEXT_LINK_ARROWS[link.group(3)], link.group(2)
+        targets, position = _parse_node_group(graph, line, link.end())
+        label = _normalize_label(label.strip('"')) if label else None
+        for source in sources:
+            for target in targets:
+                graph.add_edge(source, target, label, arrow)
+        sources = targets
+    return False
+
+
+def parse_mermaid(mermaid_code: str) -> MermaidGraph:
+    """
+    Parses a flowchart (with or without code fences). Comments are dropped; styling and grouping statements go to
+    `directives`; statements that cannot be read are counted in `unparsed`.
+    """
+    graph = MermaidGraph()
+    for raw_line in strip_mermaid_fences(mermaid_code).splitlines():
+        for statement in raw_line.split(";"):
+            statement = statement.strip()
+            if not statement or statement.startswith("%%"):
+                continue
+            if statement.startswith(_DIRECTIVE_STATEMENTS) or statement == "end":
+                graph.directives.append(_normalize_label(statement))
+                continue
+            header = _HEADER_RE.match(statement)
+            if header:
+                graph.direction = (header.group(1) or "TD").upper()
+                continue
+            if not _parse_statement(graph, statement):
+                graph.unparsed += 1
+    return graph
+
+
+def graph_ir_json(mermaid_graph: Any) -> Optional[str]:
+    """Serialized IR for a mermaid_graph cell, or None for empty cells and diagrams that fail to parse."""
+    if not isinstance(mermaid_graph, str) or not mermaid_graph.strip():
+        return None
+    try:
+        return parse_mermaid(mermaid_graph).to_json()
+    except Exception as e:
+        logger.error(f"Could not parse Mermaid graph into IR: {str(e)}")
+        return None
+
+
+def load_graph(mermaid_graph: Any, graph_ir: Any = None) -> Optional[MermaidGraph]:
+    """The stored IR when present and current, otherwise the IR parsed from the diagram."""
+    if isinstance(graph_ir, str) and graph_ir:
+        try:
+            return MermaidGraph.from_json(graph_ir)
+        except (ValueError, TypeError):
+            pass
+    payload = graph_ir_json(mermaid_graph)
+    return MermaidGraph.from_json(payload) if payload else None
+
+
+def diff_graphs(old: Optional[MermaidGraph], new: Optional[MermaidGraph]) -> Dict[str, Any]:
+    """
+    Structural differences between two versions of a block's graph, matching
+    nodes by shape and label. `changed_decisions` lists decisions present in
+    both versions whose branches (branch label and target label) differ.
+    """
+    old_nodes = old.node_keys() if old else Counter()
+    new_nodes = new.node_keys() if new else Counter()
+    old_edges = old.edge_keys() if old else Counter()
+    new_edges = new.edge_keys() if new else Counter()
+    old_decisions = old.decisions() if old else {}
+    new_decisions = new.decisions() if new else {}
+
+    changed_decisions = [
+        {"decision": label, "before": old_decisions[label], "after": new_decisions[label]}
+        for label in sorted(old_decisions.keys() & new_decisions.keys())
+        if old_decisions[label] != new_decisions[label]
+    ]
+    diff = {
+        "added_nodes": sorted((new_nodes - old_nodes).elements()),
+        "removed_nodes": sorted((old_nodes - new_nodes).elements()),
+        "added_edges": sorted((new_edges - old_edges).elements(), key=str),
+        "removed_edges": sorted((old_edges - new_edges).elements(), key=str),
+        "added_decisions": sorted(new_decisions.keys() - old_decisions.keys()),
+        "removed_decisions": sorted(old_decisions.keys() - new_decisions.keys()),
+        "changed_decisions": changed_decisions,
+    }
+    diff["changed"] = any(diff[key] for key in diff)
+    return diff
+
+
+def compare_graph_versions(previous_df: Any, df: Any) -> Dict[str, Any]:
+    """
+    Compares two graphs DataFrames (block_name, mermaid_graph and optionally graph_ir) by block name.
+    Returns the unchanged, added and removed block names and, for each changed block, its diff_graphs() result.
+    """
+    def graphs_by_block(frame) -> Dict[str, Tuple[Any, Any]]:
+        graph_irs = frame["graph_ir"] if "graph_ir" in frame else [None] * len(frame)
+        # An empty block name comes back from the CSV as NaN.
+        return {name if isinstance(name, str) else "": (graph, graph_ir)
+                for name, graph, graph_ir in zip(frame["block_name"], frame["mermaid_graph"], graph_irs)}
+
+    previous, current = graphs_by_block(previous_df), graphs_by_block(df)
+    changes: Dict[str, Any] = {
+        "unchanged": [],
+        "changed": {},
+        "added": sorted(current.keys() - previous.keys()),
+        "removed": sorted(previous.keys() - current.keys()),
+    }
+    for name in current.keys() & previous.keys():
+        old_graph, new_graph = load_graph(*previous[name]), load_graph(*current[name])
+        if (old_graph and old_graph.fingerprint()) == (new_graph and new_graph.fingerprint()):
+            changes["unchanged"].append(name)
+            continue
+        graph_diff = diff_graphs(old_graph, new_graph)
+        if graph_diff["changed"]:
+            changes["changed"][name] = graph_diff
+        else:
+            # Same nodes and edges; only ids, ordering or styling differ.
+            changes["unchanged"].append(name)
+    changes["unchanged"].sort()
+    return changes
@@ -0,0 +1,240 @@
+import json
+import zlib
+import base64
+import hashlib
+import zipfile
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+import pandas as pd
+
+from http_session import get_http_session
+from mermaid_ir import load_graph, strip_mermaid_fences
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Rendered SVGs kept in memory, keyed by a hash of the Mermaid code and theme.
+SVG_CACHE_SIZE = 512
+# mermaid.ink reads the diagram from the GET URL: code up to this length is sent base64-encoded,
+# longer code pako-compressed (the mermaid.live format) so large stitched diagrams still fit.
+MERMAID_INK_PLAIN_CHARS = 2000
+# Longest URL sent to mermaid.ink; a diagram whose URL is longer cannot be rendered there.
+MERMAID_INK_MAX_URL_CHARS = 8000
+
+# Exports stay in memory up to this size, then roll over to a temporary file on disk.
+EXPORT_SPOOL_BYTES = 4 * 1024 * 1024
+# SVGs rendered concurrently while the archive is written, and how many rows rendering may run ahead of compression.
+EXPORT_RENDER_WORKERS = 4
+EXPORT_RENDER_AHEAD = 16
+# CSV rows serialized at a time, and bytes per read when an export is copied out.
+EXPORT_CSV_CHUNK_ROWS = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Internal columns of a graphs DataFrame left out of the CSV download.
+EXPORT_CSV_EXCLUDED_COLUMNS = ("graph_ir",)
+
+_svg_cache: "OrderedDict[str, str]" = OrderedDict()
+_svg_cache_lock = threading.Lock()
+
+
+def mermaid_ink_url(mermaid_code: str, theme: str = None) -> str:
+    """mermaid.ink SVG URL of a diagram (with or without fences); see MERMAID_INK_PLAIN_CHARS."""
+    code = strip_mermaid_fences(mermaid_code)
+    if len(code) <= MERMAID_INK_PLAIN_CHARS:
+        payload = base64.urlsafe_b64encode(code.encode("utf-8")).decode("ascii")
+    else:
+        state = json.dumps({"code": code, "mermaid": {"theme": theme or "default"}})
+        payload = "pako:" + base64.urlsafe_b64encode(zlib.compress(state.encode("utf-8"), 9)).decode("ascii")
+    return f"https://mermaid.ink/svg/{payload}" + (f"?type={theme}" if theme else "")
+
+def mermaid_ink_renderable(mermaid_code: str) -> bool:
+    """Whether the diagram fits in a mermaid.ink URL, so it can be validated and exported."""
+    return len(mermaid_ink_url(mermaid_code, "default")) <= MERMAID_INK_MAX_URL_CHARS
+
+@tracing.traced("render.mermaid_to_svg")
+def mermaid_to_svg(mermaid_code: str, theme: str = "default") -> str | None:
+    """
+    Generates SVG content from Mermaid code using mermaid.ink API.
+    Returns the SVG string or None if an error occurs.
+    """
+    logger.info("Generating SVG from Mermaid code using mermaid.ink API")
+    try:
+        url = mermaid_ink_url(mermaid_code, theme)
+        if len(url) > MERMAID_INK_MAX_URL_CHARS:
+            logger.error(f"Mermaid diagram is too large for mermaid.ink ({len(url)} URL characters)")
+            return None
+
+        # Make the request
+        logger.debug(f"Requesting SVG from mermaid.ink API: {url}")
+        response = get_http_session().get(url, timeout=30)
+        
+        if response.status_code == 200:
+            logger.info("Successfully generated SVG")
+            return response.content.decode('utf-8')
+        else:
+            logger.error(f"Failed to generate SVG. Status code: {response.status_code}")
+            logger.error(f"Response content: {response.text}")
+            return None
+
+    except Exception as e:
+        logger.error(f"Error generating SVG: {str(e)}")
+        return None
+
+def graph_render_key(mermaid_code: str, graph_ir: str = None) -> str:
+    """
+    Identifies what mermaid.ink would draw: the graph IR fingerprint, so diagrams
+    differing only in fences, whitespace or comments share one rendering.
+    Falls back to a hash of the fence-stripped code when the diagram does not parse
+    or has statements the IR could not represent.
+    """
+    graph = load_graph(mermaid_code, graph_ir)
+    if graph is not None and not graph.unparsed:
+        return graph.fingerprint()
+    return hashlib.sha256(strip_mermaid_fences(str(mermaid_code)).encode("utf-8")).hexdigest()
+
+def mermaid_to_svg_cached(mermaid_code: str, theme: str = "default", graph_ir: str = None) -> str | None:
+    """
+    mermaid_to_svg behind a process-wide LRU cache keyed by graph_render_key, so the
+    same graph is fetched from mermaid.ink once across reruns, sessions and API requests.
+    Failures are not cached.
+    """
+    key = f"{theme}:{graph_render_key(mermaid_code, graph_ir)}"
+    with _svg_cache_lock:
+        if key in _svg_cache:
+            _svg_cache.move_to_end(key)
+            return _svg_cache[key]
+    svg_content = mermaid_to_svg(mermaid_code, theme=theme)
+    if svg_content:
+        with _svg_cache_lock:
+            _svg_cache[key] = svg_content
+            while len(_svg_cache) > SVG_CACHE_SIZE:
+                _svg_cache.popitem(last=False)
+    return svg_content
+
+class ExportFile:
+    """
+    A finished export (ZIP or CSV) in a SpooledTemporaryFile: in memory while small, on disk
+    beyond EXPORT_SPOOL_BYTES. Reads rewind under a lock, so it can be served from several threads.
+    `error_message` lists the rows that could not be exported.
+
+    Memory stays bounded only for consumers of iter_chunks, such as the job API's export
+    endpoints. read_bytes - and so a Streamlit download button, which only takes the whole
+    payload - holds the entire export in memory while it is served.
+    """
+
+    def __init__(self, spool: tempfile.SpooledTemporaryFile, error_message: Optional[str] = None):
+        self.spool = spool
+        self.error_message = error_message
+        self.size = spool.tell()
+        self._lock = threading.Lock()
+
+    def iter_chunks(self, chunk_size: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+        with self._lock:
+            self.spool.seek(0)
+            while True:
+                chunk = self.spool.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def read_bytes(self) -> bytes:
+        """The whole export in memory, for APIs that only take bytes (e.g. a Streamlit deferred download)."""
+        return b"".join(self.iter_chunks())
+
+    def close(self):
+        self.spool.close()
+
+
+def _new_spool() -> tempfile.SpooledTemporaryFile:
+    return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode="w+b", prefix="blv_export_")
+
+
+def _render_rows(df: pd.DataFrame, theme: str, workers: int) -> Iterator[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    (block name, SVG or None, error or None) per row, in order. Rows are rendered on `workers` threads
+    at most EXPORT_RENDER_AHEAD rows ahead of the consumer, so rendering overlaps with writing the
+    archive while only a bounded number of SVGs is held in memory.
+    """
+    def render(row) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            svg_content = mermaid_to_svg_cached(row['mermaid_graph'], theme=theme, graph_ir=row.get('graph_ir'))
+            return svg_content, None if svg_content else f"Failed to generate SVG for {row['block_name']}"
+        except Exception as e:
+            logger.error(f"Error processing SVG for {row['block_name']}: {str(e)}")
+            return None, f"Error processing {row['block_name']}: {str(e)}"
+
+    pending = deque()
+    rows = (row for _, row in df.iterrows())
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="svg-export") as executor:
+        render_in_span = tracing.propagate(render)
+        for row in rows:
+            pending.append((row['block_name'], executor.submit(render_in_span, row)))
+            if len(pending) >= EXPORT_RENDER_AHEAD:
+                block_name, future = pending.popleft()
+                yield (block_name, *future.result())
+        while pending:
+            block_name, future = pending.popleft()
+            yield (block_name, *future.result())
+
+
+def write_zip_of_svgs(df: pd.DataFrame, fileobj, theme: str = "default", workers: int = EXPORT_RENDER_WORKERS) -> Optional[str]:
+    """
+    Streams a zip of the SVG of every row of `df` into the binary file object `fileobj`, one entry at a time.
+    Returns the error message for the rows that could not be rendered, or None.
+    """
+    error_messages = []
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for block_name, svg_content, error_message in _render_rows(df, theme, workers):
+            if error_message:
+                error_messages.append(error_message)
+                continue
+            with zipf.open(f"{block_name.replace('/', '_')}.svg", "w") as entry:
+                entry.write(svg_content.encode("utf-8"))
+    return "\n".join(error_messages) if error_messages else None
+
+
+@tracing.traced("render.export_zip_of_svgs")
+def export_zip_of_svgs(df: pd.DataFrame, theme: str = "default", workers: int = EXPORT_RENDER_WORKERS) -> ExportFile:
+    """Zip of every row's SVG as an ExportFile; memory stays bounded while it is built, however many graphs the page has."""
+    logger.info(f"Exporting {len(df)} SVGs to a zip file")
+    spool = _new_spool()
+    try:
+        error_message = write_zip_of_svgs(df, spool, theme=theme, workers=workers)
+    except BaseException:
+        spool.close()
+        raise
+    return ExportFile(spool, error_message)
+
+
+@tracing.traced("render.export_csv")
+def export_csv(df: pd.DataFrame, chunk_rows: int = EXPORT_CSV_CHUNK_ROWS) -> ExportFile:
+    """
+    `df.to_csv(index=False)` without the EXPORT_CSV_EXCLUDED_COLUMNS as an ExportFile,
+    serialized EXPORT_CSV_CHUNK_ROWS rows at a time.
+    """
+    df = df.drop(columns=list(EXPORT_CSV_EXCLUDED_COLUMNS), errors="ignore")
+    spool = _new_spool()
+    try:
+        for start in range(0, max(len(df), 1), chunk_rows):
+            spool.write(df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode("utf-8"))
+    except BaseException:
+        spool.close()
+        raise
+    return ExportFile(spool)
+
+
+@tracing.traced("render.create_zip_of_svgs")
+def create_zip_of_svgs(df: pd.DataFrame, theme: str = "default") -> tuple[bytes, str]:
+    """
+    Create a zip file containing all SVGs from the DataFrame
+    Returns a tuple of (zip_bytes, error_message)
+    """
+    export = export_zip_of_svgs(df, theme=theme)
+    try:
+        return export.read_bytes(), export.error_message
+    finally:
+        export.close()
@@ -0,0 +1,358 @@
+"""
+Deterministic bulk export of the METADATA_JSON_PROMPT schema
+(identifier / parameter / prompts / conditionalLogic[]) for every spec block
+of a page, streamed to JSON Lines - one object per block, in page order.
+
+    python metadata_export.py 1ef7432eb8438081be51f2ec9121f6bd --table Doctors
+    python metadata_export.py 1ef7432eb8438081be51f2ec9121f6bd --table Doctors --llm-fallback --output doctors.jsonl
+
+A spec block is read from the page's block snapshot (blocks/<page_id>_all_blocks.txt):
+its Parameter and Prompts tables, one conditionalLogic entry per condition
+code block (`// ...` lines become `codeBlock`) and the following "Value:"
+toggle as `value`. Blocks written without code blocks fall back to the if /
+else-if / else lines of their block_content. The parameter comes from the
+block's table, completed from the ERP parameters table (API Parameter Name,
+ERP Link, API Link) - or, without a table, the parameter the block mentions most.
+Only blocks with no recognizable conditions go to the LLM, and only when one is given.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import contextlib
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from file_cache import atomic_open
+from parse_spec_block import load_blocks_from_file, build_block_maps, find_spec_blocks, get_block_plain_text, \
+    get_all_descendants_content_with_indent
+from config import TABLE_MAPPING, SPEC_BLOCK_IDENTIFIER_DEFAULT
+from prompts import METADATA_JSON_PROMPT
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Exports live next to the graphs cache.
+METADATA_DIR = "graphs"
+METADATA_SUFFIX = "_metadata.jsonl"
+
+# conditionalLogic condition of an `else` without a condition of its own (see METADATA_JSON_PROMPT).
+ELSE_CONDITION = "ELSE_DEFAULT"
+
+# How each block's object was produced.
+SOURCE_BLOCKS = "blocks"
+SOURCE_CONTENT = "content"
+SOURCE_LLM = "llm"
+SOURCE_UNSTRUCTURED = "unstructured"
+
+_CONDITION_LINE_RE = re.compile(r"^\s*(else\s+if|elif|if|else)\b\s*", re.IGNORECASE)
+_COMMENT_LINE_RE = re.compile(r"^\s*(?://|#)\s?")
+_VALUE_LABEL_RE = re.compile(r"^\s*value\s*:?\s*$", re.IGNORECASE)
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def rich_text(block: Dict[str, Any], params: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Plain text of any rich-text block (paragraph, code, list item, ...). Mentions of
+    ERP parameters become their API parameter name; other mentions keep their text.
+    """
+    block_type = block.get("type")
+    return segments_text(block[block_type].get("rich_text", []) if isinstance(block.get(block_type), dict) else [], params)
+
+
+def segments_text(segments: List[Dict[str, Any]], params: Dict[str, Dict[str, Any]]) -> str:
+    text = ""
+    for segment in segments:
+        mention_id = _mention_id(segment)
+        param = params.get(mention_id) if mention_id else None
+        if param:
+            text += param.get("API Parameter Name") or param.get("Name") or segment.get("plain_text", "")
+        else:
+            text += segment.get("plain_text", "")
+    return text
+
+
+def _mention_id(segment: Dict[str, Any]) -> Optional[str]:
+    if segment.get("type") != "mention":
+        return None
+    mention = segment.get("mention", {})
+    target = mention.get(mention.get("type"), {})
+    return target.get("id", "").replace("-", "") if isinstance(target, dict) else None
+
+
+def table_rows(table_block: Dict[str, Any], blocks_by_parent_id: Dict[str, List[Dict[str, Any]]],
+               params: Dict[str, Dict[str, Any]]) -> List[List[str]]:
+    rows = []
+    for row in blocks_by_parent_id.get(table_block["id"], []):
+        cells = row.get("table_row", {}).get("cells", [])
+        rows.append([segments_text(cell, params).strip() for cell in cells])
+    return rows
+
+
+def _descendant_text(block_id: str, blocks_by_parent_id: Dict[str, List[Dict[str, Any]]],
+                     params: Dict[str, Dict[str, Any]], depth: int = 0) -> List[str]:
+    """Text lines under a block, indented one tab per level below it; empty blocks are skipped."""
+    lines = []
+    for child in blocks_by_parent_id.get(block_id, []):
+        for line in rich_text(child, params).splitlines():
+            if line.strip():
+                lines.append("\t" * depth + line.rstrip())
+        lines.extend(_descendant_text(child["id"], blocks_by_parent_id, params, depth + 1))
+    return lines
+
+
+def split_condition(text: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    (condition, comment) of a condition code block, e.g. `if { a == 1 }\\n// note` -> ("a == 1", "note");
+    None when the text holds no if / else-if / else line.
+    """
+    condition, comments = None, []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        comment = _COMMENT_LINE_RE.match(line)
+        if comment:
+            comments.append(line[comment.end():].strip())
+        elif condition is None and _CONDITION_LINE_RE.match(line):
+            condition = normalize_condition(line)
+        elif condition is not None:
+            condition = f"{condition} {line.strip()}"
+        else:
+            return None
+    if condition is None:
+        return None
+    return condition, "\n".join(comments) or None
+
+
+def normalize_condition(line: str) -> str:
+    """`else if { a == 1 }:` -> `a == 1`; a bare `else` -> ELSE_CONDITION."""
+    match = _CONDITION_LINE_RE.match(line)
+    condition = line[match.end():].strip().rstrip(":").strip() if match else line.strip()
+    if match and not condition and match.group(1).lower() == "else":
+        return ELSE_CONDITION
+    # `{ ... }` always delimits the whole condition; parentheses only when they match up.
+    while len(condition) > 1 and (condition[0] + condition[-1] == "{}" or condition[0] + condition[-1] == "()" and _wraps(condition)):
+        condition = condition[1:-1].strip()
+    return condition
+
+
+def _wraps(condition: str) -> bool:
+    """Whether the first bracket closes at the very end (`(a) && (b)` is not wrapped)."""
+    depth = 0
+    for position, char in enumerate(condition):
+        depth += char in "({"
+        depth -= char in ")}"
+        if depth == 0:
+            return position == len(condition) - 1
+    return False
+
+
+def content_logic(block_content: str) -> List[Dict[str, Any]]:
+    """
+    conditionalLogic entries from block_content: one per if / else-if / else line,
+    whose value is the non-condition text indented under it ("Value:" labels dropped).
+    """
+    entries: List[Dict[str, Any]] = []
+    current, current_indent = None, 0
+    for raw_line in str(block_content or "").splitlines():
+        if not raw_line.strip():
+            continue
+        stripped = raw_line.lstrip()
+        indent = len(raw_line[:len(raw_line) - len(stripped)].expandtabs(4))
+        if _CONDITION_LINE_RE.match(stripped):
+            current, current_indent = {"condition": normalize_condition(stripped), "codeBlock": None, "value": ""}, indent
+            entries.append(current)
+        elif current is not None and indent > current_indent and not _VALUE_LABEL_RE.match(stripped) \
+                and "FUNCTION_VALUE" not in stripped:
+            current["value"] = f"{current['value']}\n{stripped}" if current["value"] else stripped
+    return entries
+
+
+def _primary_parameter(block_id: str, blocks_by_parent_id: Dict[str, List[Dict[str, Any]]],
+                       params: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The ERP parameter mentioned most often under the block (ties go to the first mentioned)."""
+    mentions: Counter = Counter()
+
+    def count_mentions(parent_id: str):
+        for child in blocks_by_parent_id.get(parent_id, []):
+            child_type = child.get("type")
+            if isinstance(child.get(child_type), dict):
+                for segment in child[child_type].get("rich_text", []):
+                    mention_id = _mention_id(segment)
+                    if mention_id in params:
+                        mentions[mention_id] += 1
+            count_mentions(child["id"])
+
+    count_mentions(block_id)
+    if not mentions:
+        return None
+    return params[mentions.most_common(1)[0][0]]
+
+
+def _name_key(name: str) -> str:
+    """`User Relationship`, `user_relationship` and `userRelationship` compare equal."""
+    return re.sub(r"[\s_\-]+", "", name).lower()
+
+
+def _params_by_name(params: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    by_name = {}
+    for param in params.values():
+        for key in ("Name", "API Parameter Name"):
+            if param.get(key):
+                by_name.setdefault(_name_key(param[key]), param)
+    return by_name
+
+
+def _param_link(param: Optional[Dict[str, Any]]) -> Optional[str]:
+    return (param.get("ERP Link") or param.get("API Link")) if param else None
+
+
+class MetadataExporter:
+    """Builds the METADATA_JSON object of each spec block of one block snapshot."""
+
+    def __init__(self, all_blocks: List[Dict[str, Any]], params: Dict[str, Dict[str, Any]],
+                 block_identifier: str = SPEC_BLOCK_IDENTIFIER_DEFAULT, llm=None):
+        self.all_blocks = all_blocks
+        self.params = params
+        self.block_identifier = block_identifier
+        self.llm = llm
+        self.all_blocks_map, self.blocks_by_parent_id = build_block_maps(all_blocks)
+        self._params_by_name = _params_by_name(params)
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """(source, metadata) per spec block, in page order, built one block at a time."""
+        for spec_block in find_spec_blocks(self.all_blocks, self.block_identifier, self.params):
+            yield self.block_metadata(spec_block)
+
+    def block_metadata(self, spec_block: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        parameter, prompts, entries = {}, [], []
+        children = self.blocks_by_parent_id.get(spec_block["id"], [])
+        section = None
+        for child in children:
+            child_type = child.get("type")
+            text = rich_text(child, self.params).strip()
+            if child_type == "paragraph" and text in ("Parameter", "Prompts"):
+                section = text
+            elif child_type == "table" and section == "Parameter":
+                parameter = {row[0]: row[1] for row in table_rows(child, self.blocks_by_parent_id, self.params) if len(row) >= 2}
+                section = None
+            elif child_type == "table" and section == "Prompts":
+                prompts = [row for row in table_rows(child, self.blocks_by_parent_id, self.params)[1:] if row and row[0]]
+                section = None
+            elif child_type == "code":
+                condition = split_condition(text)
+                if condition:
+                    entries.append({"condition": condition[0], "codeBlock": condition[1], "value": ""})
+            elif child_type == "toggle" and _VALUE_LABEL_RE.match(text) and entries and not entries[-1]["value"]:
+                entries[-1]["value"] = "\n".join(_descendant_text(child["id"], self.blocks_by_parent_id, self.params))
+
+        name = get_block_plain_text(spec_block, self.params).replace(self.block_identifier, "").strip()
+        parameter_name = parameter.get("Parameter Name") or None
+        parameter_link = parameter.get("Parameter Link") or None
+        if parameter_name:
+            param = self._params_by_name.get(_name_key(parameter_name))
+        else:
+            param = _primary_parameter(spec_block["id"], self.blocks_by_parent_id, self.params)
+            parameter_name = (param.get("API Parameter Name") or param.get("Name")) if param else None
+        metadata = {
+            "identifier": name or parameter_name or "",
+            "parameter": {"name": parameter_name, "link": parameter_link or _param_link(param)},
+            "prompts": {"name": prompts[0][0] if prompts else None,
+                        "link": (prompts[0][1] or None) if prompts and len(prompts[0]) > 1 else None},
+            "conditionalLogic": entries,
+        }
+        if entries:
+            return SOURCE_BLOCKS, metadata
+
+        block_content = get_all_descendants_content_with_indent(
+            spec_block["id"], spec_block.get("level") or 0, self.all_blocks_map, self.blocks_by_parent_id, self.params,
+        )
+        metadata["conditionalLogic"] = content_logic(block_content)
+        if metadata["conditionalLogic"]:
+            return SOURCE_CONTENT, metadata
+        if self.llm is None:
+            return SOURCE_UNSTRUCTURED, metadata
+        logic = block_content.strip() or "\n".join(_descendant_text(spec_block["id"], self.blocks_by_parent_id, self.params))
+        try:
+            return SOURCE_LLM, llm_metadata(self.llm, logic, metadata)
+        except Exception as e:
+            logger.error(f"LLM could not structure block '{metadata['identifier']}': {str(e)}")
+            return SOURCE_UNSTRUCTURED, metadata
+
+
+def llm_metadata(llm, logic: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """METADATA_JSON_PROMPT for a block the parser found no conditions in; the known metadata values are passed along."""
+    from langchain_core.messages import HumanMessage
+
+    inputs = (
+        f"1. Conditional logic:\n{logic}\n\n"
+        f"2. Metadata values:\n"
+        f"identifier: {metadata['identifier']}\n"
+        f"parameter.name: {metadata['parameter']['name']}\n"
+        f"parameter.link: {metadata['parameter']['link']}\n"
+        f"prompts.name: {metadata['prompts']['name']}\n"
+        f"prompts.link: {metadata['prompts']['link']}\n"
+    )
+    response = llm.invoke([HumanMessage(content=f"{METADATA_JSON_PROMPT}\n\n{inputs}")])
+    text = _JSON_FENCE_RE.sub("", response.content.strip())
+    result = json.loads(text[text.find("{"):text.rfind("}") + 1])
+    if not isinstance(result, dict) or not isinstance(result.get("conditionalLogic"), list):
+        raise ValueError("LLM response is not a metadata JSON object")
+    return result
+
+
+def export_page_metadata(page_id: str, params: Dict[str, Dict[str, Any]], output_path: Optional[str] = None,
+                         block_identifier: str = SPEC_BLOCK_IDENTIFIER_DEFAULT, llm=None) -> Dict[str, int]:
+    """
+    Writes one METADATA_JSON object per spec block of blocks/<page_id>_all_blocks.txt to
+    `output_path` as JSON Lines, block by block. Returns the number of blocks per source.
+    """
+    output_path = output_path or f"{METADATA_DIR}/{page_id}{METADATA_SUFFIX}"
+    exporter = MetadataExporter(load_blocks_from_file(f"blocks/{page_id}_all_blocks.txt"), params, block_identifier, llm=llm)
+    counts: Dict[str, int] = {}
+    with atomic_open(output_path) as f:
+        for source, metadata in exporter:
+            counts[source] = counts.get(source, 0) + 1
+            f.write(json.dumps(metadata, ensure_ascii=False) + "\n")
+    logger.info(f"Wrote metadata for {sum(counts.values())} spec blocks of page {page_id} to {output_path}: {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the METADATA_JSON of every spec block of a page to JSON Lines.")
+    parser.add_argument("page_id", help="Page whose blocks/<page_id>_all_blocks.txt snapshot to read")
+    parser.add_argument("--table", choices=sorted(TABLE_MAPPING),
+                        help="ERP parameters table for parameter names and links (needs NOTION_SECRET)")
+    parser.add_argument("--block-identifier", default=SPEC_BLOCK_IDENTIFIER_DEFAULT)
+    parser.add_argument("--output", help=f"JSONL file (default: {METADATA_DIR}/<page_id>{METADATA_SUFFIX})")
+    parser.add_argument("--notion-base-url", help="Notion API base URL (e.g. a notion_stub_server.py instance)")
+    parser.add_argument("--llm-fallback", action="store_true",
+                        help="Ask the cheapest model tier (METADATA_JSON_PROMPT) for blocks without recognizable conditions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from dotenv import load_dotenv, find_dotenv
+    load_dotenv(find_dotenv(usecwd=True), override=False)
+
+    params = {}
+    if args.table:
+        from notion_client import Client as NotionClient
+        from notion_utils import extract_table_data
+        client_options = {"base_url": args.notion_base_url} if args.notion_base_url else {}
+        notion = NotionClient(auth=os.environ.get("NOTION_SECRET"), **client_options)
+        # extract_table_data reports progress with print(); keep stdout for the counts.
+        with contextlib.redirect_stdout(sys.stderr):
+            params = extract_table_data(TABLE_MAPPING[args.table], notion)
+
+    llm = None
+    if args.llm_fallback:
+        from config import build_model_tiers
+        llm = build_model_tiers()[0]["llm"]
+
+    counts = export_page_metadata(args.page_id, params, args.output, args.block_identifier, llm=llm)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+A local stand-in for the parts of the Notion API the crawler uses:
+
+    GET  /v1/blocks/{block_id}
+    GET  /v1/blocks/{block_id}/children?start_cursor=&page_size=
+    POST /v1/databases/{database_id}/query
+    GET  /__stats                      (request counters, not part of Notion)
+
+Serve a snapshot from blocks/:
+    python notion_stub_server.py --snapshot blocks/1ef7432eb8438081be51f2ec9121f6bd_all_blocks.txt
+
+Serve a synthetic tree with latency and rate limiting:
+    python notion_stub_server.py --synthetic-depth 4 --synthetic-fanout 8 --latency-ms 150 --rate-limit-probability 0.05
+
+Then point the client at it:
+    NotionClient(auth="stub", base_url="http://127.0.0.1:8765")
+"""
+import os
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from config import SPEC_BLOCK_IDENTIFIER_DEFAULT
+from parse_spec_block import load_blocks_from_file
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 100
+
+
+def _normalize_id(block_id: str) -> str:
+    return block_id.replace("-", "")
+
+
+def _dashed_id(raw_id: str) -> str:
+    raw_id = _normalize_id(raw_id)
+    return f"{raw_id[:8]}-{raw_id[8:12]}-{raw_id[12:16]}-{raw_id[16:20]}-{raw_id[20:]}"
+
+
+def _rich_text(content: str) -> List[Dict[str, Any]]:
+    return [{
+        "type": "text",
+        "text": {"content": content, "link": None},
+        "annotations": {"bold": False, "italic": False, "strikethrough": False, "underline": False, "code": False, "color": "default"},
+        "plain_text": content,
+        "href": None,
+    }]
+
+
+def _mention(row_id: str, name: str) -> Dict[str, Any]:
+    return {
+        "type": "mention",
+        "mention": {"type": "page", "page": {"id": _dashed_id(row_id)}},
+        "plain_text": name,
+        "href": None,
+    }
+
+
+class NotionWorkspace:
+    """In-memory blocks, parent/child order and database rows served by the stub."""
+
+    def __init__(self):
+        self.blocks: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.databases: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add_block(self, block: Dict[str, Any], parent_id: str):
+        block_id = _normalize_id(block["id"])
+        self.blocks[block_id] = block
+        self.children.setdefault(_normalize_id(parent_id), []).append(block_id)
+
+    def add_page(self, page_id: str, title: str = "Stub page"):
+        self.blocks[_normalize_id(page_id)] = {
+            "object": "block",
+            "id": _dashed_id(page_id),
+            "type": "child_page",
+            "child_page": {"title": title},
+            "has_children": bool(self.children.get(_normalize_id(page_id))),
+            "archived": False,
+            "in_trash": False,
+        }
+
+    def load_snapshot(self, snapshot_path: str) -> str:
+        """Loads a blocks/<page_id>_all_blocks.txt snapshot and returns the page id."""
+        page_id = os.path.basename(snapshot_path).split("_")[0]
+        for block in load_blocks_from_file(snapshot_path):
+            block = {key: value for key, value in block.items() if key != "level"}
+            parent = block.get("parent", {})
+            parent_id = parent.get("block_id") or parent.get("page_id") or parent.get("database_id")
+            if parent_id:
+                self.add_block(block, parent_id)
+        self.add_page(page_id)
+        return page_id
+
+    def generate_database(self, database_id: str, rows: int) -> List[str]:
+        """Creates parameter rows shaped like the TABLE_MAPPING databases; returns their ids."""
+        row_ids = []
+        pages = []
+        for index in range(rows):
+            row_id = uuid.uuid4().hex
+            name = f"syntheticParam{index}"
+            pages.append({
+                "object": "page",
+                "id": _dashed_id(row_id),
+                "url": f"https://www.notion.so/{name}-{row_id}",
+                "properties": {
+                    "Name": {"type": "title", "title": _rich_text(f"Synthetic Param {index}")},
+                    "API Parameter Name": {"type": "rich_text", "rich_text": _rich_text(name)},
+                    "API Link": {"type": "rich_text", "rich_text": _rich_text(f"/api/params/{name}")},
+                    "Business Description": {"type": "rich_text", "rich_text": _rich_text(f"Description of {name}")},
+                    "ERP Link": {"type": "url", "url": f"https://erp.example.com/params/{index}"},
+                },
+            })
+            row_ids.append(row_id)
+        self.databases[_normalize_id(database_id)] = pages
+        return row_ids
+
+    def generate_tree(self, page_id: str, depth: int, fanout: int, spec_every: int = 3, param_ids: Optional[List[str]] = None):
+        """
+        Builds a synthetic page `depth` levels deep with `fanout` children per
+        block. Every `spec_every`-th top-level toggle is a spec toggle; inner
+        blocks are toggles with `if <param> == <value>` titles and leaves are
+        quotes, mirroring the shape of real spec pages.
+        """
+        param_ids = param_ids or []
+        counter = [0]
+
+        def make_block(parent_id: str, parent_is_page: bool, title_parts: List[Dict[str, Any]], has_children: bool, block_type: str):
+            counter[0] += 1
+            block_id = uuid.uuid4().hex
+            parent = {"type": "page_id", "page_id": _dashed_id(parent_id)} if parent_is_page else {"type": "block_id", "block_id": _dashed_id(parent_id)}
+            block = {
+                "object": "block",
+                "id": _dashed_id(block_id),
+                "parent": parent,
+                "created_time": "2025-01-01T00:00:00.000Z",
+                "last_edited_time": "2025-01-01T00:00:00.000Z",
+                "has_children": has_children,
+                "archived": False,
+                "in_trash": False,
+                "type": block_type,
+                block_type: {"rich_text": title_parts, "color": "default"},
+            }
+            self.add_block(block, parent_id)
+            return block_id
+
+        def condition_parts(level: int, index: int) -> List[Dict[str, Any]]:
+            if param_ids:
+                row_id = param_ids[(level * fanout + index) % len(param_ids)]
+                return _rich_text("if ") + [_mention(row_id, "param")] + _rich_text(f" == value{index}")
+            return _rich_text(f"if variable{level} == value{index}")
+
+        def build(parent_id: str, level: int):
+            for index in range(fanout):
+                is_leaf = level >= depth - 1
+                block_type = "quote" if is_leaf else "toggle"
+                child_id = make_block(parent_id, False, condition_parts(level, index), not is_leaf, block_type)
+                if not is_leaf:
+                    build(child_id, level + 1)
+
+        for index in range(fanout):
+            is_spec = index % spec_every == 0
+            title = f"{SPEC_BLOCK_IDENTIFIER_DEFAULT} Synthetic spec {index}" if is_spec else f"Section {index}"
+            top_id = make_block(page_id, True, _rich_text(title), depth > 1, "toggle")
+            if depth > 1:
+                build(top_id, 1)
+        self.add_page(page_id, "Synthetic page")
+        return counter[0]
+
+
+class StubBehaviour:
+    """Latency and rate-limit knobs, plus request counters for /__stats."""
+
+    def __init__(self, latency_ms: float = 0.0, latency_jitter_ms: float = 0.0,
+                 rate_limit_probability: float = 0.0, max_requests_per_second: float = 0.0,
+                 retry_after_seconds: float = 1.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.rate_limit_probability = rate_limit_probability
+        self.max_requests_per_second = max_requests_per_second
+        self.retry_after_seconds = retry_after_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = max_requests_per_second
+        self._last_refill = time.monotonic()
+        self.stats: Dict[str, int] = {"requests": 0, "rate_limited": 0, "not_found": 0}
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def should_rate_limit(self) -> bool:
+        with self._lock:
+            if self.rate_limit_probability and self._random.random() < self.rate_limit_probability:
+                return True
+            if self.max_requests_per_second:
+                now = time.monotonic()
+                self._tokens = min(self.max_requests_per_second,
+                                   self._tokens + (now - self._last_refill) * self.max_requests_per_second)
+                self._last_refill = now
+                if self._tokens < 1:
+                    return True
+                self._tokens -= 1
+            return False
+
+    def sleep(self):
+        if self.latency_ms or self.latency_jitter_ms:
+            with self._lock:
+                delay_ms = max(0.0, self._random.gauss(self.latency_ms, self.latency_jitter_ms)) if self.latency_jitter_ms else self.latency_ms
+            time.sleep(delay_ms / 1000)
+
+
+def _paginate(items: List[Any], start_cursor: Optional[str], page_size: int) -> Tuple[List[Any], bool, Optional[str]]:
+    page_size = max(1, min(page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    offset = int(start_cursor) if start_cursor else 0
+    page = items[offset:offset + page_size]
+    has_more = offset + page_size < len(items)
+    return page, has_more, str(offset + page_size) if has_more else None
+
+
+def make_handler(workspace: NotionWorkspace, behaviour: StubBehaviour):
+    class NotionStubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, code: str, message: str, headers: Dict[str, str] = None):
+            self._send(status, {"object": "error", "status": status, "code": code, "message": message}, headers)
+
+        def _list(self, results: List[Any], has_more: bool, next_cursor: Optional[str], list_type: str):
+            self._send(200, {"object": "list", "results": results, "next_cursor": next_cursor,
+                             "has_more": has_more, "type": list_type, list_type: {}})
+
+        def _admit(self) -> bool:
+            behaviour.count("requests")
+            behaviour.sleep()
+            if behaviour.should_rate_limit():
+                behaviour.count("rate_limited")
+                self._error(429, "rate_limited", "You have been rate limited. Please try again in a few minutes.",
+                            {"Retry-After": f"{behaviour.retry_after_seconds:g}"})
+                return False
+            return True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if parts == ["__stats"]:
+                self._send(200, dict(behaviour.stats))
+                return
+            if not self._admit():
+                return
+            if len(parts) >= 3 and parts[:2] == ["v1", "blocks"]:
+                block_id = _normalize_id(parts[2])
+                if len(parts) == 3:
+                    block = workspace.blocks.get(block_id)
+                    if block is None:
+                        behaviour.count("not_found")
+                        self._error(404, "object_not_found", f"Could not find block with ID: {parts[2]}.")
+                        return
+                    self._send(200, block)
+                    return
+                if len(parts) == 4 and parts[3] == "children":
+                    query = parse_qs(url.query)
+                    child_ids = workspace.children.get(block_id, [])
+                    page, has_more, next_cursor = _paginate(
+                        child_ids, query.get("start_cursor", [None])[0], int(query.get("page_size", [DEFAULT_PAGE_SIZE])[0])
+                    )
+                    self._list([workspace.blocks[child_id] for child_id in page], has_more, next_cursor, "block")
+                    return
+            self._error(400, "invalid_request_url", f"Invalid request URL: {url.path}")
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            parts = [part for part in url.path.split("/") if part]
+            if not self._admit():
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if len(parts) == 4 and parts[:2] == ["v1", "databases"] and parts[3] == "query":
+                rows = workspace.databases.get(_normalize_id(parts[2]), [])
+                page, has_more, next_cursor = _paginate(rows, body.get("start_cursor"), body.get("page_size", DEFAULT_PAGE_SIZE))
+                self._list(page, has_more, next_cursor, "page_or_database")
+                return
+            self._error(400, "invalid_request_url", f"Invalid request URL: {url.path}")
+
+    return NotionStubHandler
+
+
+def start_server(workspace: NotionWorkspace, behaviour: StubBehaviour = None, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Starts the stub on a background thread; use f"http://{host}:{server.server_port}" as the client base URL."""
+    server = ThreadingHTTPServer((host, port), make_handler(workspace, behaviour or StubBehaviour()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="notion-stub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Notion API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--snapshot", action="append", default=[], help="blocks/<page_id>_all_blocks.txt to serve (repeatable)")
+    parser.add_argument("--synthetic-page-id", default="5a17e71c0000400080000000000000a1")
+    parser.add_argument("--synthetic-depth", type=int, default=0, help="Generate a synthetic page this many levels deep")
+    parser.add_argument("--synthetic-fanout", type=int, default=5)
+    parser.add_argument("--synthetic-database-id", default="5a17e71c0000400080000000000000db")
+    parser.add_argument("--synthetic-database-rows", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Chance of answering any request with 429")
+    parser.add_argument("--max-requests-per-second", type=float, default=0.0, help="Token-bucket limit; 0 disables (Notion allows about 3)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429 responses")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    workspace = NotionWorkspace()
+    for snapshot_path in args.snapshot:
+        page_id = workspace.load_snapshot(snapshot_path)
+        print(f"Serving snapshot page {page_id} from {snapshot_path}")
+    if args.synthetic_depth:
+        param_ids = workspace.generate_database(args.synthetic_database_id, args.synthetic_database_rows)
+        blocks = workspace.generate_tree(args.synthetic_page_id, args.synthetic_depth, args.synthetic_fanout, param_ids=param_ids)
+        print(f"Serving synthetic page {args.synthetic_page_id} ({blocks} blocks) "
+              f"and database {args.synthetic_database_id} ({len(param_ids)} rows)")
+
+    behaviour = StubBehaviour(args.latency_ms, args.latency_jitter_ms, args.rate_limit_probability,
+                              args.max_requests_per_second, args.retry_after, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(workspace, behaviour))
+    print(f"Notion stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,49 @@
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Callable
+import time
 import urllib.parse
 
+import tracing
+
+NOTION_PAGE_SIZE = 100
+MAX_RATE_LIMIT_RETRIES = 5
+
+
+def _request_with_retry(request: Callable[..., Dict[str, Any]], _span_name: str = "notion.request", **kwargs) -> Dict[str, Any]:
+    """
+    Calls a Notion endpoint, sleeping and retrying when the API answers 429 (rate limited).
+    Honors the Retry-After header when present, otherwise backs off exponentially.
+    """
+    with tracing.span(_span_name, **{key: value for key, value in kwargs.items() if key != "page_size"}) as request_span:
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            try:
+                return request(**kwargs)
+            except Exception as e:
+                if getattr(e, "status", None) != 429 or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                headers = getattr(e, "headers", None) or {}
+                retry_after = headers.get("retry-after") or headers.get("Retry-After")
+                delay = float(retry_after) if retry_after else 0.5 * (2 ** attempt)
+                print(f"Rate limited by Notion, retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_RATE_LIMIT_RETRIES})")
+                request_span.set(rate_limited_retries=attempt + 1)
+                time.sleep(delay)
+
+
+def _list_all_children(notion_client: Any, block_id: str) -> List[Dict[str, Any]]:
+    """Fetches every child of a block, following `next_cursor` across result pages."""
+    children: List[Dict[str, Any]] = []
+    start_cursor = None
+    while True:
+        kwargs = {"block_id": block_id, "page_size": NOTION_PAGE_SIZE}
+        if start_cursor:
+            kwargs["start_cursor"] = start_cursor
+        response = _request_with_retry(notion_client.blocks.children.list, "notion.blocks.children.list", **kwargs)
+        children.extend(response.get("results", []))
+        if not response.get("has_more"):
+            return children
+        start_cursor = response.get("next_cursor")
+
+
+@tracing.traced("notion.get_all_page_content")
 def get_all_page_content(
     start_block_id: str,
     notion_client: Any,
@@ -25,12 +68,13 @@ def get_all_page_content(
     """
     all_blocks: List[Dict[str, Any]] = []
     tech_specs: Dict[str, List[Dict[str, Any]]] = {}
+    tracing.current_span().set(page_id=start_block_id)
 
     # First, handle the start_block_id itself for potential tech_spec,
     # as the recursive helper will only process children.
     try:
         # print(f"DEBUG: Retrieving start_block_id: {start_block_id}")
-        root_block = notion_client.blocks.retrieve(block_id=start_block_id)
+        root_block = _request_with_retry(notion_client.blocks.retrieve, "notion.blocks.retrieve", block_id=start_block_id)
         # print(f"DEBUG: Retrieved root_block: {root_block.get('type')}, has_children: {root_block.get('has_children')}")
         _check_and_add_spec(root_block, tech_specs, notion_client, _spec_block_name)
     except Exception as e:
@@ -78,9 +122,8 @@ def _check_and_add_spec(
                     block_id = block["id"]
                     # print(f"DEBUG: Found tech spec toggle: {block_id}")
                     try:
-                        children_response = notion_client.blocks.children.list(block_id=block_id)
                         tech_spec_children = [
-                            child for child in children_response.get("results", [])
+                            child for child in _list_all_children(notion_client, block_id)
                             if child.get("type") != "ai_block"
                         ]
                         tech_specs_accumulator[block_id] = tech_spec_children
@@ -103,12 +146,12 @@ def _fetch_children_recursively(
     """
     # print(f"DEBUG: Fetching children for {parent_block_id} at level {level}")
     try:
-        children_response = notion_client.blocks.children.list(block_id=parent_block_id)
+        children = _list_all_children(notion_client, parent_block_id)
     except Exception as e:
         print(f"Error fetching children of block {parent_block_id}: {e}")
         return
 
-    for child_block in children_response.get("results", []):
+    for child_block in children:
         if child_block.get("type") == "ai_block":
             continue
 
@@ -136,6 +179,7 @@ def get_children_with_parent_id(parent_id, all_blocks):
       blocks.append(block)
   return blocks
 
+@tracing.traced("notion.extract_table_data")
 def extract_table_data(
     page_id: str,
     notion_client: Any
@@ -143,10 +187,13 @@ def extract_table_data(
     
     all_database_pages = []
     start_cursor=None
+    tracing.current_span().set(database_id=page_id)
     print(f"Querying database with ID: {page_id}")
 
     while True:
-        response = notion_client.databases.query(
+        response = _request_with_retry(
+            notion_client.databases.query,
+            "notion.databases.query",
             database_id=page_id,
             start_cursor=start_cursor
         )
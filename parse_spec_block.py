@@ -1,27 +1,27 @@
 import ast
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 from notion_utils import extract_table_data
-from notion_client import Client
-from dotenv import load_dotenv, find_dotenv
+from file_cache import atomic_write_csv
+import tracing
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-load_dotenv(".env")
-
 _SPEC_BLOCK_NAME_DEFAULT = "💡TECHNICAL_FUNCTION_VALUE:"
 
 # --- Helper functions for processing loaded blocks ---
 
+@tracing.traced("parse.load_blocks_from_file")
 def load_blocks_from_file(filepath: str) -> List[Dict[str, Any]]:
     """Loads a list of block dictionaries from a text file."""
     logger.info(f"Loading blocks from file: {filepath}")
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
             content = f.read()
-        blocks = ast.literal_eval(content)
+        with tracing.span("parse.ast.literal_eval", path=filepath, bytes=len(content)):
+            blocks = ast.literal_eval(content)
         if not isinstance(blocks, list):
             logger.error("File content is not a list")
             raise ValueError("File content is not a list.")
@@ -82,6 +82,29 @@ def get_block_plain_text(block: Dict[str, Any], params) -> str:
 
     return text_content
 
+def get_block_mention_ids(block: Dict[str, Any]) -> List[str]:
+    """IDs (without dashes) of the pages mentioned in the text get_block_plain_text resolves, i.e. the ERP parameter rows it names."""
+    block_type = block.get("type")
+    if block_type not in ("quote", "toggle"):
+        return []
+    mention_ids = []
+    for rt_segment in block.get(block_type, {}).get("rich_text", []):
+        if rt_segment.get("type") == "mention":
+            target = rt_segment["mention"].get(rt_segment["mention"]["type"])
+            if isinstance(target, dict) and target.get("id"):
+                mention_ids.append(target["id"].replace("-", ""))
+    return mention_ids
+
+def get_descendant_mention_ids(spec_block_id: str, blocks_by_parent_id: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+    """Sorted mention IDs of every descendant of a spec block."""
+    mention_ids = set()
+    pending = [spec_block_id]
+    while pending:
+        for child in blocks_by_parent_id.get(pending.pop(), []):
+            mention_ids.update(get_block_mention_ids(child))
+            pending.append(child["id"])
+    return sorted(mention_ids)
+
 def get_all_descendants_content_with_indent(
     spec_block_id: str,
     spec_block_level: int,
@@ -138,18 +161,11 @@ def get_all_descendants_content_with_indent(
     logger.info(f"Processed {len(processed_blocks_in_this_traversal)} blocks for spec block {spec_block_id}")
     return "\n".join(concatenated_text_lines)
 
-def process_notion_blocks_from_file(
-    input_filepath: str,
-    output_csv_filepath: str,
-    spec_block_identifier: str = _SPEC_BLOCK_NAME_DEFAULT,
-    params: dict = {}
-):
-    logger.info(f"Processing Notion blocks from file: {input_filepath}")
-    all_blocks = load_blocks_from_file(input_filepath)
-    if not all_blocks or len(all_blocks)==0:
-        logger.warning("No blocks loaded, exiting")
-        return all_blocks
-
+@tracing.traced("parse.build_block_maps")
+def build_block_maps(
+    all_blocks: List[Dict[str, Any]]
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """Indexes blocks by their own ID and by their parent's ID (block, page or database)."""
     all_blocks_map: Dict[str, Dict[str, Any]] = {}
     for block in all_blocks:
         if 'id' not in block:
@@ -171,8 +187,15 @@ def process_notion_blocks_from_file(
             blocks_by_parent_id[parent_id].append(block)
 
     logger.info(f"Processed {len(all_blocks_map)} blocks into maps")
-    spec_blocks_data = []
-    
+    return all_blocks_map, blocks_by_parent_id
+
+@tracing.traced("parse.find_spec_blocks")
+def find_spec_blocks(
+    all_blocks: List[Dict[str, Any]],
+    spec_block_identifier: str,
+    params
+) -> List[Dict[str, Any]]:
+    """Returns the toggle blocks whose title contains `spec_block_identifier`."""
     identified_spec_blocks = []
     for block in all_blocks:
         if block.get("type") == "toggle":
@@ -184,7 +207,29 @@ def process_notion_blocks_from_file(
                 if 'level' not in block:
                     logger.warning(f"Spec toggle '{toggle_title_text}' (ID: {block.get('id')}) is missing 'level' attribute. Indentation may be incorrect.")
                 identified_spec_blocks.append(block)
+    return identified_spec_blocks
+
+def process_notion_blocks_from_file(
+    input_filepath: str,
+    output_csv_filepath: str,
+    spec_block_identifier: str = _SPEC_BLOCK_NAME_DEFAULT,
+    params: dict = {},
+    block_parameters: Dict[str, List[str]] = None
+):
+    """
+    Writes the name and indented content of every spec block to a CSV and returns them as a DataFrame.
+    When a `block_parameters` dict is given, it is filled with block name -> IDs of the parameter rows mentioned in the block.
+    """
+    logger.info(f"Processing Notion blocks from file: {input_filepath}")
+    all_blocks = load_blocks_from_file(input_filepath)
+    if not all_blocks or len(all_blocks)==0:
+        logger.warning("No blocks loaded, exiting")
+        return all_blocks
 
+    all_blocks_map, blocks_by_parent_id = build_block_maps(all_blocks)
+    spec_blocks_data = []
+
+    identified_spec_blocks = find_spec_blocks(all_blocks, spec_block_identifier, params)
     if not identified_spec_blocks:
         logger.warning(f"No spec blocks found with identifier '{spec_block_identifier}'")
         return
@@ -201,18 +246,23 @@ def process_notion_blocks_from_file(
             spec_block_level = 0
 
         logger.info(f"Processing spec block: {spec_block_name_clean}")
-        descendant_content = get_all_descendants_content_with_indent(
-            spec_block_id=spec_block_id,
-            spec_block_level=spec_block_level,
-            all_blocks_map=all_blocks_map,
-            blocks_by_parent_id=blocks_by_parent_id,
-            params=params
-        )
+        with tracing.span("parse.descendants_content", block_id=spec_block_id):
+            descendant_content = get_all_descendants_content_with_indent(
+                spec_block_id=spec_block_id,
+                spec_block_level=spec_block_level,
+                all_blocks_map=all_blocks_map,
+                blocks_by_parent_id=blocks_by_parent_id,
+                params=params
+            )
         
         spec_blocks_data.append({
             "block_name": spec_block_name_clean,
             "block_content": descendant_content
         })
+        if block_parameters is not None:
+            block_parameters[spec_block_name_clean] = sorted(
+                set(block_parameters.get(spec_block_name_clean, [])).union(get_descendant_mention_ids(spec_block_id, blocks_by_parent_id))
+            )
 
     if not spec_blocks_data:
         logger.warning("No data to write to CSV (spec blocks found but had no processable children or content)")
@@ -222,14 +272,21 @@ def process_notion_blocks_from_file(
         logger.info(f"Writing {len(spec_blocks_data)} spec blocks to CSV: {output_csv_filepath} using pandas")
         fieldnames = ["block_name", "block_content"]
         df = pd.DataFrame(spec_blocks_data, columns=fieldnames)
-        df.to_csv(output_csv_filepath, index=False, encoding='utf-8')
+        atomic_write_csv(df, output_csv_filepath, index=False)
         logger.info(f"Successfully wrote data to {output_csv_filepath}")
         return df
     except IOError as e:
         logger.error(f"Error writing CSV file: {str(e)}")
         raise
 
-def process_spec_blocks(block_identifier:str, page_id: str, table_page_id: str, notion_client: Client):
+@tracing.traced("parse.process_spec_blocks")
+def process_spec_blocks(block_identifier:str, page_id: str, table_page_id: str, notion_client: Any, run_state: Dict[str, Any] = None):
+    """
+    Extracts the spec blocks of blocks/<page_id>_all_blocks.txt to <page_id>_spec_block_contents.csv.
+    With a `run_state` dict, the parameter table rows (`parameters`) and the parameter row IDs each block mentions
+    (`block_parameters`) are stored in it for the dependency index.
+    """
+    tracing.current_span().set(page_id=page_id, table_id=table_page_id)
     logger.info(f"Processing spec blocks for page: {page_id}, table: {table_page_id}")
     # --- Configuration ---
     INPUT_TEXT_FILE = f"blocks/{page_id}_all_blocks.txt"
@@ -239,12 +296,17 @@ def process_spec_blocks(block_identifier:str, page_id: str, table_page_id: str,
     params = extract_table_data(table_page_id, notion_client)
 
     # --- Run the processing ---
+    block_parameters = {}
     df = process_notion_blocks_from_file(
         INPUT_TEXT_FILE,
         OUTPUT_CSV_FILE,
         block_identifier,
-        params
+        params,
+        block_parameters
     )
+    if run_state is not None:
+        run_state["parameters"] = params
+        run_state["block_parameters"] = block_parameters
 
     logger.info(f"Reading processed data from {OUTPUT_CSV_FILE}")
     return df
\ No newline at end of file
@@ -0,0 +1,335 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, MutableMapping, Optional
+
+import pandas as pd
+
+from parse_spec_block import process_spec_blocks
+from b2m_agent import build_mermaid_agent, run_agent, CascadeStats
+from agent_metrics import RowMetrics, RunMetrics
+from hedging import HedgedInvoker, HEDGE_PERCENTILE, HEDGE_BUDGET_FRACTION
+from run_checkpoints import get_checkpointer, start_run, finish_run, unfinished_runs, row_thread_id
+from notion_utils import get_all_page_content
+from file_cache import KeyedLocks, SingleFlight, atomic_write_text, atomic_write_csv
+from search_index import get_search_index
+from dependency_index import get_dependency_index, parameter_digests
+from mermaid_ir import graph_ir_json, compare_graph_versions
+from chunked_generation import generate_chunked, CHUNK_THRESHOLD_CHARS
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per-page locks around the cache files, and deduplication of identical concurrent calls.
+_file_locks = KeyedLocks()
+_flights = SingleFlight()
+
+@tracing.traced("pipeline.fetch_data_spec_content")
+def fetch_data_spec_content(block_identifier: str, page_id: str, table_id: str, notion: Any, force_recreate: bool = False,
+                            run_state: MutableMapping = None, business_converter=None) -> pd.DataFrame:
+    """
+    Crawls the Notion page (unless a blocks snapshot already exists and `force_recreate` is off),
+    then extracts the spec blocks matching `block_identifier` using the parameters table `table_id`.
+    `notion` is anything with the notion-client `blocks` / `databases` endpoints.
+    Concurrent calls for the same inputs share one crawl. When the snapshot had to be crawled again because it held
+    no spec blocks, `run_state["blocks_refetched"]` is set so process_dataframe_with_mermaid_agent regenerates the graphs.
+    With a `business_converter` (business_conversion.BusinessConverter), the sections matching `block_identifier` are
+    business specs: they are converted to technical specs, which become the spec blocks; its counts go to `run_state["business_conversion"]`.
+    The blocks whose mentioned parameter rows changed since the dependency index last saw the page are listed in
+    `run_state["stale_blocks"]`, so process_dataframe_with_mermaid_agent regenerates just those graphs.
+    """
+    if run_state is None:
+        run_state = {}
+    tracing.current_span().set(page_id=page_id, table_id=table_id, force_recreate=force_recreate)
+
+    logger.info(f"Fetching data spec content for block: {block_identifier}, page: {page_id}, table: {table_id}")
+    (parsed_blocks, spec_state), shared = _flights.do_shared(
+        ("spec", page_id, table_id, block_identifier, force_recreate, business_converter is not None),
+        lambda: _load_spec_content(block_identifier, page_id, table_id, notion, force_recreate, business_converter),
+    )
+    tracing.current_span().set(shared=shared)
+    run_state.update(spec_state)
+    return parsed_blocks
+
+def _load_spec_content(block_identifier: str, page_id: str, table_id: str, notion: Any, force_recreate: bool, business_converter=None):
+    """
+    Returns (spec blocks, run_state entries): whether the snapshot was crawled again because it held none, the stale
+    blocks and the parameter dependencies to record once the graphs exist, and the business conversion counts.
+    """
+    extraction_state = {}
+
+    def extract_spec_blocks():
+        if business_converter is not None:
+            return business_converter.convert_page(block_identifier, page_id, table_id, notion, run_state=extraction_state)
+        return process_spec_blocks(block_identifier, page_id, table_id, notion, run_state=extraction_state)
+
+    block_file_path = f"blocks/{page_id}_all_blocks.txt"
+
+    def load_from_notion():
+        logger.info("Loading blocks from Notion API")
+        all_blocks_data, _ = get_all_page_content(page_id, notion, _spec_block_name=block_identifier)
+        try:
+            atomic_write_text(block_file_path, str(all_blocks_data))
+            logger.info(f"Successfully saved blocks to {block_file_path}")
+        except Exception as e:
+            logger.error(f"Error saving blocks to file: {str(e)}")
+            raise
+
+    # The snapshot and the spec CSV are per page: one writer at a time.
+    with _file_locks(("blocks", page_id)):
+        if not os.path.exists(block_file_path) or force_recreate:
+            load_from_notion()
+
+        blocks_refetched = False
+        parsed_blocks = extract_spec_blocks()
+        if isinstance(parsed_blocks, list) and len(parsed_blocks) == 0:
+            blocks_refetched = True
+            load_from_notion()
+            parsed_blocks = extract_spec_blocks()
+
+    spec_state = {"blocks_refetched": blocks_refetched, "stale_blocks": [], "dependencies": None}
+    if "business_conversion" in extraction_state:
+        spec_state["business_conversion"] = extraction_state["business_conversion"]
+    if isinstance(parsed_blocks, pd.DataFrame):
+        _update_search_index(page_id, parsed_blocks)
+        if "block_parameters" in extraction_state:
+            block_parameters, params = extraction_state["block_parameters"], extraction_state["parameters"]
+            spec_state["stale_blocks"] = get_dependency_index().stale_blocks(page_id, table_id, params)
+            spec_state["dependencies"] = {
+                "table_id": table_id, "block_identifier": block_identifier, "block_parameters": block_parameters,
+                "digests": parameter_digests(params, (param_id for param_ids in block_parameters.values() for param_id in param_ids)),
+            }
+            if spec_state["stale_blocks"]:
+                logger.info(f"Parameters changed for {len(spec_state['stale_blocks'])} blocks of page {page_id}: {spec_state['stale_blocks']}")
+    return parsed_blocks, spec_state
+
+def _record_graph_changes(page_id: str, previous_df: pd.DataFrame, df: pd.DataFrame, run_state: MutableMapping):
+    """Publishes (and saves) which blocks' graphs changed structurally since the previous graphs file."""
+    try:
+        graph_changes = compare_graph_versions(previous_df, df)
+        run_state["graph_changes"] = graph_changes
+        logger.info(f"Graph changes for page {page_id}: {len(graph_changes['changed'])} changed, "
+                    f"{len(graph_changes['unchanged'])} unchanged, {len(graph_changes['added'])} added, {len(graph_changes['removed'])} removed")
+        atomic_write_text(f"metrics/{page_id}_graph_changes.json", json.dumps(graph_changes, indent=2, ensure_ascii=False))
+    except Exception as e:
+        logger.error(f"Error comparing graphs with the previous run: {str(e)}")
+
+def _update_dependency_index(page_id: str, run_state: MutableMapping):
+    """Records the parameters the page's graphs were made with; like search, a failed update is logged, not raised."""
+    dependencies = run_state.get("dependencies")
+    if not dependencies:
+        return
+    try:
+        get_dependency_index().update_page(page_id, dependencies["table_id"], dependencies["block_identifier"],
+                                           dependencies["block_parameters"], dependencies["digests"])
+    except Exception as e:
+        logger.error(f"Error updating dependency index for page {page_id}: {str(e)}")
+
+def _graph_key(block_name: Any, logic: Any) -> tuple:
+    """(block name, logic) of a row, with the empty cells a graphs file reads back as NaN kept as ''."""
+    return tuple("" if pd.isna(value) else str(value) for value in (block_name, logic))
+
+def _row_thread_keys(df: pd.DataFrame, logic_column: str) -> dict:
+    """
+    Row index -> run_checkpoints.row_thread_id key: the block name and how many earlier rows had the same name and
+    logic, so rows with identical logic get separate checkpoint threads while a row keeps its thread when others move.
+    """
+    occurrences = {}
+    row_keys = {}
+    names = df["block_name"] if "block_name" in df else pd.Series("", index=df.index)
+    for row_index, name, logic in zip(df.index, names, df[logic_column]):
+        key = _graph_key(name, logic)
+        occurrences[key] = occurrences.get(key, 0) + 1
+        row_keys[row_index] = f"{key[0]}#{occurrences[key]}"
+    return row_keys
+
+def _same_spec_blocks(previous_df: pd.DataFrame, df: pd.DataFrame, logic_column: str) -> bool:
+    """Whether a graphs file holds the same rows (block names and logic, in order) as the spec blocks `df`."""
+    for column in ("block_name", logic_column):
+        if (column in previous_df) != (column in df):
+            return False
+        if column in df and previous_df[column].fillna("").astype(str).tolist() != df[column].fillna("").astype(str).tolist():
+            return False
+    return True
+
+def _update_search_index(page_id: str, df: pd.DataFrame):
+    """Search is a convenience: a failed index update is logged, not raised."""
+    try:
+        get_search_index().update_page(page_id, df)
+    except Exception as e:
+        logger.error(f"Error updating search index for page {page_id}: {str(e)}")
+
+@tracing.traced("pipeline.process_dataframe_with_mermaid_agent")
+def process_dataframe_with_mermaid_agent(page_id: str, df: pd.DataFrame, model_tiers: list, logic_column: str = "original_logic", max_retries: int = 3,
+                                         run_id: str = None, hedge: bool = False, force_recreate: bool = False,
+                                         run_state: MutableMapping = None, validator: Callable[[str], str] = None,
+                                         checkpointer=None, max_workers: int = 1,
+                                         on_row_complete: Callable[[Any, Optional[str]], None] = None,
+                                         chunk_threshold: int = CHUNK_THRESHOLD_CHARS) -> pd.DataFrame:
+    """
+    Takes a DataFrame and applies the agent to each row, using the value in `logic_column` as the business logic.
+    Rows go through `model_tiers` (a chat model or a list of b2m_agent.ModelTier) cheapest first; `max_retries` is used for tiers without their own budget.
+    Every agent step is checkpointed under `run_id`. When no run id is given, the latest unfinished run for the page is
+    resumed (unless force recreate is on), so only rows that did not finish are sent to the LLM again.
+    With `hedge`, LLM calls slower than HEDGE_PERCENTILE of recent calls are duplicated and the first valid answer wins.
+    `run_id`, `run_summary` and `run_metrics` are published into `run_state` (e.g. st.session_state) as soon as they are known.
+    `validator` replaces the mermaid.ink syntax check and `checkpointer` the default SQLite checkpointer.
+    With `max_workers` > 1, rows are sent to the agent concurrently. A row whose agent run raises does not stop the others;
+    once all rows are done the run is left unfinished (so resuming only redoes the failed rows) and a RuntimeError is raised.
+    `on_row_complete(row_index, mermaid_graph)` is called as each row finishes (from worker threads when `max_workers` > 1).
+    Logic longer than `chunk_threshold` characters is generated in chunks and stitched (see chunked_generation); 0 disables it.
+    A concurrent call for the same page and rows waits for the running one and shares its result (and its `run_state`);
+    graphs are also regenerated when fetch_data_spec_content reported a refetched snapshot in `run_state`. When it reported
+    `stale_blocks` instead, only the rows of those blocks (and rows missing from the graphs file) go to the agent and the
+    other rows keep their existing graphs; the dependency index then records the parameters the graphs were made with.
+    An existing graphs file is only loaded as is when its block names and logic match `df`; otherwise (e.g. the page
+    was last generated with or without business conversion) the rows whose name and logic differ are regenerated.
+    Returns the DataFrame with a new column 'mermaid_graph' containing the generated Mermaid code (or None if failed).
+    """
+    if run_state is None:
+        run_state = {}
+    regenerate = force_recreate or bool(run_state.get("blocks_refetched"))
+    stale_blocks = frozenset() if regenerate else frozenset(run_state.get("stale_blocks") or ())
+    logic_digest = hashlib.sha256("\x00".join(df[logic_column].astype(str)).encode("utf-8")).hexdigest()
+    flight_key = ("graphs", page_id, logic_digest, regenerate, stale_blocks, run_id)
+
+    def generate_or_load():
+        result_df = _generate_or_load_graphs(page_id, df, model_tiers, logic_column, max_retries, run_id, hedge, force_recreate,
+                                             regenerate, stale_blocks, run_state, validator, checkpointer, max_workers, on_row_complete,
+                                             chunk_threshold)
+        return result_df, run_state
+
+    (result_df, leader_state), shared = _flights.do_shared(flight_key, generate_or_load)
+    tracing.current_span().set(shared=shared)
+    if shared:
+        run_state.update({key: value for key, value in leader_state.items() if key != "blocks_refetched"})
+        if on_row_complete is not None:
+            for row_index, mermaid_graph in result_df["mermaid_graph"].items():
+                on_row_complete(row_index, None if pd.isna(mermaid_graph) else mermaid_graph)
+    return result_df
+
+def _generate_or_load_graphs(page_id: str, df: pd.DataFrame, model_tiers: list, logic_column: str, max_retries: int,
+                             run_id: Optional[str], hedge: bool, force_recreate: bool, regenerate: bool, stale_blocks: frozenset,
+                             run_state: MutableMapping,
+                             validator: Optional[Callable[[str], str]], checkpointer, max_workers: int,
+                             on_row_complete: Optional[Callable[[Any, Optional[str]], None]], chunk_threshold: int) -> pd.DataFrame:
+    tracing.current_span().set(page_id=page_id, rows=len(df), max_workers=max_workers)
+
+    logger.info(f"Processing dataframe with mermaid agent for page: {page_id}")
+    graph_file_path = f"graphs/{page_id}_graphs.csv"
+
+    # Generating or replacing this page's graphs file: one writer at a time, later callers then load the file.
+    with _file_locks(("graphs", page_id)):
+        previous_df = pd.read_csv(graph_file_path) if os.path.exists(graph_file_path) and not regenerate else None
+        # A graphs file made from other spec blocks (e.g. by a business conversion run of the page) is not reused as a whole.
+        spec_changed = previous_df is not None and not _same_spec_blocks(previous_df, df, logic_column)
+        if spec_changed:
+            logger.info(f"{graph_file_path} was generated from different spec blocks, regenerating the blocks that changed")
+        if previous_df is None or stale_blocks or spec_changed:
+            # Graphs of unchanged blocks, by name and logic, when only the stale or changed blocks are regenerated.
+            kept_graphs = {}
+            if previous_df is not None and "block_name" in df:
+                if logic_column in previous_df and "block_name" in previous_df:
+                    kept_graphs = {_graph_key(name, logic): graph for name, logic, graph in
+                                   zip(previous_df["block_name"], previous_df[logic_column], previous_df["mermaid_graph"])
+                                   if name not in stale_blocks and isinstance(graph, str)}
+                logger.info(f"Regenerating {len(stale_blocks)} stale blocks, keeping up to {len(kept_graphs)} existing graphs")
+            logger.info("Building mermaid agent")
+            app = build_mermaid_agent(checkpointer=checkpointer or get_checkpointer())
+            cascade_stats = CascadeStats()
+
+            if run_id is None and not force_recreate:
+                previous_runs = unfinished_runs(page_id)
+                if previous_runs:
+                    run_id = previous_runs[0]
+                    logger.info(f"Resuming unfinished run {run_id}")
+            run_id = start_run(page_id, len(df), run_id)
+            run_state["run_id"] = run_id
+            run_metrics = RunMetrics(run_id)
+            hedger = HedgedInvoker(percentile=HEDGE_PERCENTILE, budget_fraction=HEDGE_BUDGET_FRACTION) if hedge else None
+            row_errors = []
+            row_keys = _row_thread_keys(df, logic_column)
+
+            def generate_row(row):
+                logic = row[logic_column]
+                if pd.isna(logic) or not str(logic).strip():
+                    logger.debug(f"Skipping empty logic for row: {row.name}")
+                    skipped_row = RowMetrics(row_key=str(row.name))
+                    skipped_row.outcome = "skipped"
+                    run_metrics.add_row(skipped_row)
+                    return None
+                kept_graph = kept_graphs.get(_graph_key(row.get("block_name"), logic))
+                if kept_graph is not None:
+                    reused_row = RowMetrics(row_key=str(row.name))
+                    reused_row.outcome = "reused"
+                    run_metrics.add_row(reused_row)
+                    return kept_graph
+                logger.debug(f"Processing logic for row: {row.name}")
+                try:
+                    with tracing.span("pipeline.row", row_index=row.name, run_id=run_id):
+                        if chunk_threshold and len(str(logic)) > chunk_threshold:
+                            return generate_chunked(app, model_tiers, str(logic), block_name=str(row.get("block_name", "")),
+                                                    max_retries=max_retries, cascade_stats=cascade_stats, run_id=run_id,
+                                                    run_metrics=run_metrics, hedger=hedger, validator=validator,
+                                                    row_key=row_keys[row.name])
+                        return run_agent(app, model_tiers, str(logic), max_retries=max_retries,
+                                         cascade_stats=cascade_stats, thread_id=row_thread_id(run_id, str(logic), row_keys[row.name]),
+                                         run_metrics=run_metrics, hedger=hedger, validator=validator)
+                except Exception as e:
+                    logger.error(f"Mermaid agent failed for row {row.name}: {str(e)}")
+                    row_errors.append(row.name)
+                    return None
+
+            def process_row(row):
+                mermaid_graph = generate_row(row)
+                if on_row_complete is not None:
+                    on_row_complete(row.name, mermaid_graph)
+                return mermaid_graph
+
+            df = df.copy()
+            logger.info(f"Applying mermaid agent to dataframe rows ({max_workers} worker(s))")
+            try:
+                if max_workers > 1:
+                    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mermaid-agent") as executor:
+                        df["mermaid_graph"] = list(executor.map(tracing.propagate(process_row), (row for _, row in df.iterrows())))
+                else:
+                    df["mermaid_graph"] = df.apply(process_row, axis=1)
+            finally:
+                if hedger is not None:
+                    hedger.close()
+            run_summary = cascade_stats.summary()
+            if hedger is not None:
+                run_summary["hedging"] = hedger.summary()
+            run_state["run_summary"] = run_summary
+            run_state["run_metrics"] = run_metrics
+            logger.info(f"Model cascade summary: {run_summary}")
+            logger.info(f"Run metrics: {run_metrics.summary()}")
+            try:
+                os.makedirs("metrics", exist_ok=True)
+                run_metrics.export(f"metrics/{page_id}_run_metrics.json", f"metrics/{page_id}_run_metrics.prom")
+            except Exception as e:
+                logger.error(f"Error saving run metrics: {str(e)}")
+            if row_errors:
+                raise RuntimeError(f"Mermaid agent failed for {len(row_errors)} row(s); run {run_id} was left unfinished and can be resumed")
+            df["graph_ir"] = df["mermaid_graph"].map(graph_ir_json)
+            if os.path.exists(graph_file_path):
+                _record_graph_changes(page_id, pd.read_csv(graph_file_path), df, run_state)
+            try:
+                atomic_write_csv(df, graph_file_path, index=False)
+                logger.info(f"Successfully saved graphs to {graph_file_path}")
+            except Exception as e:
+                logger.error(f"Error saving graphs to file: {str(e)}")
+                raise
+            finish_run(run_id)
+        else:
+            logger.info(f"Loading existing graphs from {graph_file_path}")
+            df = previous_df
+            if "graph_ir" not in df:
+                # Graphs files written before the IR existed.
+                df["graph_ir"] = df["mermaid_graph"].map(graph_ir_json)
+
+    _update_search_index(page_id, df)
+    _update_dependency_index(page_id, run_state)
+    return df
@@ -0,0 +1,159 @@
+"""
+Runs fetch_data_spec_content -> process_spec_blocks -> process_dataframe_with_mermaid_agent
+against recorded Notion, LLM and mermaid.ink responses.
+
+Record once with live credentials:
+    python replay_pipeline.py record --page-id <page_id> --table Doctors
+
+Replay anywhere, deterministically and offline:
+    python replay_pipeline.py replay --page-id <page_id> --table Doctors [--latency-scale 1.0]
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+
+from dotenv import load_dotenv, find_dotenv
+
+import tracing
+from config import MODEL_TIER_SPECS, TABLE_MAPPING, SPEC_BLOCK_IDENTIFIER_DEFAULT, build_model_tiers
+from cassettes import (
+    Cassette, RecordingNotionClient, ReplayNotionClient, RecordingChatModel, ReplayChatModel,
+    recording_validator, replay_validator,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+
+
+def _cassette_paths(cassette_dir: str):
+    return (
+        os.path.join(cassette_dir, "notion.json"),
+        os.path.join(cassette_dir, "llm.json"),
+        os.path.join(cassette_dir, "mermaid_ink.json"),
+    )
+
+
+def build_recording_backends(cassette_dir: str):
+    from notion_client import Client as NotionClient
+    from b2m_agent import validate_mermaid_syntax
+
+    notion_path, llm_path, validation_path = _cassette_paths(cassette_dir)
+    notion_cassette, llm_cassette, validation_cassette = Cassette(notion_path), Cassette(llm_path), Cassette(validation_path)
+
+    notion = RecordingNotionClient(NotionClient(auth=os.environ["NOTION_SECRET"]), notion_cassette)
+    model_tiers = []
+    for tier in build_model_tiers(MODEL_TIER_SPECS):
+        tier["llm"] = RecordingChatModel(inner=tier["llm"], cassette=llm_cassette, model_name=tier["name"])
+        model_tiers.append(tier)
+    validator = recording_validator(lambda code: validate_mermaid_syntax.invoke({"mermaid_code": code}), validation_cassette)
+
+    def save():
+        for cassette in (notion_cassette, llm_cassette, validation_cassette):
+            cassette.save()
+        manifest = [
+            {key: value for key, value in tier.items() if key != "llm"} | {"llm_type": tier["llm"]._llm_type}
+            for tier in model_tiers
+        ]
+        with open(os.path.join(cassette_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"model_tiers": manifest}, f, indent=2)
+
+    return notion, model_tiers, validator, save
+
+
+def build_replay_backends(cassette_dir: str, latency_scale: float):
+    notion_path, llm_path, validation_path = _cassette_paths(cassette_dir)
+    with open(os.path.join(cassette_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+
+    llm_cassette = Cassette(llm_path)
+    notion = ReplayNotionClient(Cassette(notion_path), latency_scale)
+    model_tiers = []
+    for tier in manifest["model_tiers"]:
+        tier = dict(tier)
+        tier["llm"] = ReplayChatModel(
+            cassette=llm_cassette, model_name=tier["name"], llm_type=tier.pop("llm_type"), latency_scale=latency_scale
+        )
+        model_tiers.append(tier)
+    validator = replay_validator(Cassette(validation_path), latency_scale)
+    return notion, model_tiers, validator, lambda: None
+
+
+def run_pipeline(page_id: str, table_id: str, block_identifier: str, notion, model_tiers, validator, max_retries: int = 3) -> dict:
+    """Runs the pipeline stages in the current directory and returns per-stage timings."""
+    from pipeline import fetch_data_spec_content, process_dataframe_with_mermaid_agent
+
+    os.makedirs("blocks", exist_ok=True)
+    os.makedirs("graphs", exist_ok=True)
+    timings = {}
+
+    run_state = {}
+    start_time = time.perf_counter()
+    spec_df = fetch_data_spec_content(block_identifier, page_id, table_id, notion, force_recreate=True, run_state=run_state)
+    timings["fetch_data_spec_content_seconds"] = time.perf_counter() - start_time
+    if spec_df is None or len(spec_df) == 0:
+        raise RuntimeError(f"No spec blocks found on page {page_id} for '{block_identifier}'")
+
+    start_time = time.perf_counter()
+    graphs_df = process_dataframe_with_mermaid_agent(
+        page_id, spec_df, model_tiers, logic_column="block_content", max_retries=max_retries,
+        force_recreate=True, run_state=run_state, validator=validator,
+    )
+    timings["process_dataframe_with_mermaid_agent_seconds"] = time.perf_counter() - start_time
+
+    return {
+        "page_id": page_id,
+        "spec_blocks": len(spec_df),
+        "graphs_generated": int(graphs_df["mermaid_graph"].notna().sum()),
+        "timings": timings,
+        "run_summary": run_state.get("run_summary"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay a full pipeline run.")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--page-id", required=True)
+    parser.add_argument("--table", required=True, choices=list(TABLE_MAPPING.keys()))
+    parser.add_argument("--block-identifier", default=SPEC_BLOCK_IDENTIFIER_DEFAULT)
+    parser.add_argument("--cassette-dir", help="Defaults to cassettes/<page_id>")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Replay only: 0 serves instantly, 1.0 reproduces the recorded call durations")
+    parser.add_argument("--workdir", help="Where blocks/, graphs/ and checkpoints/ are written (defaults to a temp dir)")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--trace", help="Write a Chrome trace of the run to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(find_dotenv(), override=True)
+
+    cassette_dir = os.path.abspath(args.cassette_dir or os.path.join("cassettes", args.page_id))
+    trace_path = os.path.abspath(args.trace) if args.trace else None
+    if trace_path:
+        tracing.enable()
+    if args.mode == "record":
+        notion, model_tiers, validator, save = build_recording_backends(cassette_dir)
+    else:
+        notion, model_tiers, validator, save = build_replay_backends(cassette_dir, args.latency_scale)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="blv_replay_")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    logger.info(f"Running pipeline in {workdir} ({args.mode} mode, cassettes in {cassette_dir})")
+
+    try:
+        result = run_pipeline(args.page_id, TABLE_MAPPING[args.table], args.block_identifier,
+                              notion, model_tiers, validator, args.max_retries)
+    finally:
+        save()
+        if trace_path:
+            logger.info(f"Wrote {tracing.export_chrome_trace(trace_path)} trace spans to {trace_path}")
+
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Headless crawl -> extract -> generate -> render for one or many pages, for
+nightly refreshes from cron or CI. Does not import Streamlit.
+
+    python run_batch.py --job 1eb7...:MV_Resolvers --job 1ed7...:Doctors --output-dir /srv/blv
+    python run_batch.py --jobs-file nightly.json --concurrency 2 --row-workers 8 --cache refresh
+
+`--jobs-file` holds a JSON list of {"page_id": ..., "table": ..., "block_identifier": ...}
+objects (block_identifier is optional). Tables are TABLE_MAPPING names.
+
+With `--convert-business`, the pages' `💡 BUSINESS_FUNCTION_VALUE` sections are
+converted to technical specs with the first model tier before generation
+(see business_conversion.py).
+
+A JSON summary (per-job status, row counts, per-stage timings) is printed to
+stdout and optionally written to `--summary-file`. Exit status:
+    0  every job finished and every row has a graph (and an SVG when rendering)
+    1  at least one job failed
+    2  invalid arguments
+    3  every job finished, but some rows have no graph or SVG
+"""
+import os
+import sys
+import json
+import contextlib
+import time
+import argparse
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv, find_dotenv
+
+from config import TABLE_MAPPING, SPEC_BLOCK_IDENTIFIER_DEFAULT, MODEL_TIER_SPECS, build_model_tiers
+from jobs import Job, JobManager, pipeline_job, JOB_DONE, JOB_FAILED, ACTIVE_STATUSES
+from chunked_generation import CHUNK_THRESHOLD_CHARS
+import tracing
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+# Seconds between progress checks while jobs run.
+POLL_INTERVAL_SECONDS = 0.5
+
+
+def parse_job_specs(parser: argparse.ArgumentParser, args: argparse.Namespace) -> List[Dict[str, str]]:
+    specs = []
+    for value in args.job:
+        page_id, _, table = value.partition(":")
+        specs.append({"page_id": page_id, "table": table})
+    if args.jobs_file:
+        try:
+            with open(args.jobs_file, "r", encoding="utf-8") as f:
+                specs.extend(json.load(f))
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read --jobs-file {args.jobs_file}: {e}")
+    if not specs:
+        parser.error("give at least one --job PAGE_ID:TABLE or a --jobs-file")
+
+    for spec in specs:
+        if not spec.get("page_id") or spec.get("table") not in TABLE_MAPPING:
+            parser.error(f"invalid job {spec}: need a page id and one of the tables {sorted(TABLE_MAPPING)}")
+        spec.setdefault("block_identifier", args.block_identifier)
+    return specs
+
+
+def build_backends(args: argparse.Namespace):
+    """Notion client, model tiers and validator for the run."""
+    from notion_client import Client as NotionClient
+
+    notion_token = os.environ.get("NOTION_SECRET")
+    if not notion_token:
+        raise ValueError("NOTION_SECRET environment variable is required")
+    client_options = {"base_url": args.notion_base_url} if args.notion_base_url else {}
+    notion = NotionClient(auth=notion_token, **client_options)
+
+    if args.fake_llm:
+        from fake_llm import FakeLatencyChatModel
+        model_tiers = [{"name": "fake-latency", "llm": FakeLatencyChatModel(latency_seconds=0.0), "max_retries": args.max_retries}]
+    else:
+        logger.info(f"Initializing chat models: {[spec['name'] for spec in MODEL_TIER_SPECS]}")
+        model_tiers = build_model_tiers()
+
+    validator = None
+    if args.local_validation_only:
+        from b2m_agent import validate_mermaid_locally
+        validator = validate_mermaid_locally
+    return notion, model_tiers, validator
+
+
+def job_result(job: Job, render: bool) -> Dict[str, Any]:
+    snapshot = job.snapshot()
+    # Counted from the result rather than completed_rows: reused graphs files complete no rows.
+    graphs = int(job.result_df["mermaid_graph"].notna().sum()) if job.result_df is not None else 0
+    svgs = sum(1 for svg_path in snapshot["svg_paths"].values() if svg_path)
+    total_rows = snapshot["total_rows"] or 0
+    if snapshot["status"] != JOB_DONE:
+        status = JOB_FAILED
+    elif graphs == total_rows and (not render or svgs == graphs):
+        status = "ok"
+    else:
+        status = "partial"
+    return {
+        "job_id": snapshot["job_id"],
+        "page_id": snapshot["page_id"],
+        "table": snapshot["table_name"],
+        "status": status,
+        "error": snapshot["error"],
+        "run_id": snapshot["run_id"],
+        "rows": total_rows,
+        "graphs": graphs,
+        "svgs": svgs if render else None,
+        "graph_changes": _change_counts(job.run_state.get("graph_changes")),
+        "business_conversion": job.run_state.get("business_conversion"),
+        "stage_seconds": {stage: round(seconds, 3) for stage, seconds in snapshot["stage_seconds"].items()},
+        "elapsed_seconds": round(snapshot["elapsed_seconds"], 3),
+        "graphs_file": os.path.abspath(f"graphs/{snapshot['page_id']}_graphs.csv") if snapshot["status"] == JOB_DONE else None,
+    }
+
+
+def _change_counts(graph_changes: Dict[str, Any]) -> Dict[str, int]:
+    """Block counts from the pipeline's comparison with the previous graphs file (None on a first run or a reused file)."""
+    if not graph_changes:
+        return None
+    return {key: len(graph_changes[key]) for key in ("changed", "unchanged", "added", "removed")}
+
+
+def exit_status(results: List[Dict[str, Any]]) -> int:
+    if any(result["status"] == JOB_FAILED for result in results):
+        return EXIT_FAILED
+    if any(result["status"] == "partial" for result in results):
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def run_batch(specs: List[Dict[str, str]], args: argparse.Namespace, notion, model_tiers: list, validator) -> List[Dict[str, Any]]:
+    """Runs every job on a JobManager in the current directory and waits for all of them."""
+    os.makedirs("blocks", exist_ok=True)
+    os.makedirs("graphs", exist_ok=True)
+    render = args.render == "svg"
+    job_manager = JobManager(max_concurrent_jobs=args.concurrency, max_finished_jobs=len(specs))
+    business_converter = None
+    if args.convert_business:
+        from business_conversion import BusinessConverter
+        # One converter for every job, so the request rate and the in-flight deduplication are shared.
+        business_converter = BusinessConverter(model_tiers[0]["llm"], max_workers=args.conversion_workers,
+                                               requests_per_minute=args.conversion_rpm)
+    jobs = []
+    try:
+        for spec in specs:
+            run = pipeline_job(
+                notion, model_tiers, TABLE_MAPPING[spec["table"]], force_recreate=args.cache == "refresh",
+                hedge=args.hedge, max_retries=args.max_retries, validator=validator,
+                row_workers=args.row_workers, svg_dir="svgs" if render else None,
+                business_converter=business_converter, chunk_threshold=args.chunk_threshold,
+            )
+            jobs.append(job_manager.submit(spec["page_id"], spec["table"], spec["block_identifier"], run))
+
+        pending = {job.job_id for job in jobs}
+        while pending:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            for job in jobs:
+                if job.job_id in pending and job.status not in ACTIVE_STATUSES:
+                    pending.discard(job.job_id)
+                    logger.info(f"Job {job.job_id} ({job.page_id}) {job.status} after {job.snapshot()['elapsed_seconds']:.1f}s")
+    finally:
+        job_manager.shutdown()
+
+    # The same page/table/identifier listed twice shares one job; report it once.
+    unique_jobs = list({job.job_id: job for job in jobs}.values())
+    return [job_result(job, render) for job in unique_jobs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate flowcharts for Notion pages without the Streamlit app.")
+    parser.add_argument("--job", action="append", default=[], metavar="PAGE_ID:TABLE",
+                        help=f"Page to process and its parameters table, one of {sorted(TABLE_MAPPING)} (repeatable)")
+    parser.add_argument("--jobs-file", help="JSON list of {page_id, table, block_identifier} objects")
+    parser.add_argument("--block-identifier",
+                        help=f"Spec block title prefix (default: {SPEC_BLOCK_IDENTIFIER_DEFAULT!r}, "
+                             "or the business section prefix with --convert-business)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Pages processed at once")
+    parser.add_argument("--row-workers", type=int, default=1, help="Rows generated at once within a page")
+    parser.add_argument("--cache", choices=["reuse", "refresh"], default="reuse",
+                        help="reuse: keep existing block snapshots and graphs (and resume unfinished runs); "
+                             "refresh: crawl and generate everything again")
+    parser.add_argument("--output-dir", default=".", help="Where blocks/, graphs/, svgs/, checkpoints/ and metrics/ live")
+    parser.add_argument("--render", choices=["none", "svg"], default="svg", help="Render every graph to svgs/<page_id>/")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--hedge", action="store_true", help="Enable hedged LLM requests")
+    parser.add_argument("--chunk-threshold", type=int, default=CHUNK_THRESHOLD_CHARS,
+                        help="Generate blocks longer than this many characters in parallel chunks (0 disables chunking)")
+    parser.add_argument("--notion-base-url", help="Notion API base URL (e.g. a notion_stub_server.py instance)")
+    parser.add_argument("--fake-llm", action="store_true", help="Use FakeLatencyChatModel instead of the model cascade")
+    parser.add_argument("--local-validation-only", action="store_true",
+                        help="Validate graphs with the local structural checks instead of mermaid.ink")
+    parser.add_argument("--convert-business", action="store_true",
+                        help="Convert business function sections to technical specs before generating graphs")
+    parser.add_argument("--conversion-workers", type=int, default=4, help="Business sections converted at once")
+    parser.add_argument("--conversion-rpm", type=float, default=60, help="LLM requests per minute for conversion")
+    parser.add_argument("--summary-file", help="Also write the JSON summary to this file")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run to this file")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.block_identifier is None:
+        if args.convert_business:
+            from business_conversion import BUSINESS_FUNCTION_IDENTIFIER
+            args.block_identifier = BUSINESS_FUNCTION_IDENTIFIER
+        else:
+            args.block_identifier = SPEC_BLOCK_IDENTIFIER_DEFAULT
+    specs = parse_job_specs(parser, args)
+    if args.concurrency < 1 or args.row_workers < 1:
+        parser.error("--concurrency and --row-workers must be at least 1")
+    if args.conversion_workers < 1:
+        parser.error("--conversion-workers must be at least 1")
+
+    # Logs go to stderr so stdout stays machine-readable.
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(find_dotenv(usecwd=True), override=False)
+
+    summary_path = os.path.abspath(args.summary_file) if args.summary_file else None
+    trace_path = os.path.abspath(args.trace) if args.trace else None
+    if trace_path:
+        tracing.enable()
+
+    start_time = time.perf_counter()
+    try:
+        notion, model_tiers, validator = build_backends(args)
+    except Exception as e:
+        logger.error(f"Could not set up the run: {str(e)}")
+        print(json.dumps({"exit_status": EXIT_FAILED, "error": str(e), "jobs": []}, indent=2))
+        sys.exit(EXIT_FAILED)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    os.chdir(args.output_dir)
+    try:
+        # notion_utils reports progress with print(); keep stdout for the summary.
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run_batch(specs, args, notion, model_tiers, validator)
+    finally:
+        if trace_path:
+            logger.info(f"Wrote {tracing.export_chrome_trace(trace_path)} trace spans to {trace_path}")
+
+    status = exit_status(results)
+    summary = {
+        "exit_status": status,
+        "output_dir": os.getcwd(),
+        "elapsed_seconds": round(time.perf_counter() - start_time, 3),
+        "jobs": results,
+    }
+    print(json.dumps(summary, indent=2, default=str))
+    if summary_path:
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, default=str)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
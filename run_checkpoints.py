@@ -0,0 +1,102 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DB_PATH = "checkpoints/runs.sqlite"
+
+_savers_lock = threading.Lock()
+_savers = {}
+
+
+def get_checkpointer(db_path: str = CHECKPOINT_DB_PATH) -> SqliteSaver:
+    """
+    LangGraph checkpointer storing every agent step in the local SQLite file.
+    There is one saver (and connection) per database file for the whole process:
+    rows and jobs run on worker threads, and the saver's lock is what keeps their
+    statements and commits - and those of the batch_runs helpers below - from
+    interleaving in the shared connection's transaction.
+    """
+    with _savers_lock:
+        if db_path not in _savers:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS batch_runs (
+                    run_id TEXT PRIMARY KEY,
+                    page_id TEXT NOT NULL,
+                    total_rows INTEGER,
+                    started_at TEXT,
+                    finished_at TEXT
+                )"""
+            )
+            conn.commit()
+            _savers[db_path] = SqliteSaver(conn)
+        return _savers[db_path]
+
+
+def new_run_id(page_id: str) -> str:
+    return f"{page_id}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}"
+
+
+def start_run(page_id: str, total_rows: int, run_id: Optional[str] = None, db_path: str = CHECKPOINT_DB_PATH) -> str:
+    """
+    Registers a batch run (or re-opens an existing one) and returns its run id.
+    Re-opening keeps the original start time so unfinished runs stay discoverable.
+    """
+    run_id = run_id or new_run_id(page_id)
+    saver = get_checkpointer(db_path)
+    with saver.lock:
+        saver.conn.execute(
+            """INSERT INTO batch_runs (run_id, page_id, total_rows, started_at, finished_at)
+               VALUES (?, ?, ?, ?, NULL)
+               ON CONFLICT(run_id) DO UPDATE SET total_rows = excluded.total_rows, finished_at = NULL""",
+            (run_id, page_id, total_rows, datetime.now(timezone.utc).isoformat()),
+        )
+        saver.conn.commit()
+    logger.info(f"Started batch run {run_id} for page {page_id} ({total_rows} rows)")
+    return run_id
+
+
+def finish_run(run_id: str, db_path: str = CHECKPOINT_DB_PATH):
+    saver = get_checkpointer(db_path)
+    with saver.lock:
+        saver.conn.execute(
+            "UPDATE batch_runs SET finished_at = ? WHERE run_id = ?",
+            (datetime.now(timezone.utc).isoformat(), run_id),
+        )
+        saver.conn.commit()
+    logger.info(f"Finished batch run {run_id}")
+
+
+def unfinished_runs(page_id: str, db_path: str = CHECKPOINT_DB_PATH) -> List[str]:
+    """Run ids for a page that were started but never finished, newest first."""
+    saver = get_checkpointer(db_path)
+    with saver.lock:
+        rows = saver.conn.execute(
+            """SELECT run_id FROM batch_runs
+               WHERE page_id = ? AND finished_at IS NULL
+               ORDER BY started_at DESC""",
+            (page_id,),
+        ).fetchall()
+    return [row[0] for row in rows]
+
+
+def row_thread_id(run_id: str, business_logic_text: str, row_key: str = "") -> str:
+    """
+    Checkpoint thread for one row of a run. Rows are keyed by a hash of their
+    logic rather than their position, so an edited block is regenerated on
+    resume instead of reusing the graph of whatever used to sit at that index.
+    `row_key` (e.g. the block name and its occurrence) tells apart rows with the
+    same logic, which would otherwise share - and race on - one thread.
+    """
+    key = f"{row_key}\x00{business_logic_text}" if row_key else business_logic_text
+    logic_hash = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return f"{run_id}:{logic_hash}"
@@ -0,0 +1,301 @@
+"""
+Inverted index over the extracted spec blocks and generated graphs of every
+processed page, kept in graphs/<page_id>_search.json and updated by the
+pipeline whenever a page is extracted or its graphs are generated.
+
+    python search_index.py "var:contractDetails.contractType"
+    python search_index.py "maidHasBed label:pregnancy" --page-id 1ef7432eb8438081be51f2ec9121f6bd
+    python search_index.py --rebuild
+
+Query terms are ANDed. A bare term matches any field; `name:`, `content:`,
+`var:` (a variable compared in a condition, e.g. `var:userRelationship`) and
+`label:` (Mermaid node and edge labels) restrict it to one field. Matching is
+case-insensitive on whole tokens; dotted names also match their parts.
+"""
+import os
+import re
+import glob
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from file_cache import atomic_write_text
+from mermaid_ir import strip_mermaid_fences
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Page indexes live next to the graphs cache, one file per page.
+SEARCH_INDEX_DIR = "graphs"
+SEARCH_INDEX_SUFFIX = "_search.json"
+# Bumped whenever the stored terms change meaning; older page files are ignored until the page is re-indexed.
+SEARCH_INDEX_VERSION = 1
+
+INDEX_FIELDS = ("name", "content", "variable", "label")
+# Union of all fields, for query terms without a field prefix.
+ANY_FIELD = "any"
+QUERY_FIELD_ALIASES = {"name": "name", "content": "content", "var": "variable", "variable": "variable", "label": "label"}
+
+_TOKEN_RE = re.compile(r"[a-z0-9_]+(?:\.[a-z0-9_]+)*")
+# Left-hand side of a comparison: `contractDetails.contractType == CC`, `maidHasBed != true`.
+_CONDITION_RE = re.compile(r"([A-Za-z_][\w.]*)\s*(?:==|!=|<=|>=|<|>)")
+# Mermaid node shapes (`id["label"]`, `id{"label"}`, `id(["label"])`) and edge labels (`-->|label|`).
+_NODE_LABEL_RE = re.compile(r"[\[({]+\"?([^\"\[\](){}|]+?)\"?[\])}]+")
+_EDGE_LABEL_RE = re.compile(r"\|([^|]+)\|")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased tokens of `text`; a dotted name yields itself and each of its parts."""
+    tokens = []
+    for token in _TOKEN_RE.findall(str(text).lower()):
+        tokens.append(token)
+        if "." in token:
+            tokens.extend(part for part in token.split(".") if part)
+    return tokens
+
+
+def condition_variables(block_content: str) -> List[str]:
+    return [variable.lower().rstrip(".") for variable in _CONDITION_RE.findall(str(block_content))]
+
+
+def mermaid_labels(mermaid_graph: str) -> List[str]:
+    code = strip_mermaid_fences(mermaid_graph)
+    return _NODE_LABEL_RE.findall(code) + _EDGE_LABEL_RE.findall(code)
+
+
+def _block_terms(block_name: str, block_content: str, mermaid_graph: Optional[str]) -> Dict[str, List[str]]:
+    terms = {
+        "name": tokenize(block_name),
+        "content": tokenize(block_content),
+        "variable": condition_variables(block_content),
+        "label": [token for label in mermaid_labels(mermaid_graph) for token in tokenize(label)] if mermaid_graph else [],
+    }
+    return {field: sorted(set(values)) for field, values in terms.items()}
+
+
+def _page_digest(df: pd.DataFrame) -> str:
+    columns = [column for column in ("block_name", "block_content", "mermaid_graph") if column in df]
+    return hashlib.sha256(df[columns].to_csv(index=False).encode("utf-8")).hexdigest()
+
+
+class SearchIndex:
+    """
+    Field -> term -> page -> rows postings, kept in memory for lookups. Each
+    page is persisted as its own `<directory>/<page_id>_search.json`, so
+    update_page() rewrites only the page that changed (and nothing at all when
+    its rows are unchanged). Safe to share across threads.
+    """
+
+    def __init__(self, directory: str = SEARCH_INDEX_DIR):
+        self.directory = directory
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, Dict[str, Set[int]]]] = {
+            field: defaultdict(dict) for field in INDEX_FIELDS + (ANY_FIELD,)
+        }
+        self._lock = threading.RLock()
+        self.load()
+
+    def _page_path(self, page_id: str) -> str:
+        return os.path.join(self.directory, f"{page_id}{SEARCH_INDEX_SUFFIX}")
+
+    def load(self):
+        loaded = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, f"*{SEARCH_INDEX_SUFFIX}"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    page = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read search index file {path}, skipping it: {str(e)}")
+                continue
+            if page.get("version") != SEARCH_INDEX_VERSION:
+                logger.info(f"Search index file {path} has version {page.get('version')}, ignoring it until the page is re-indexed")
+                continue
+            with self._lock:
+                self._add_page(page)
+            loaded += 1
+        if loaded:
+            logger.info(f"Loaded search index for {loaded} pages from {self.directory}")
+
+    def _add_page(self, page: Dict[str, Any]):
+        page_id = page["page_id"]
+        self._pages[page_id] = page
+        any_postings = self._postings[ANY_FIELD]
+        for field in INDEX_FIELDS:
+            postings = self._postings[field]
+            for term, rows in page["postings"][field].items():
+                postings[term][page_id] = set(rows)
+                any_postings[term].setdefault(page_id, set()).update(rows)
+
+    def _remove_page(self, page_id: str):
+        page = self._pages.pop(page_id, None)
+        if page is None:
+            return
+        for field in INDEX_FIELDS:
+            for term in page["postings"][field]:
+                for postings in (self._postings[field], self._postings[ANY_FIELD]):
+                    term_postings = postings.get(term)
+                    if term_postings is not None:
+                        term_postings.pop(page_id, None)
+                        if not term_postings:
+                            del postings[term]
+
+    def update_page(self, page_id: str, df: pd.DataFrame) -> bool:
+        """
+        Indexes the block_name / block_content (and mermaid_graph, when present) rows of `df` for `page_id`.
+        Without a mermaid_graph column, blocks whose name and content are unchanged keep their indexed labels.
+        Returns False when the page was already indexed with the same rows.
+        """
+        digest = _page_digest(df)
+        with self._lock:
+            previous = self._pages.get(page_id)
+            if previous is not None and previous["digest"] == digest:
+                return False
+
+            previous_labels = defaultdict(list)
+            if previous is not None and "mermaid_graph" not in df:
+                for term, rows in previous["postings"]["label"].items():
+                    for row in rows:
+                        block = previous["blocks"][row]
+                        previous_labels[(block["block_name"], block["content_digest"])].append(term)
+
+            blocks = []
+            page_postings = {field: defaultdict(list) for field in INDEX_FIELDS}
+            for row, block in enumerate(df.itertuples(index=False)):
+                block_name = str(block.block_name)
+                block_content = "" if pd.isna(block.block_content) else str(block.block_content)
+                mermaid_graph = getattr(block, "mermaid_graph", None)
+                terms = _block_terms(block_name, block_content, mermaid_graph if isinstance(mermaid_graph, str) else None)
+                content_digest = hashlib.sha256(block_content.encode("utf-8")).hexdigest()[:16]
+                if (block_name, content_digest) in previous_labels:
+                    terms["label"] = previous_labels[(block_name, content_digest)]
+                blocks.append({"block_name": block_name, "content_digest": content_digest})
+                for field in INDEX_FIELDS:
+                    for term in terms[field]:
+                        page_postings[field][term].append(row)
+
+            page = {"version": SEARCH_INDEX_VERSION, "page_id": page_id, "digest": digest, "blocks": blocks,
+                    "postings": {field: dict(page_postings[field]) for field in INDEX_FIELDS}}
+            self._remove_page(page_id)
+            self._add_page(page)
+            atomic_write_text(self._page_path(page_id), json.dumps(page, ensure_ascii=False))
+        logger.info(f"Indexed {len(blocks)} blocks of page {page_id}")
+        return True
+
+    def remove_page(self, page_id: str):
+        with self._lock:
+            self._remove_page(page_id)
+            if os.path.exists(self._page_path(page_id)):
+                os.unlink(self._page_path(page_id))
+
+    def search(self, query: str, page_id: str = None, limit: int = None) -> List[Dict[str, Any]]:
+        """Blocks matching every term of `query` (see the module docstring), ordered by page and row."""
+        required: List[Tuple[str, str]] = []
+        for raw_term in query.split():
+            prefix, _, value = raw_term.partition(":")
+            field = QUERY_FIELD_ALIASES.get(prefix.lower()) if value else None
+            if field is None:
+                field, value = ANY_FIELD, raw_term
+            if field == "variable":
+                required.append((field, value.lower()))
+            else:
+                required.extend((field, token) for token in _TOKEN_RE.findall(value.lower()))
+        if not required:
+            return []
+
+        hits = []
+        with self._lock:
+            term_postings = [self._postings[field].get(term, {}) for field, term in required]
+            # Walk the pages of the rarest term in order, so a limited search stops early.
+            term_postings.sort(key=len)
+            pages = [page_id] if page_id is not None else sorted(term_postings[0])
+            for hit_page_id in pages:
+                row_sets = [postings.get(hit_page_id) for postings in term_postings]
+                if not all(row_sets):
+                    continue
+                row_sets.sort(key=len)
+                rows = row_sets[0].intersection(*row_sets[1:]) if len(row_sets) > 1 else row_sets[0]
+                blocks = self._pages[hit_page_id]["blocks"]
+                for row in sorted(rows):
+                    hits.append({"page_id": hit_page_id, "row": row, "block_name": blocks[row]["block_name"]})
+                    if limit and len(hits) >= limit:
+                        return hits
+        return hits
+
+    def pages(self) -> List[str]:
+        with self._lock:
+            return sorted(self._pages)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {"pages": len(self._pages), "blocks": sum(len(page["blocks"]) for page in self._pages.values())}
+            stats.update({f"{field}_terms": len(self._postings[field]) for field in INDEX_FIELDS})
+            return stats
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    """Process-wide index loaded from SEARCH_INDEX_DIR on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
+
+
+def rebuild(index: SearchIndex, graph_paths: Iterable[str], spec_paths: Iterable[str]) -> int:
+    """Indexes every graphs CSV, then the spec CSVs of pages without graphs. Returns the number of pages indexed."""
+    indexed = set()
+    for paths, suffix in ((graph_paths, "_graphs.csv"), (spec_paths, "_spec_block_contents.csv")):
+        for path in paths:
+            page_id = os.path.basename(path)[:-len(suffix)]
+            if page_id in indexed:
+                continue
+            index.update_page(page_id, pd.read_csv(path))
+            indexed.add(page_id)
+    return len(indexed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the extracted spec blocks and graphs of all processed pages.")
+    parser.add_argument("query", nargs="?", help="Terms to match, e.g. 'var:contractDetails.contractType label:cc'")
+    parser.add_argument("--page-id", help="Only return blocks of this page")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--index-dir", default=SEARCH_INDEX_DIR, help="Directory holding the graphs and page indexes")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Re-index graphs/*_graphs.csv and *_spec_block_contents.csv before searching")
+    parser.add_argument("--json", action="store_true", help="Print the hits as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    index = SearchIndex(args.index_dir)
+    if args.rebuild:
+        graph_paths = sorted(glob.glob(os.path.join(args.index_dir, "*_graphs.csv")))
+        pages = rebuild(index, graph_paths, sorted(glob.glob("*_spec_block_contents.csv")))
+        print(f"Indexed {pages} pages: {index.stats()}")
+    if not args.query:
+        if not args.rebuild:
+            print(json.dumps(index.stats(), indent=2))
+        return
+
+    start_time = time.perf_counter()
+    hits = index.search(args.query, page_id=args.page_id, limit=args.limit)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    if args.json:
+        print(json.dumps(hits, indent=2, ensure_ascii=False))
+        return
+    for hit in hits:
+        print(f"{hit['page_id']}  row {hit['row']:>4}  {hit['block_name']}")
+    print(f"{len(hits)} match(es) in {elapsed_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Offline tests: the fake chat models stand in for the LLMs and
+notion_stub_server for Notion, so no credentials or network are needed.
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import run_checkpoints
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs the test from an empty directory: the pipeline's graphs/, metrics/ and
+    checkpoints/ caches are relative paths. Checkpoint connections are keyed by
+    those paths, so each test starts with none open.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(run_checkpoints, "_savers", {})
+    return tmp_path
@@ -0,0 +1,49 @@
+from business_conversion import parse_technical_sections
+
+CONVERTED = """Here is the technical spec.
+
+- 💡TECHNICAL_FUNCTION_VALUE: User Relationship
+
+Parameter
+
+| Parameter Name | User Relationship |
+| --- | --- |
+| Parameter Link | http://example.com/link |
+
+Prompts
+
+    - if [User_Relationship] == "Employer":
+        # applies to active contracts
+        - Delighters.
+    - else:
+        - CC Resolvers.
+
+API: /api/params/userRelationship
+
+- 💡 TECHNICAL_FUNCTION_VALUE: Order Status
+```
+- if [OrderStatus] == "Open":
+    - [value]
+```
+"""
+
+
+def test_sections_are_split_by_heading():
+    assert [name for name, _ in parse_technical_sections(CONVERTED)] == ["User Relationship", "Order Status"]
+
+
+def test_logic_keeps_conditions_and_drops_tables_labels_and_fences():
+    (_, logic), (_, second_logic) = parse_technical_sections(CONVERTED)
+
+    assert logic.splitlines() == [
+        '\t- if [User_Relationship] == "Employer":',
+        "\t    # applies to active contracts",
+        "\t    - Delighters.",
+        "\t- else:",
+        "\t    - CC Resolvers.",
+    ]
+    assert second_logic.splitlines() == ['\t- if [OrderStatus] == "Open":', "\t    - [value]"]
+
+
+def test_text_without_headings_has_no_sections():
+    assert parse_technical_sections("The model answered without a spec.") == []
@@ -0,0 +1,49 @@
+from fake_llm import FakeCachingChatModel, DEFAULT_MERMAID_RESPONSE, INVALID_MERMAID_RESPONSE
+from b2m_agent import build_mermaid_agent, run_agent, CascadeStats
+
+LOGIC = 'if client_type == "A":\n\treturn [value]'
+
+
+def accept_all(mermaid_code: str) -> str:
+    return "Graph is valid"
+
+
+def tiers(cheap_responses):
+    return [
+        {"name": "cheap", "llm": FakeCachingChatModel(responses=cheap_responses), "max_retries": 2},
+        {"name": "strong", "llm": FakeCachingChatModel(responses=[DEFAULT_MERMAID_RESPONSE]), "max_retries": 2},
+    ]
+
+
+def test_valid_cheap_answer_is_not_escalated():
+    model_tiers = tiers([DEFAULT_MERMAID_RESPONSE])
+    stats = CascadeStats()
+    graph = run_agent(build_mermaid_agent(), model_tiers, LOGIC, cascade_stats=stats, validator=accept_all)
+
+    assert graph == DEFAULT_MERMAID_RESPONSE
+    assert model_tiers[1]["llm"].call_count == 0
+    assert list(stats.summary()["tiers"]) == ["cheap"]
+
+
+def test_row_escalates_after_cheap_tier_exhausts_its_retries():
+    model_tiers = tiers([INVALID_MERMAID_RESPONSE])
+    stats = CascadeStats()
+    graph = run_agent(build_mermaid_agent(), model_tiers, LOGIC, cascade_stats=stats, validator=accept_all)
+
+    assert graph == DEFAULT_MERMAID_RESPONSE
+    assert model_tiers[0]["llm"].call_count == 2
+    assert model_tiers[1]["llm"].call_count == 1
+    summary = stats.summary()
+    assert summary["tiers"]["cheap"]["successes"] == 0
+    assert summary["tiers"]["cheap"]["llm_calls"] == 2
+    assert summary["tiers"]["strong"]["successes"] == 1
+    assert (summary["rows"], summary["rows_succeeded"]) == (1, 1)
+
+
+def test_row_fails_when_every_tier_fails():
+    model_tiers = tiers([INVALID_MERMAID_RESPONSE])
+    model_tiers[1]["llm"] = FakeCachingChatModel(responses=[INVALID_MERMAID_RESPONSE])
+    stats = CascadeStats()
+
+    assert run_agent(build_mermaid_agent(), model_tiers, LOGIC, cascade_stats=stats, validator=accept_all) is None
+    assert (stats.summary()["rows"], stats.summary()["rows_succeeded"]) == (1, 0)
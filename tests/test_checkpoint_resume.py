@@ -0,0 +1,64 @@
+from typing import List
+
+import pandas as pd
+import pytest
+
+from fake_llm import FakeCachingChatModel, FakeLLMError
+from pipeline import process_dataframe_with_mermaid_agent
+from run_checkpoints import unfinished_runs
+
+PAGE_ID = "0123456789abcdef0123456789abcdef"
+
+
+class FlakyChatModel(FakeCachingChatModel):
+    """FakeCachingChatModel that raises FakeLLMError on the calls numbered in `fail_on_calls`."""
+
+    fail_on_calls: List[int] = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.call_count in self.fail_on_calls:
+            self.call_count += 1
+            raise FakeLLMError("Simulated provider error")
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def accept_all(mermaid_code: str) -> str:
+    return "Graph is valid"
+
+
+def spec_df() -> pd.DataFrame:
+    return pd.DataFrame({
+        "block_name": ["first", "second", "third"],
+        "original_logic": [f'if step == "{name}":\n\treturn [value]' for name in ("one", "two", "three")],
+    })
+
+
+def test_interrupted_run_resumes_only_unfinished_rows(workdir):
+    first_state = {}
+    with pytest.raises(RuntimeError, match="left unfinished"):
+        process_dataframe_with_mermaid_agent(PAGE_ID, spec_df(), FlakyChatModel(fail_on_calls=[2]), max_retries=1,
+                                             run_state=first_state, validator=accept_all)
+    run_id = first_state["run_id"]
+    assert unfinished_runs(PAGE_ID) == [run_id]
+
+    llm = FakeCachingChatModel()
+    second_state = {}
+    result_df = process_dataframe_with_mermaid_agent(PAGE_ID, spec_df(), llm, max_retries=1,
+                                                     run_state=second_state, validator=accept_all)
+
+    assert second_state["run_id"] == run_id
+    assert llm.call_count == 1
+    assert result_df["mermaid_graph"].notna().all()
+    assert unfinished_runs(PAGE_ID) == []
+    assert (workdir / "graphs" / f"{PAGE_ID}_graphs.csv").exists()
+
+
+def test_rows_with_identical_logic_get_their_own_checkpoints(workdir):
+    df = spec_df()
+    df["original_logic"] = df["original_logic"].iloc[0]
+    llm = FakeCachingChatModel()
+
+    result_df = process_dataframe_with_mermaid_agent(PAGE_ID, df, llm, max_retries=1, validator=accept_all)
+
+    assert llm.call_count == len(df)
+    assert result_df["mermaid_graph"].notna().all()
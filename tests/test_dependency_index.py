@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from dependency_index import DependencyIndex, parameter_digests
+from fake_llm import FakeCachingChatModel
+from pipeline import process_dataframe_with_mermaid_agent
+
+PAGE_ID = "0123456789abcdef0123456789abcdef"
+TABLE_ID = "fedcba9876543210fedcba9876543210"
+CONTRACT, NATIONALITY = "1f67432eb8438032b350f09ae8ea3965", "1f67432eb8438032b350f09ae8ea3966"
+BLOCKS = {"Contract check": [CONTRACT], "Nationality check": [NATIONALITY], "Both": [CONTRACT, NATIONALITY]}
+
+
+def accept_all(mermaid_code: str) -> str:
+    return "Graph is valid"
+
+
+def param(name: str, description: str = "") -> dict:
+    return {"API Parameter Name": name, "Name": name.title(), "Business Description": description}
+
+
+@pytest.fixture
+def params():
+    return {CONTRACT: param("contractType"), NATIONALITY: param("nationality")}
+
+
+@pytest.fixture
+def index(tmp_path, params):
+    index = DependencyIndex(str(tmp_path))
+    index.update_page(PAGE_ID, TABLE_ID, "spec", BLOCKS, parameter_digests(params, [CONTRACT, NATIONALITY]))
+    return index
+
+
+def test_unchanged_parameters_leave_no_stale_blocks(index, params):
+    assert index.stale_blocks(PAGE_ID, TABLE_ID, params) == []
+
+
+def test_renamed_parameter_makes_its_blocks_stale(index, params):
+    params[CONTRACT] = param("contractKind")
+    assert index.stale_blocks(PAGE_ID, TABLE_ID, params) == ["Both", "Contract check"]
+    assert index.changed_parameters(TABLE_ID, params) == [CONTRACT]
+
+
+def test_removed_parameter_makes_its_blocks_stale(index, params):
+    del params[NATIONALITY]
+    assert index.stale_blocks(PAGE_ID, TABLE_ID, params) == ["Both", "Nationality check"]
+
+
+def test_description_edit_is_not_a_change(index, params):
+    params[CONTRACT] = param("contractType", description="Reworded description")
+    assert index.stale_blocks(PAGE_ID, TABLE_ID, params) == []
+
+
+def test_other_table_or_unknown_page_has_no_stale_blocks(index, params):
+    params[CONTRACT] = param("contractKind")
+    assert index.stale_blocks(PAGE_ID, "another-table", params) == []
+    assert index.stale_blocks("unknown-page", TABLE_ID, params) == []
+
+
+def test_index_is_reloaded_from_disk(tmp_path, index, params):
+    reloaded = DependencyIndex(str(tmp_path))
+    params[NATIONALITY] = param("citizenship")
+
+    assert reloaded.dependents([CONTRACT]) == {PAGE_ID: ["Both", "Contract check"]}
+    assert reloaded.stale_blocks(PAGE_ID, TABLE_ID, params) == ["Both", "Nationality check"]
+
+
+def test_pipeline_regenerates_only_stale_blocks(workdir):
+    df = pd.DataFrame({"block_name": list(BLOCKS), "original_logic": [f"if {name}:\n\treturn [value]" for name in BLOCKS]})
+    process_dataframe_with_mermaid_agent(PAGE_ID, df, FakeCachingChatModel(), max_retries=1, validator=accept_all)
+
+    llm = FakeCachingChatModel()
+    result_df = process_dataframe_with_mermaid_agent(PAGE_ID, df, llm, max_retries=1, validator=accept_all,
+                                                     run_state={"stale_blocks": ["Both"]})
+
+    assert llm.call_count == 1
+    assert result_df["mermaid_graph"].notna().all()
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from hedging import HedgedInvoker
+
+FAST_SECONDS = 0.01
+SLOW_SECONDS = 0.3
+
+
+class ScriptedModel:
+    """Async stand-in for a chat model: the calls numbered in `slow_calls` take SLOW_SECONDS, the others FAST_SECONDS."""
+
+    model = "scripted"
+
+    def __init__(self, slow_calls=()):
+        self.slow_calls = set(slow_calls)
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        call = self.calls
+        self.calls += 1
+        await asyncio.sleep(SLOW_SECONDS if call in self.slow_calls else FAST_SECONDS)
+        return f"response {call}"
+
+
+@pytest.fixture
+def hedger():
+    invoker = HedgedInvoker(percentile=90, min_samples=5, budget_fraction=0.2)
+    yield invoker
+    invoker.close()
+
+
+def test_no_hedging_before_min_samples(hedger):
+    llm = ScriptedModel()
+    for _ in range(4):
+        hedger.invoke(llm, [])
+    assert hedger.hedge_delay(llm) is None
+    assert hedger.summary()["hedges_launched"] == 0
+
+
+def test_slow_call_is_hedged_within_budget(hedger):
+    # Calls 0-4 build the history; call 5 is a slow primary whose hedge is call 6,
+    # call 7 is another slow primary that the 20% budget no longer allows to hedge.
+    llm = ScriptedModel(slow_calls={5, 7})
+    for _ in range(5):
+        hedger.invoke(llm, [])
+
+    assert hedger.invoke(llm, []) == "response 6"
+    assert hedger.invoke(llm, []) == "response 7"
+
+    summary = hedger.summary()
+    assert summary["calls"] == 7
+    assert (summary["hedges_launched"], summary["hedge_wins"], summary["hedges_over_budget"]) == (1, 1, 1)
+    assert summary["hedges_launched"] <= summary["budget_fraction"] * summary["calls"]
+
+
+def test_max_hedges_caps_hedges(hedger):
+    hedger.max_hedges = 0
+    llm = ScriptedModel(slow_calls={5})
+    for _ in range(6):
+        hedger.invoke(llm, [])
+    assert hedger.summary()["hedges_launched"] == 0
+    assert hedger.summary()["hedges_over_budget"] == 1
+
+
+def test_losing_primary_keeps_a_latency_sample(hedger):
+    llm = ScriptedModel(slow_calls={5})
+    for _ in range(5):
+        hedger.invoke(llm, [])
+    delay = hedger.hedge_delay(llm)
+
+    hedger.invoke(llm, [])
+
+    recent = hedger._recent("scripted")
+    assert len(recent) == 6
+    assert recent[-1] >= delay
@@ -0,0 +1,55 @@
+from mermaid_ir import parse_mermaid, diff_graphs, load_graph, graph_ir_json
+
+GRAPH = """```mermaid
+flowchart TD
+    start["Start"] --> check{"client_type?"}
+    check -->|A| valueA["[value A]"]
+    check -->|B| valueB["[value B]"]
+```"""
+
+
+def test_renamed_ids_are_not_a_structural_change():
+    renamed = """flowchart TD
+        s["Start"] --> c{"client_type?"}
+        c -->|A| a["[value A]"]
+        c -->|B| b["[value B]"]"""
+    assert not diff_graphs(parse_mermaid(GRAPH), parse_mermaid(renamed))["changed"]
+
+
+def test_fences_whitespace_and_comments_keep_the_fingerprint():
+    reformatted = "%% generated\n" + GRAPH.strip("`").replace("mermaid\n", "", 1).replace(" --> ", "  -->  ")
+    graph = parse_mermaid(reformatted)
+    assert (graph.node_count, graph.edge_count) == (4, 3)
+    assert graph.fingerprint() == parse_mermaid(GRAPH).fingerprint()
+
+
+def test_changed_branch_is_reported_per_decision():
+    changed = GRAPH.replace('check -->|B| valueB["[value B]"]', 'check -->|B| valueA')
+    diff = diff_graphs(parse_mermaid(GRAPH), parse_mermaid(changed))
+
+    assert diff["changed"]
+    assert diff["removed_nodes"] == [("rect", "[value B]")]
+    assert [decision["decision"] for decision in diff["changed_decisions"]] == ["client_type?"]
+    assert diff["added_decisions"] == diff["removed_decisions"] == []
+
+
+def test_added_decision():
+    extended = GRAPH.replace('check -->|B| valueB["[value B]"]',
+                             'check -->|B| nested{"visa_status?"}\n    nested -->|valid| valueB["[value B]"]')
+    diff = diff_graphs(parse_mermaid(GRAPH), parse_mermaid(extended))
+
+    assert diff["added_decisions"] == ["visa_status?"]
+    assert diff["added_nodes"] == [("rhombus", "visa_status?")]
+
+
+def test_diff_against_missing_graph():
+    diff = diff_graphs(None, parse_mermaid(GRAPH))
+    assert diff["changed"]
+    assert len(diff["added_nodes"]) == 4
+
+
+def test_ir_round_trips_through_json():
+    graph = parse_mermaid(GRAPH)
+    loaded = load_graph(GRAPH, graph_ir_json(GRAPH))
+    assert loaded.fingerprint() == graph.fingerprint()
+    assert not diff_graphs(graph, loaded)["changed"]
@@ -0,0 +1,76 @@
+import uuid
+
+import pytest
+from notion_client import Client as NotionClient, APIResponseError
+
+import notion_utils
+from notion_stub_server import NotionWorkspace, StubBehaviour, start_server, DEFAULT_PAGE_SIZE
+from notion_utils import _list_all_children, extract_table_data
+
+PAGE_ID = "0123456789abcdef0123456789abcdef"
+DATABASE_ID = "fedcba9876543210fedcba9876543210"
+CHILDREN = 2 * DEFAULT_PAGE_SIZE + 50
+DATABASE_ROWS = DEFAULT_PAGE_SIZE + 30
+
+
+def paragraph(text: str) -> dict:
+    return {"object": "block", "id": str(uuid.uuid4()), "type": "paragraph", "has_children": False,
+            "paragraph": {"rich_text": [{"type": "text", "text": {"content": text}, "plain_text": text}]}}
+
+
+@pytest.fixture
+def workspace():
+    workspace = NotionWorkspace()
+    workspace.add_page(PAGE_ID)
+    for index in range(CHILDREN):
+        workspace.add_block(paragraph(f"Paragraph {index}"), PAGE_ID)
+    workspace.generate_database(DATABASE_ID, DATABASE_ROWS)
+    return workspace
+
+
+@pytest.fixture
+def serve(workspace):
+    """Starts the stub with the given StubBehaviour; returns a Notion client and the behaviour."""
+    servers = []
+
+    def serve(behaviour: StubBehaviour):
+        server = start_server(workspace, behaviour)
+        servers.append(server)
+        return NotionClient(auth="stub", base_url=f"http://127.0.0.1:{server.server_port}"), behaviour
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_children_are_fetched_across_pages(serve):
+    notion, behaviour = serve(StubBehaviour())
+    children = _list_all_children(notion, PAGE_ID)
+
+    assert [child["paragraph"]["rich_text"][0]["plain_text"] for child in children] == [f"Paragraph {index}" for index in range(CHILDREN)]
+    assert behaviour.stats["requests"] == 3
+
+
+def test_database_rows_are_fetched_across_pages(serve):
+    notion, behaviour = serve(StubBehaviour())
+    rows = extract_table_data(DATABASE_ID, notion)
+
+    assert len(rows) == DATABASE_ROWS
+    assert behaviour.stats["requests"] == 2
+
+
+def test_rate_limited_requests_are_retried(serve):
+    notion, behaviour = serve(StubBehaviour(rate_limit_probability=0.5, retry_after_seconds=0, seed=7))
+    children = _list_all_children(notion, PAGE_ID)
+
+    assert len(children) == CHILDREN
+    assert behaviour.stats["rate_limited"] > 0
+    assert behaviour.stats["requests"] == 3 + behaviour.stats["rate_limited"]
+
+
+def test_rate_limit_gives_up_after_max_retries(serve):
+    notion, behaviour = serve(StubBehaviour(rate_limit_probability=1.0, retry_after_seconds=0))
+    with pytest.raises(APIResponseError):
+        _list_all_children(notion, PAGE_ID)
+    assert behaviour.stats["requests"] == notion_utils.MAX_RATE_LIMIT_RETRIES + 1
@@ -0,0 +1,36 @@
+import pytest
+
+from fake_llm import FakeCachingChatModel, ANTHROPIC_MIN_CACHEABLE_TOKENS, _estimate_tokens
+from b2m_agent import MERMAID_SYSTEM_PROMPT, build_mermaid_messages, extract_usage, estimate_cost
+
+
+def test_system_prefix_is_long_enough_to_be_cached():
+    assert _estimate_tokens(MERMAID_SYSTEM_PROMPT) >= ANTHROPIC_MIN_CACHEABLE_TOKENS
+
+
+def test_prefix_is_written_once_then_read():
+    llm = FakeCachingChatModel()
+    first = extract_usage(llm.invoke(build_mermaid_messages(llm, "if a == 1:\n\treturn [value]")))
+    second = extract_usage(llm.invoke(build_mermaid_messages(llm, "if b == 2:\n\treturn [value]")))
+
+    prefix_tokens = _estimate_tokens(MERMAID_SYSTEM_PROMPT)
+    assert (first["cache_creation_tokens"], first["cache_read_tokens"]) == (prefix_tokens, 0)
+    assert (second["cache_creation_tokens"], second["cache_read_tokens"]) == (0, prefix_tokens)
+    assert second["input_tokens"] > prefix_tokens
+
+
+def test_prefix_below_minimum_is_billed_as_input():
+    llm = FakeCachingChatModel(min_cacheable_tokens=_estimate_tokens(MERMAID_SYSTEM_PROMPT) + 1)
+    for _ in range(2):
+        usage = extract_usage(llm.invoke(build_mermaid_messages(llm, "if a == 1:\n\treturn [value]")))
+        assert usage["cache_creation_tokens"] == usage["cache_read_tokens"] == 0
+        assert usage["input_tokens"] > _estimate_tokens(MERMAID_SYSTEM_PROMPT)
+
+
+def test_cache_reads_cost_less_than_writes():
+    tier = {"input_cost_per_mtok": 3.0, "output_cost_per_mtok": 15.0}
+    write = estimate_cost({"input_tokens": 1000, "cache_creation_tokens": 1000}, tier)
+    read = estimate_cost({"input_tokens": 1000, "cache_read_tokens": 1000}, tier)
+    uncached = estimate_cost({"input_tokens": 1000}, tier)
+    assert read < uncached < write
+    assert read == pytest.approx(uncached * 0.1)
@@ -0,0 +1,246 @@
+"""
+Lightweight tracing spans exported in the Chrome trace_event format
+(open the file in https://ui.perfetto.dev or chrome://tracing).
+
+    import tracing
+    tracing.enable()
+    with tracing.span("notion.blocks.children.list", block_id=block_id) as s:
+        ...
+        s.set(results=len(results))
+    tracing.export_chrome_trace("trace.json")
+
+Setting the TRACE_FILE environment variable and calling enable_from_env()
+does the same for a whole process. While tracing is disabled, span() returns
+a shared no-op object, so instrumented code pays one global check per span.
+
+The current span lives in a ContextVar, so nesting follows asyncio tasks
+automatically. Work handed to other threads keeps its parent when wrapped
+with propagate(); cross-thread parent links are drawn as flow arrows.
+"""
+import os
+import json
+import time
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Optional
+
+TRACE_FILE_ENV = "TRACE_FILE"
+# Events kept in memory; past this, the oldest are dropped so a long-running process stays bounded.
+MAX_TRACE_EVENTS = 200_000
+
+_enabled = False
+_lock = threading.Lock()
+_events: Deque[Dict[str, Any]] = deque(maxlen=MAX_TRACE_EVENTS)
+_thread_names: Dict[int, str] = {}
+_next_span_id = 0
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000
+
+
+class Span:
+    """One timed operation; becomes a complete ("X") trace event when it ends."""
+
+    __slots__ = ("name", "attributes", "span_id", "parent", "thread_id", "start_us", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        global _next_span_id
+        self.name = name
+        self.attributes = attributes
+        with _lock:
+            _next_span_id += 1
+            self.span_id = _next_span_id
+        self.parent: Optional[Span] = None
+        self.thread_id = 0
+        self.start_us = 0.0
+        self._token = None
+
+    def set(self, **attributes: Any) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self) -> "Span":
+        self.parent = _current_span.get()
+        self.thread_id = threading.get_ident()
+        self.start_us = _now_us()
+        self._token = _current_span.set(self)
+        if self.parent is not None and self.parent.thread_id != self.thread_id:
+            _record_flow(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        end_us = _now_us()
+        _current_span.reset(self._token)
+        args = {key: _jsonable(value) for key, value in self.attributes.items()}
+        args["span_id"] = self.span_id
+        if self.parent is not None:
+            args["parent_id"] = self.parent.span_id
+        if exc_type is not None:
+            args["error"] = f"{exc_type.__name__}: {exc}"
+        _record({
+            "name": self.name, "cat": self.name.split(".", 1)[0], "ph": "X",
+            "ts": self.start_us, "dur": end_us - self.start_us,
+            "pid": os.getpid(), "tid": self.thread_id, "args": args,
+        })
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes: Any) -> "_NoopSpan":
+        return self
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _jsonable(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def _record(event: Dict[str, Any]):
+    with _lock:
+        _events.append(event)
+        if event["tid"] not in _thread_names:
+            _thread_names[event["tid"]] = threading.current_thread().name
+
+
+def _record_flow(span: Span):
+    # "s" binds to the parent's open slice, "f" to the child's slice on this thread.
+    common = {"name": "propagate", "cat": "flow", "id": span.span_id, "pid": os.getpid(), "ts": span.start_us}
+    with _lock:
+        _events.append({**common, "ph": "s", "tid": span.parent.thread_id})
+        _events.append({**common, "ph": "f", "bp": "e", "tid": span.thread_id})
+
+
+def span(name: str, **attributes: Any):
+    """Context manager timing the enclosed block; a no-op while tracing is disabled."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def traced(name: str):
+    """Decorator wrapping every call of the function in span(name)."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The innermost open span in this context (a no-op span when there is none)."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+@contextmanager
+def use_parent(parent: Any):
+    """Makes `parent` (from current_span() on another thread) the parent of spans opened inside."""
+    if not isinstance(parent, Span):
+        yield
+        return
+    token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wraps `fn` so that, when run on another thread, its spans nest under the caller's current span."""
+    if not _enabled:
+        return fn
+    parent = _current_span.get()
+
+    def run_with_parent(*args, **kwargs):
+        with use_parent(parent):
+            return fn(*args, **kwargs)
+    return run_with_parent
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable_from_env() -> Optional[str]:
+    """Enables tracing when TRACE_FILE is set and returns that path."""
+    trace_file = os.environ.get(TRACE_FILE_ENV)
+    if trace_file:
+        enable()
+    return trace_file
+
+
+def reset():
+    with _lock:
+        _events.clear()
+
+
+def _subtree_events(events: Deque[Dict[str, Any]], root_span_id: int) -> list:
+    """The events of span `root_span_id`, of its descendants and of the flow arrows between them."""
+    parents = {event["args"]["span_id"]: event["args"].get("parent_id") for event in events if event["ph"] == "X"}
+    in_subtree = {root_span_id: True}
+
+    def belongs(span_id: Optional[int]) -> bool:
+        chain = []
+        while span_id is not None and span_id not in in_subtree:
+            chain.append(span_id)
+            span_id = parents.get(span_id)
+        result = span_id is not None and in_subtree[span_id]
+        in_subtree.update((chained, result) for chained in chain)
+        return result
+
+    return [event for event in events
+            if belongs(event["args"]["span_id"] if event["ph"] == "X" else event["id"])]
+
+
+def export_chrome_trace(path: str, clear: bool = False, root_span_id: int = None) -> int:
+    """
+    Writes the recorded spans as Chrome trace_event JSON and returns the number of spans.
+    With `root_span_id`, only that span and its descendants are written. With `clear`,
+    the written events are removed from memory.
+    """
+    with _lock:
+        events = list(_events) if root_span_id is None else _subtree_events(_events, root_span_id)
+        thread_names = dict(_thread_names)
+        if clear and root_span_id is None:
+            _events.clear()
+        elif clear:
+            written = set(map(id, events))
+            remaining = [event for event in _events if id(event) not in written]
+            _events.clear()
+            _events.extend(remaining)
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+        for tid, name in thread_names.items()
+    ]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+    return sum(1 for event in events if event["ph"] == "X")